@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of utils.weather_road_conditions (pivot of the condition sensors) against
+the previous implementation (get_group loop per weather station), the two results must be identical.
+
+Usage:
+python benchmarks/bench_conditions.py [--weather 480] [--seeds 5]
+"""
+# Import libraries
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils import sensors_values, weather_road_conditions
+from fixtures import weather_data
+
+
+def loop_weather_road_conditions(data_weather, weatherdf):
+    """
+    Previous implementation: one get_group and repeated boolean filters per weather station
+    """
+    def find_condi(df, sensor1, sensor2):
+        if sensor1 in sensors and sensor2 in sensors:
+            condi1 = (df[df['oldName'] == sensor1]['sensorValueDescriptionEn']).tolist()[0]
+            condi2 = (df[df['oldName'] == sensor2]['sensorValueDescriptionEn']).tolist()[0]
+            if condi1 not in ['The sensor has a fault', None] and condi2 not in ['The sensor has a fault', None]:
+                if condi1 == condi2:
+                    road_cond = condi1
+                else:
+                    road_cond = condi1+' / '+condi2
+            elif condi1 not in ['The sensor has a fault', None]:
+                road_cond = condi1
+            elif condi2 not in ['The sensor has a fault', None]:
+                road_cond = condi2
+            else:
+                road_cond = np.nan
+        elif sensor1 in sensors:
+            condi1 = (df[df['oldName'] == sensor1]['sensorValueDescriptionEn']).tolist()[0]
+            road_cond = condi1 if condi1 not in ['The sensor has a fault', None] else np.nan
+        elif sensor2 in sensors:
+            condi2 = (df[df['oldName'] == sensor2]['sensorValueDescriptionEn']).tolist()[0]
+            road_cond = condi2 if condi2 not in ['The sensor has a fault', None] else np.nan
+        else:
+            road_cond = np.nan
+        return road_cond
+
+    weatherdf_mod = weatherdf.copy()
+    # sensors_values gives a categorical column (NaN if missing), the loop expects None
+    description = weatherdf_mod['sensorValueDescriptionEn'].astype(object)
+    weatherdf_mod['sensorValueDescriptionEn'] = description.where(description.notna(), None)
+    weatherdf_mod['sensorValueDescriptionEn'] = weatherdf_mod['sensorValueDescriptionEn'].replace('Dry weather', 'Dry')
+    used_sensors = list(set(weatherdf_mod[pd.notnull(weatherdf_mod['sensorValueDescriptionEn'])]['oldName'].unique().tolist())-set(['warning1', 'warning2', 'warning3']))
+    roadStationIdlist = weatherdf_mod['roadStationId'].unique().tolist()
+    idgrp = weatherdf_mod.groupby('roadStationId')
+    road_condition = []
+    weather_condition = []
+    for st in roadStationIdlist:
+        stgrp = idgrp.get_group(st)
+        stgrpnew = stgrp[stgrp['oldName'].isin(used_sensors)]
+        sensors = stgrpnew['oldName'].tolist()
+        road_condition.append(find_condi(stgrpnew, 'roadsurfaceconditions1', 'roadsurfaceconditions2'))
+        weather_condition.append(find_condi(stgrpnew, 'precipitationtype', 'precipitation'))
+    conditiondf = pd.DataFrame(list(zip(roadStationIdlist, road_condition, weather_condition)),
+                               columns=['roadStationId', 'road_condition', 'weather_condition'])
+    conditiondf.rename(columns={'roadStationId':'nearestWeatherStationId'}, inplace=True)
+    conditiondf['nearestWeatherStationId'] = conditiondf['nearestWeatherStationId'].astype('float64')
+    return conditiondf
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--weather', type=int, default=480, help='number of weather stations')
+    parser.add_argument('--seeds', type=int, default=5, help='number of generated payloads')
+    args = parser.parse_args()
+
+    timings = {'pivot': 0.0, 'loop': 0.0}
+    same = True
+    for seed in range(args.seeds):
+        data_weather = weather_data(range(1000, 1000+args.weather), seed=seed)
+        weatherdf = sensors_values(data_weather)
+        results = {}
+        for name, func in [('pivot', weather_road_conditions), ('loop', loop_weather_road_conditions)]:
+            start = time.perf_counter()
+            results[name] = func(data_weather, weatherdf)
+            timings[name] += time.perf_counter()-start
+        same = same and results['pivot'].equals(results['loop'])
+    for name, duration in timings.items():
+        print('%s: %.3fs per payload' % (name, duration/args.seeds))
+    print('identical conditiondf: %s' % same)
+    print('speedup: x%.0f' % (timings['loop']/timings['pivot']))
+    return 0 if same else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
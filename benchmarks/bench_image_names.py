@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Regression check and benchmark of utils.image_names against the previous row-wise apply:
+the names must be byte-identical. Runs on archived snapshots (every camera-data.json or
+camera-data.json.gz found in the given directory, e.g. the 'archive/' of the handler)
+or on synthetic payloads.
+
+Usage:
+python benchmarks/bench_image_names.py [--snapshots DIR] [--cameras 780]
+"""
+# Import libraries
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import itertools
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils import road_dic, weather_dic, image_names
+from fixtures import camera_data
+
+
+def apply_image_names(images_database):
+    """
+    Previous implementation: one formatted string per row with DataFrame.apply
+    """
+    images_database = images_database.copy()
+    images_database['measuredTime'] = images_database['measuredTime'].fillna('undefined')
+    return images_database.apply(lambda x: "{}_r{}_w{}_{}".format(x['id_camera'], road_dic.get(x['vote_roadCondition'], 'nan'), weather_dic.get(x['vote_weatherCondition'], 'nan'), str(x['measuredTime']).replace(' ', '_').split('+')[0].replace(':', '-')), axis=1)
+
+def load_snapshots(directory):
+    """
+    Load every camera-data json (plain or gzip compressed) found in a directory
+    """
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name in ['camera-data.json', 'camera-data.json.gz']:
+                path = os.path.join(root, name)
+                with (gzip.open(path, 'rt') if name.endswith('.gz') else open(path)) as f:
+                    yield path, json.load(f)
+
+def presets_database(data_camera):
+    """
+    Images database of a camera-data payload, every road/weather vote is used in turn
+    """
+    presets = [preset for station in data_camera['cameraStations'] for preset in station['cameraPresets']]
+    images_database = pd.DataFrame(presets).rename(columns={'id': 'id_camera'})
+    images_database['measuredTime'] = pd.to_datetime(images_database['measuredTime'])
+    votes = itertools.cycle(itertools.product(list(road_dic)+['undefined'], list(weather_dic)+['undefined']))
+    images_database['vote_roadCondition'], images_database['vote_weatherCondition'] = zip(
+        *[next(votes) for _ in range(len(images_database))])
+    return images_database
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--snapshots', help='directory of archived snapshots')
+    parser.add_argument('--cameras', type=int, default=780, help='number of camera stations (synthetic payloads)')
+    args = parser.parse_args()
+
+    if args.snapshots:
+        snapshots = load_snapshots(args.snapshots)
+    else:
+        stations = ['C%05d' % num for num in range(args.cameras)]
+        snapshots = (('synthetic-%d' % seed, camera_data(stations, range(1000, 1480), seed=seed))
+                     for seed in range(5))
+    timings = {'vectorized': 0.0, 'apply': 0.0}
+    failures = 0
+    count = 0
+    for name, data_camera in snapshots:
+        images_database = presets_database(data_camera)
+        start = time.perf_counter()
+        names = image_names(images_database)
+        timings['vectorized'] += time.perf_counter()-start
+        start = time.perf_counter()
+        expected = apply_image_names(images_database)
+        timings['apply'] += time.perf_counter()-start
+        if names.tolist() != expected.tolist():
+            failures += 1
+            print('%s: names differ' % name)
+        count += 1
+    for method, duration in timings.items():
+        print('%s: %.4fs per snapshot' % (method, duration/max(count, 1)))
+    print('%d snapshots, %d with different names' % (count, failures))
+    return 1 if failures or not count else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Import time (cold start cost) of the entry points: each module is imported in fresh interpreters,
+the wall time (minus the bare interpreter start) and the 'python -X importtime' report are
+collected, and the heavy modules loaded by each entry point are listed.
+
+Usage:
+python benchmarks/bench_imports.py [--modules handler sensors_handler] [--repeat 5] [--top 10] [--output imports.json]
+"""
+# Import libraries
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+ENTRY_POINTS = ['handler', 'sensors_handler', 'service', 'data_processing', 'station_map']
+# Heavy dependencies only used by some code paths
+HEAVY_MODULES = ['folium', 'branca', 'jinja2', 'geopy', 'bs4', 'lxml', 'pyarrow', 'ijson']
+# Heavy modules that an entry point must not load at import
+# (pyarrow is only reported: recent pandas versions import it themselves)
+FORBIDDEN = {'handler': ['folium', 'geopy', 'bs4', 'lxml'],
+             'sensors_handler': ['folium', 'geopy', 'bs4', 'lxml'],
+             'data_processing': ['folium', 'geopy']}
+
+PROBE = 'import sys, json; import {}; print(json.dumps(sorted(m for m in {!r} if m in sys.modules)))'
+
+
+def interpreter_time(code, repeat):
+    """
+    Median wall time (seconds) of 'python -c code' in fresh interpreters
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter()-start)
+    return statistics.median(timings)
+
+def importtime_report(module):
+    """
+    Run 'python -X importtime' on a module
+
+    Return:
+    cumulative -- dictionary imported module: cumulative import time in microseconds
+    loaded -- list of the heavy modules loaded by the import
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE.format(module, HEAVY_MODULES)],
+                             cwd=ROOT, check=True, capture_output=True, text=True)
+    cumulative = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, total, name = line[len('import time:'):].split('|')
+        cumulative[name.strip()] = int(total)
+    return cumulative, json.loads(process.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--modules', nargs='+', default=ENTRY_POINTS, help='entry points to import')
+    parser.add_argument('--repeat', type=int, default=5, help='number of fresh interpreters per module')
+    parser.add_argument('--top', type=int, default=10, help='number of top level packages reported')
+    parser.add_argument('--output', help='json file where the results are saved')
+    args = parser.parse_args()
+
+    baseline = interpreter_time('pass', args.repeat)
+    results = []
+    failures = 0
+    for module in args.modules:
+        seconds = interpreter_time('import '+module, args.repeat)-baseline
+        cumulative, loaded = importtime_report(module)
+        # top level packages (no dot in the name) sorted by cumulative import time
+        packages = sorted(((name, us) for name, us in cumulative.items() if '.' not in name and name != module),
+                          key=lambda item: -item[1])[:args.top]
+        forbidden = [name for name in loaded if name in FORBIDDEN.get(module, [])]
+        failures += bool(forbidden)
+        results.append({'module': module, 'seconds': round(seconds, 4),
+                        'importtime_ms': round(cumulative.get(module, 0)/1000, 1),
+                        'top_packages_ms': {name: round(us/1000, 1) for name, us in packages},
+                        'heavy_loaded': loaded, 'forbidden_loaded': forbidden})
+        print('%-16s %7.3fs (importtime %7.1fms)  heavy: %s%s' % (
+            module, seconds, cumulative.get(module, 0)/1000, ', '.join(loaded) or '-',
+            '  FORBIDDEN: '+', '.join(forbidden) if forbidden else ''))
+        print('    '+', '.join('%s %.0fms' % (name, us/1000) for name, us in packages))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'baseline_seconds': round(baseline, 4),
+                       'results': results}, f, indent=2)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
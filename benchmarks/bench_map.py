@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the station map rendering: FastMarkerCluster layers (station_map.render_map) against
+the previous renderer (one folium Marker per station, neighbour list filtered per marker).
+
+Usage:
+python benchmarks/bench_map.py [--scales 1 5] [--output /tmp/maps]
+"""
+# Import libraries
+import os
+import sys
+import time
+import argparse
+import tempfile
+import folium
+import folium.plugins
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from data_processing import TrafficCrawler
+from station_map import render_map, station_rows, neighbours_dict, Finland_COORDINATES, MAP_FILE
+from fixtures import network
+
+
+def marker_map(cameraStations_map, weatherStations_map, sensors_nearby_camera, cameras_nearby_sensors, path):
+    """
+    Previous implementation: one Marker (popup, tooltip and icon objects) per station
+    """
+    finland_map = folium.Map(location=Finland_COORDINATES, zoom_start=9)
+    cluster = folium.plugins.MarkerCluster(name='Cameras').add_to(finland_map)
+    for each in cameraStations_map.iterrows():
+        folium.Marker(
+            location=[each[1]['latitude'], each[1]['longitude']],
+            popup='<b>id_cameraStation: </b>%s<br></br><b>cameraPresets: </b>%s<br></br><b>nearestWeatherStationId: </b>%s<br></br><b>sensors nearby 200m: </b>%s<br></br>'
+            %(each[1]['id_cameraStation'], each[1]['cameraPresets'], each[1]['nearestWeatherStationId'],
+              sensors_nearby_camera[sensors_nearby_camera['id_cameraStation'] == each[1]['id_cameraStation']]['sensors_nearby(radius_200m)'].iloc[0]),
+            tooltip='<b>Camera_Station</b>', icon=folium.Icon(color='red', icon='camera')).add_to(cluster)
+    for each in weatherStations_map.iterrows():
+        folium.Marker(
+            location=[each[1]['latitude'], each[1]['longitude']],
+            popup='<b>weatherStationId: </b>%s<br></br><b>stationSensors: </b>%s<br></br><b>cameras nearby 200m: </b>%s<br></br>'
+            %(each[1]['weatherStationId'], each[1]['stationSensors'], cameras_nearby_sensors[cameras_nearby_sensors['id_weatherStation'] == each[1]['weatherStationId']]['cameras_nearby(radius_200m)'].iloc[0]),
+            tooltip='<b>Weather_Station</b>', icon=folium.Icon(icon='cloud')).add_to(cluster)
+    finland_map.save(os.path.join(path, MAP_FILE))
+
+def same_popups(traffic_crawler, sensors_nearby_camera, cameras_nearby_sensors):
+    """
+    Check that the popup fields of the layers are the ones of the previous popups
+    """
+    sensors_nearby = neighbours_dict(sensors_nearby_camera, 'id_cameraStation', 'sensors_nearby(radius_200m)')
+    rows = station_rows(traffic_crawler.cameraStations_map,
+                        ['id_cameraStation', 'cameraPresets', 'nearestWeatherStationId'], sensors_nearby)
+    for row, (_, station) in zip(rows, traffic_crawler.cameraStations_map.iterrows()):
+        nearby_list = sensors_nearby_camera[sensors_nearby_camera['id_cameraStation'] == station['id_cameraStation']]
+        expected = ['%s' % station[column] for column in ['id_cameraStation', 'cameraPresets', 'nearestWeatherStationId']]
+        if row[2:] != expected+['%s' % nearby_list['sensors_nearby(radius_200m)'].iloc[0]]:
+            return False
+    return len(rows) == len(traffic_crawler.cameraStations_map)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 5], help='scales of the synthetic network')
+    parser.add_argument('--output', default=tempfile.gettempdir(), help='directory where the maps are saved')
+    args = parser.parse_args()
+
+    failures = 0
+    for scale in args.scales:
+        payloads = network(scale)
+        traffic_crawler = TrafficCrawler(payloads['camera-data'], payloads['weather-data'],
+                                         payloads['weather-stations'], payloads['camera-stations'])
+        sensors_nearby_camera, cameras_nearby_sensors = traffic_crawler.build_map(save_map=False)
+        results = {}
+        for name, func in [('layers', render_map), ('markers', marker_map)]:
+            path = os.path.join(args.output, 'map_%s_x%g' % (name, scale))
+            os.makedirs(path, exist_ok=True)
+            start = time.perf_counter()
+            func(traffic_crawler.cameraStations_map, traffic_crawler.weatherStations_map,
+                 sensors_nearby_camera, cameras_nearby_sensors, path)
+            results[name] = (time.perf_counter()-start, os.path.getsize(os.path.join(path, MAP_FILE)))
+            print('x%g %s: %.2fs, %.0f KB' % (scale, name, results[name][0], results[name][1]/1024))
+        same = same_popups(traffic_crawler, sensors_nearby_camera, cameras_nearby_sensors)
+        failures += not same
+        print('x%g identical popups: %s, speedup: x%.0f, html size: /%.1f' % (
+            scale, same, results['markers'][0]/results['layers'][0], results['markers'][1]/results['layers'][1]))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the nearby stations search: spatial index (utils.nearby) against
+the reference geopy loop (utils.radius_calc) on the Finnish network station counts.
+
+Usage:
+python benchmarks/bench_nearby.py [--cameras 780] [--weather 480] [--radius 200]
+"""
+# Import libraries
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils import nearby, radius_calc
+
+
+def random_stations(n_stations, seed, near=None, near_ratio=0.3):
+    """
+    Generate station coordinates spread over Finland, a share of them being
+    placed next to the 'near' stations (like cameras next to weather stations)
+    """
+    rng = np.random.default_rng(seed)
+    latitudes = 60+rng.random(n_stations)*9
+    longitudes = 20+rng.random(n_stations)*10
+    if near is not None:
+        close = rng.random(n_stations) < near_ratio
+        picked = rng.integers(0, len(near), close.sum())
+        latitudes[close] = near['latitude'].values[picked]+rng.uniform(-0.001, 0.001, close.sum())
+        longitudes[close] = near['longitude'].values[picked]+rng.uniform(-0.002, 0.002, close.sum())
+    return pd.DataFrame({'latitude': latitudes, 'longitude': longitudes})
+
+def geopy_nearby(origStations_map, destStations_map, id_destStation, radius):
+    """
+    Previous implementation: one geodesic distance per (origin, destination) pair
+    """
+    destStation_points_list = list(zip(destStations_map['latitude'].tolist(),
+                                       destStations_map['longitude'].tolist()))
+    return [radius_calc((lat, lon), destStation_points_list, id_destStation, radius)
+            for lat, lon in zip(origStations_map['latitude'], origStations_map['longitude'])]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--cameras', type=int, default=780, help='number of camera stations')
+    parser.add_argument('--weather', type=int, default=480, help='number of weather stations')
+    parser.add_argument('--radius', type=float, default=200, help='search radius in meter')
+    args = parser.parse_args()
+
+    weatherStations_map = random_stations(args.weather, 0)
+    cameraStations_map = random_stations(args.cameras, 1, near=weatherStations_map)
+    id_weatherStation = list(range(args.weather))
+    id_cameraStation = list(range(args.cameras))
+
+    results = {}
+    for name, func in [('index', nearby), ('geopy', geopy_nearby)]:
+        start = time.perf_counter()
+        sensors_nearby = func(cameraStations_map, weatherStations_map, id_weatherStation, args.radius)
+        cameras_nearby = func(weatherStations_map, cameraStations_map, id_cameraStation, args.radius)
+        results[name] = (time.perf_counter()-start, sensors_nearby, cameras_nearby)
+        print('%s: %.3fs' % (name, results[name][0]))
+    same = results['index'][1:] == results['geopy'][1:]
+    print('identical neighbour lists: %s' % same)
+    print('speedup: x%.0f' % (results['geopy'][0]/results['index'][0]))
+    return 0 if same else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite of TrafficCrawler on synthetic digitraffic networks (see fixtures.network)
+at several scales of the current network: wall time and peak memory of each stage,
+saved as JSON so the results of two commits can be compared.
+
+Usage:
+python benchmarks/bench_suite.py [--scales 1 5 20] [--repeat 3] [--output results.json]
+python benchmarks/bench_suite.py --compare old.json new.json [--threshold 1.2]
+"""
+# Import libraries
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import statistics
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from data_processing import TrafficCrawler
+from utils import nearby, vote_road, vote_weather
+from fixtures import network, SCALES
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def crawler(payloads):
+    return TrafficCrawler(payloads['camera-data'], payloads['weather-data'],
+                          payloads['weather-stations'], payloads['camera-stations'])
+
+def clear_caches():
+    # the votes are memoized: every repeat starts from empty caches
+    vote_road.cache_clear()
+    vote_weather.cache_clear()
+
+def nearby_stations(traffic_crawler):
+    """
+    Nearby searches of build_map (camera -> weather stations and weather -> camera stations)
+    """
+    cameras = traffic_crawler.cameraStations_map
+    stations = traffic_crawler.weatherStations_map
+    nearby(cameras, stations, stations['weatherStationId'].tolist())
+    nearby(stations, cameras, cameras['id_cameraStation'].tolist())
+
+# Stages: name -> (setup (not measured): payloads -> argument, measured function: argument -> None)
+stages = {
+    'init': (lambda payloads: payloads, crawler),
+    'build_dataset': (crawler, lambda traffic_crawler: traffic_crawler.build_dataset()),
+    'vote_roadCondition': (crawler, lambda traffic_crawler: traffic_crawler.vote_roadCondition(
+        traffic_crawler.conditiondf['road_condition'].tolist())),
+    'vote_weatherCondition': (crawler, lambda traffic_crawler: traffic_crawler.vote_weatherCondition()),
+    'nearby': (crawler, nearby_stations),
+    'build_map': (crawler, lambda traffic_crawler: traffic_crawler.build_map(save_map=False)),
+}
+
+def measure(setup, function, payloads, repeat):
+    """
+    Time a stage (repeat runs) then measure its peak memory (one run traced by tracemalloc)
+
+    Return:
+    result -- dictionary: seconds (median), min_seconds, peak_mb and error (None if the stage succeeded)
+    """
+    timings = []
+    try:
+        for _ in range(repeat):
+            argument = setup(payloads)
+            clear_caches()
+            start = time.perf_counter()
+            function(argument)
+            timings.append(time.perf_counter()-start)
+        argument = setup(payloads)
+        clear_caches()
+        tracemalloc.start()
+        try:
+            function(argument)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    except Exception as e:
+        return {'seconds': None, 'min_seconds': None, 'peak_mb': None,
+                'error': '{}: {}'.format(type(e).__name__, e)}
+    return {'seconds': round(statistics.median(timings), 6), 'min_seconds': round(min(timings), 6),
+            'peak_mb': round(peak/2**20, 2), 'error': None}
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run(scales, repeat, seed, selected):
+    """
+    Run the suite
+
+    Return:
+    report -- dictionary: meta (commit, versions, date) and results (one per scale and stage)
+    """
+    report = {'meta': {'commit': git_commit(), 'date': datetime.datetime.utcnow().isoformat(),
+                       'python': platform.python_version(), 'pandas': pd.__version__,
+                       'numpy': np.__version__, 'machine': platform.machine(),
+                       'repeat': repeat, 'seed': seed},
+              'results': []}
+    for scale in scales:
+        payloads = network(scale, seed)
+        size = {'scale': scale,
+                'camera_stations': len(payloads['camera-data']['cameraStations']),
+                'presets': sum(len(station['cameraPresets'])
+                               for station in payloads['camera-data']['cameraStations']),
+                'weather_stations': len(payloads['weather-data']['weatherStations']),
+                'sensors': sum(len(station['sensorValues'])
+                               for station in payloads['weather-data']['weatherStations'])}
+        for stage in selected:
+            result = dict(size, stage=stage, **measure(*stages[stage], payloads, repeat))
+            report['results'].append(result)
+            if result['error']:
+                print('%4sx %-22s error: %s' % (scale, stage, result['error']))
+            else:
+                print('%4sx %-22s %9.4fs %9.1fMB' % (scale, stage, result['seconds'], result['peak_mb']))
+    return report
+
+def compare(old_path, new_path, threshold):
+    """
+    Compare the median times of two result files
+
+    Return:
+    regressions -- number of stages slower than threshold times the old time
+    """
+    with open(old_path) as f:
+        old = {(r['scale'], r['stage']): r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = json.load(f)['results']
+    regressions = 0
+    for result in new:
+        previous = old.get((result['scale'], result['stage']))
+        if previous is None or previous['seconds'] is None or result['seconds'] is None:
+            continue
+        ratio = result['seconds']/max(previous['seconds'], 1e-9)
+        flag = ''
+        if ratio > threshold:
+            regressions += 1
+            flag = '  REGRESSION'
+        print('%4sx %-22s %9.4fs -> %9.4fs  x%.2f%s' % (result['scale'], result['stage'],
+                                                       previous['seconds'], result['seconds'], ratio, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--scales', type=float, nargs='+', default=SCALES, help='scales of the network')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs per stage')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the fixtures')
+    parser.add_argument('--stages', nargs='+', choices=list(stages), default=list(stages))
+    parser.add_argument('--output', help='result file (default: results/<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files')
+    parser.add_argument('--threshold', type=float, default=1.2, help='slowdown ratio reported as regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        return 1 if compare(*args.compare, args.threshold) else 0
+    scales = [int(scale) if scale == int(scale) else scale for scale in args.scales]
+    report = run(scales, args.repeat, args.seed, args.stages)
+    output = args.output or os.path.join(RESULTS_DIR, '{}.json'.format(report['meta']['commit'] or 'results'))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('results saved in %s' % output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic digitraffic payloads used by the benchmarks.
+"""
+# Import libraries
+import random
+
+# Size of the current digitraffic network, multiplied by the scale factors of the benchmarks
+BASE_CAMERA_STATIONS = 780
+BASE_WEATHER_STATIONS = 480
+SCALES = [1, 5, 20]
+# Bounding box (longitude, latitude) of the generated stations
+FINLAND_BOUNDS = ((20.5, 31.5), (59.8, 70.0))
+
+# Values reported by the road/weather conditions sensors
+ROAD_CONDITIONS = ['Dry', 'Moist', 'Wet', 'Wet and salty', 'Frost', 'Snow', 'Ice',
+                   'Probably moist and salty', 'Slushy', 'The sensor has a fault', None]
+PRECIPITATION_TYPES = ['Dry weather', 'Rain', 'Snowfall', 'Wet sleet', 'Sleet', 'Hails', 'Drizzle',
+                       'Ice crystals', 'Snow grains', 'Graupel', 'Freezing drizzle', 'Freezing rain',
+                       'Mist/Fog', 'The sensor has a fault', None]
+PRECIPITATIONS = ['Dry weather', 'Light', 'Moderate', 'Abundant', 'Weak rain', 'Heavy rain',
+                  'The sensor has a fault', None]
+OTHER_SENSORS = ['airtemperature1', 'roadtemperature1', 'humidity', 'windspeed', 'warning1']
+
+
+def sensor_description(rnd, name):
+    if name.startswith('roadsurfaceconditions'):
+        return rnd.choice(ROAD_CONDITIONS)
+    if name == 'precipitationtype':
+        return rnd.choice(PRECIPITATION_TYPES)
+    if name == 'precipitation':
+        return rnd.choice(PRECIPITATIONS)
+    return None
+
+def weather_data(weather_station_ids, seed=0, missing_ratio=0.15):
+    """
+    Generate a 'weather-data' payload
+
+    Arguments:
+    weather_station_ids -- ids of the weather stations
+    seed -- seed of the random generator
+    missing_ratio -- probability that a sensor is missing in a station
+
+    Return:
+    data_weather -- dictionary shaped like the loaded 'weather-data.json'
+    """
+    rnd = random.Random(seed)
+    names = ['roadsurfaceconditions1', 'roadsurfaceconditions2',
+             'precipitationtype', 'precipitation']+OTHER_SENSORS
+    stations = []
+    for station_id in weather_station_ids:
+        sensor_values = []
+        for num, name in enumerate(names):
+            if rnd.random() < missing_ratio:
+                continue
+            sensor_values.append({'id': num+1, 'roadStationId': station_id, 'name': name.upper(),
+                                  'oldName': name, 'shortName': name[:4],
+                                  'sensorValue': round(rnd.random()*10, 1), 'sensorUnit': '***',
+                                  'sensorValueDescriptionEn': sensor_description(rnd, name),
+                                  'measuredTime': '2020-05-0%dT%02d:%02d:%02dZ' % (
+                                      1+rnd.randrange(2), rnd.randrange(24),
+                                      rnd.randrange(60), rnd.randrange(60))})
+        stations.append({'id': station_id, 'measuredTime': '2020-05-01T10:00:00Z',
+                         'sensorValues': sensor_values})
+    return {'dataUpdatedTime': '2020-05-01T10:00:00Z', 'weatherStations': stations}
+
+def camera_data(camera_station_ids, weather_station_ids, seed=0, max_presets=4, undefined_ratio=0.03,
+                nearest=None):
+    """
+    Generate a 'camera-data' payload
+
+    Arguments:
+    camera_station_ids -- ids of the camera stations ('C01503')
+    weather_station_ids -- ids of the weather stations (candidates for nearestWeatherStationId)
+    seed -- seed of the random generator
+    max_presets -- maximum number of presets per camera station
+    undefined_ratio -- probability that a preset has no measuredTime
+    nearest -- nearestWeatherStationId of each camera station (None: randomly chosen)
+
+    Return:
+    data_camera -- dictionary shaped like the loaded 'camera-data.json'
+    """
+    rnd = random.Random(seed)
+    weather_station_ids = list(weather_station_ids)
+    stations = []
+    for num, station_id in enumerate(camera_station_ids):
+        presets = []
+        for preset in range(rnd.randint(1, max_presets)):
+            measured_time = None if rnd.random() < undefined_ratio else '2020-05-01T%02d:%02d:%02dZ' % (
+                rnd.randrange(24), rnd.randrange(60), rnd.randrange(60))
+            presets.append({'id': '%s%02d' % (station_id, preset+1), 'presentationName': 'Preset',
+                            'inCollection': True, 'resolution': '1280x720',
+                            'imageUrl': 'https://weathercam.digitraffic.fi/%s%02d.jpg' % (station_id, preset+1),
+                            'measuredTime': measured_time})
+        stations.append({'id': station_id, 'roadStationId': num,
+                         'nearestWeatherStationId': (nearest[num] if nearest is not None
+                                                     else rnd.choice(weather_station_ids)),
+                         'cameraPresets': presets})
+    return {'dataUpdatedTime': '2020-05-01T10:00:00Z', 'cameraStations': stations}
+
+def point(longitude, latitude):
+    return {'type': 'Point', 'coordinates': [longitude, latitude, 0.0]}
+
+def weather_stations(weather_station_ids, coordinates):
+    """
+    Generate a 'weather-stations' payload
+
+    Arguments:
+    weather_station_ids -- ids of the weather stations
+    coordinates -- list of the (longitude, latitude) of the weather stations
+
+    Return:
+    data_weather_stations -- dictionary shaped like the loaded 'weather-stations.json'
+    """
+    features = [{'type': 'Feature', 'id': station_id, 'geometry': point(*coordinate),
+                 'properties': {'roadStationId': station_id, 'stationSensors': list(range(1, 10))}}
+                for station_id, coordinate in zip(weather_station_ids, coordinates)]
+    return {'type': 'FeatureCollection', 'dataUpdatedTime': '2020-05-01T10:00:00Z', 'features': features}
+
+def camera_stations(camera_station_ids, coordinates):
+    """
+    Generate a 'camera-stations' payload
+
+    Arguments:
+    camera_station_ids -- ids of the camera stations ('C01503')
+    coordinates -- list of the (longitude, latitude) of the camera stations
+
+    Return:
+    data_camera_stations -- dictionary shaped like the loaded 'camera-stations.json'
+    """
+    features = [{'type': 'Feature', 'id': station_id, 'geometry': point(*coordinate),
+                 'properties': {'id': station_id, 'roadStationId': num, 'presets': []}}
+                for num, (station_id, coordinate) in enumerate(zip(camera_station_ids, coordinates))]
+    return {'type': 'FeatureCollection', 'dataUpdatedTime': '2020-05-01T10:00:00Z', 'features': features}
+
+def network(scale=1, seed=0, colocated_ratio=0.08, camera_nearby_ratio=0.3):
+    """
+    Generate the four payloads used by TrafficCrawler for a network scale times bigger than the
+    current one: some weather stations share their location (co-located stations) and some camera
+    stations are a few dozen meters away from their nearest weather station
+
+    Arguments:
+    scale -- scale factor of the number of camera and weather stations
+    seed -- seed of the random generator
+    colocated_ratio -- probability that a weather station shares the location of the previous one
+    camera_nearby_ratio -- probability that a camera station is located nearby its weather station
+
+    Return:
+    payloads -- dictionary feed name ('camera-data', 'camera-stations', 'weather-data',
+    'weather-stations'): payload
+    """
+    rnd = random.Random(seed)
+    (min_lon, max_lon), (min_lat, max_lat) = FINLAND_BOUNDS
+    weather_ids = list(range(1000, 1000+int(BASE_WEATHER_STATIONS*scale)))
+    weather_coordinates = []
+    for _ in weather_ids:
+        if weather_coordinates and rnd.random() < colocated_ratio:
+            weather_coordinates.append(weather_coordinates[-1])
+        else:
+            weather_coordinates.append((rnd.uniform(min_lon, max_lon), rnd.uniform(min_lat, max_lat)))
+    camera_ids = ['C%05d' % num for num in range(int(BASE_CAMERA_STATIONS*scale))]
+    camera_coordinates = []
+    nearest = []
+    for _ in camera_ids:
+        station = rnd.randrange(len(weather_ids))
+        if rnd.random() < camera_nearby_ratio:
+            longitude, latitude = weather_coordinates[station]
+            camera_coordinates.append((longitude+rnd.uniform(-0.002, 0.002), latitude+rnd.uniform(-0.001, 0.001)))
+        else:
+            camera_coordinates.append((rnd.uniform(min_lon, max_lon), rnd.uniform(min_lat, max_lat)))
+        nearest.append(weather_ids[station])
+    return {'camera-data': camera_data(camera_ids, weather_ids, seed=seed, nearest=nearest),
+            'camera-stations': camera_stations(camera_ids, camera_coordinates),
+            'weather-data': weather_data(weather_ids, seed=seed),
+            'weather-stations': weather_stations(weather_ids, weather_coordinates)}
@@ -2,11 +2,10 @@
 """
 TrafficCrawler class responsible for extracting main information from json files.
 Builds images and sensors databases and to create Finland map that contains camera and
-weather stations.
+weather stations (the map itself is rendered by station_map.py).
 """
 import numpy as np
 import pandas as pd
-import folium
 from utils import *
 
 
@@ -14,13 +13,18 @@ class TrafficCrawler():
     """
     Create database of images and build Finland map that contains camera and weather stations
     """
-    def __init__(self, data_camera, data_weather, data_weather_stations, data_camera_stations):
+    def __init__(self, data_camera, data_weather, data_weather_stations, data_camera_stations,
+                 metadata=None, pushdown=False):
         """
         The constructor of the class -intiate the class attributes:
         data_camera -- loaded data from json files
         data_weather -- loaded data from json files
-        data_weather_stations -- loaded data from json files
-        data_camera_stations -- loaded data from json files
+        data_weather_stations -- loaded data from json files (not used if metadata is given)
+        data_camera_stations -- loaded data from json files (not used if metadata is given)
+        metadata -- already parsed station feeds (see utils.stations_metadata), e.g. from
+                    station_cache.StationCache
+        pushdown -- if True only the sensors of the weather stations used by build_dataset
+                    (nearest stations of the cameras and their co-located stations) are parsed
         weatherdf -- dataframe that contains specific sensors informations
         weatherStations_map -- weather stations dataframe :id, location and stations sensors (to build the map)
         sensors_data -- dataframe that contains all sensors with their respective coordinates
@@ -33,9 +37,14 @@ class TrafficCrawler():
         self.data_weather = data_weather
         self.data_weather_stations = data_weather_stations
         self.data_camera_stations = data_camera_stations
-        self.weatherdf = sensors_values(self.data_weather)
-        self.weatherStations_map, self.sensors_data = weather_stations(self.data_weather_stations, self.data_weather, self.weatherdf)
-        self.cameraStations, self.cameraStations_map = camera_stations(self.data_camera, self.data_camera_stations)
+        if metadata is None:
+            metadata = stations_metadata(self.data_weather_stations, self.data_camera_stations)
+        self.metadata = metadata
+        station_ids = weather_stations_ids(self.data_camera, metadata['colocated']) if pushdown else None
+        self.weatherdf = sensors_values(self.data_weather, station_ids)
+        self.weatherStations_map = metadata['weatherStations_map']
+        self.sensors_data = sensors_coordinates(self.weatherdf, self.weatherStations_map)
+        self.cameraStations, self.cameraStations_map = camera_stations(self.data_camera, metadata['cameraStations_coordinates'])
         self.conditiondf = weather_road_conditions(self.data_weather, self.weatherdf)
 
     def vote_roadCondition(self, road_condition3):
@@ -48,59 +57,16 @@ class TrafficCrawler():
         Return:
         vote_condition -- list of the voted road condition
         """
-        vote_condition = []
-        for i in range(len(self.conditiondf)):
-            if type(road_condition3[i]) == str:
-                road_condition = road_condition3[i].split(' / ')
-                if len(road_condition) == 1:
-                    vote_condition.append(road_condition[0])
-                else:
-                    occur = [road_condition.count(cond) for cond in road_condition]
-                    if len(list(set(occur))) == 1:
-                        weights = [road_condition_weights[cond] for cond in road_condition]
-                        vote_condition.append(
-                            list(road_condition_weights.keys())[list(road_condition_weights.values()).index(max(weights))])
-                    else:
-                        vote_condition.append(road_condition[occur.index(max(occur))])
-            else:
-                vote_condition.append(np.nan)
-        return vote_condition
+        return vote_conditions(road_condition3, vote_road).tolist()
 
     def vote_weatherCondition(self):
         """
-        Vote between different weather conditions provided by sensors of similar types
+        Normalize and vote between different weather conditions provided by sensors of similar types
 
         Return:
         vote_weather -- list of the voted weather condition
         """
-        vote_weather = []
-        for i in range(len(self.conditiondf)):
-            if type(self.conditiondf.iloc[i]['weather_condition']) == str:
-                weather_condition = self.conditiondf.iloc[i]['weather_condition'].split(' / ')
-                if len(weather_condition) == 1:
-                    if weather_condition[0] not in list(weather_condition_weights.keys()):
-                        if weather_condition[0] == 'snow/sleet' or weather_condition[0] == 'Rain':
-                            vote_weather.append('Weak '+weather_condition[0].lower())
-                        else:
-                            vote_weather.append(np.nan)
-                    else:
-                        vote_weather.append(weather_condition[0])
-                else:
-                    varia = [j in list(weather_condition_weights.keys()) for j in weather_condition]
-                    if sum(varia) > 0:
-                        if sum(varia) == 1:
-                            vote_weather.append(weather_condition[varia.index(True)])
-                        else:
-                            weights = [weather_condition_weights[cond] for cond in weather_condition]
-                            vote_weather.append(
-                                list(weather_condition_weights.keys())[list(weather_condition_weights.values()).index(max(weights))])
-                    elif weather_condition[1].title()+' '+weather_condition[0].lower() in list(weather_condition_weights.keys()):
-                        vote_weather.append(weather_condition[1].title()+' '+weather_condition[0].lower())
-                    else:
-                        vote_weather.append(np.nan)
-            else:
-                vote_weather.append(np.nan)
-        return vote_weather
+        return vote_conditions(self.conditiondf['weather_condition'], vote_weather).tolist()
 
 
     def build_map(self, path=None, save_map=True):
@@ -118,34 +84,17 @@ class TrafficCrawler():
         cameras_nearby_sensors = pd.DataFrame(list
                                               (zip(id_weatherStation, cameras_nearby_200m)),
                                               columns=['id_weatherStation', 'cameras_nearby(radius_200m)'])
-        if save_map & path:
-            Finland_COORDINATES = (63.2467777, 25.9209164)
-            # Create an empty map zoomed in Finland
-            finland_map = folium.Map(location=Finland_COORDINATES, zoom_start=9)
-            cluster = folium.plugins.MarkerCluster(name='Cameras').add_to(map)
-            # Adding a marker for every record in the filtered data, using a cluster view
-            for each in self.cameraStations_map.iterrows():
-                folium.Marker(
-                    location=[each[1]['latitude'], each[1]['longitude']],
-                    popup='<b>id_cameraStation: </b>%s<br></br><b>cameraPresets: </b>%s<br></br><b>nearestWeatherStationId: </b>%s<br></br><b>sensors nearby 200m: </b>%s<br></br>'
-                    %(each[1]['id_cameraStation'], each[1]['cameraPresets'], each[1]['nearestWeatherStationId'],
-                      sensors_nearby_camera[sensors_nearby_camera['id_cameraStation'] == each[1]['id_cameraStation']]['sensors_nearby(radius_200m)'].iloc[0]),
-                    tooltip='<b>Camera_Station</b>', icon=folium.Icon(color='red', icon='camera')).add_to(cluster)
-            for each in self.weatherStations_map.iterrows():
-                folium.Marker(
-                    location=[each[1]['latitude'], each[1]['longitude']],
-                    popup='<b>weatherStationId: </b>%s<br></br><b>stationSensors: </b>%s<br></br><b>cameras nearby 200m: </b>%s<br></br>'
-                    %(each[1]['weatherStationId'], each[1]['stationSensors'], cameras_nearby_sensors[cameras_nearby_sensors['id_weatherStation'] == each[1]['weatherStationId']]['cameras_nearby(radius_200m)'].iloc[0]),
-                    tooltip='<b>Weather_Station</b>', icon=folium.Icon(icon='cloud')).add_to(cluster)
-            finland_map.save(path+'Finland_stations_map.html')
+        if save_map and path:
+            # folium is only imported when a map is rendered
+            from station_map import render_map
+            render_map(self.cameraStations_map, self.weatherStations_map,
+                       sensors_nearby_camera, cameras_nearby_sensors, path)
         return sensors_nearby_camera, cameras_nearby_sensors
 
-    def build_dataset(self):
+    def station_votes(self):
         """
-        Generate 'images_database' dataframe that contains: information about the images(image_url,image_name), road condition, weather condition...
-
-        Return:
-        images_database -- dataframe
+        Vote the road and weather conditions of every weather station (once, conditiondf
+        then holds nearestWeatherStationId, vote_roadCondition and vote_weatherCondition)
         """
         def road_conditions_sameLocated_weatherStations():
             """
@@ -154,65 +103,81 @@ class TrafficCrawler():
             Return:
             road_condition3 -- list of combined conditions (candidates for the vote section)
             """
-            road_condition2 = []
-            for ro in range(len(self.conditiondf)):
-                if self.conditiondf.iloc[ro]['nearestWeatherStationId']in id1:
-                    variable1 = self.conditiondf[self.conditiondf['nearestWeatherStationId'] == (id2[id1.index(
-                        self.conditiondf.iloc[ro]['nearestWeatherStationId'])])]['road_condition'].values
-                    if variable1:
-                        road_condition2.append(variable1[0])
-                    else:
-                        road_condition2.append(np.nan)
-
-                elif self.conditiondf.iloc[ro]['nearestWeatherStationId']in id2:
-                    variable1 = self.conditiondf[self.conditiondf['nearestWeatherStationId'] == (id1[id2.index(
-                        self.conditiondf.iloc[ro]['nearestWeatherStationId'])])]['road_condition'].values
-                    if variable1:
-                        road_condition2.append(variable1[0])
-                    else:
-                        road_condition2.append(np.nan)
-                else:
-                    road_condition2.append(np.nan)
-            self.conditiondf['road_condition2'] = road_condition2
+            # partner of each co-located weather station (first pair wins, as id1 before id2)
+            partners = pd.DataFrame({'nearestWeatherStationId': id1+id2, 'partnerId': id2+id1},
+                                    dtype='float64').drop_duplicates(subset='nearestWeatherStationId')
+            conditions = self.conditiondf[['nearestWeatherStationId', 'road_condition']]
+            pairs = conditions.merge(partners, on='nearestWeatherStationId', how='left')
+            pairs = pairs.merge(conditions.rename(columns={'nearestWeatherStationId': 'partnerId',
+                                                           'road_condition': 'road_condition2'}),
+                                on='partnerId', how='left')
+            self.conditiondf['road_condition2'] = pairs['road_condition2'].values
             self.conditiondf['road_condition2'] = self.conditiondf['road_condition2'].replace(np.nan, 'undefined')
             self.conditiondf['road_condition'] = self.conditiondf['road_condition'].replace(np.nan, 'undefined')
 
-            road_condition3 = []
-            for j in range(len(self.conditiondf)):
-                x = [self.conditiondf.iloc[j]['road_condition'], self.conditiondf.iloc[j]['road_condition2']]
-                new_condition = ' / '.join(np.array(x)[[i != 'undefined' for i in x]])
-                if new_condition:
-                    road_condition3.append(new_condition)
-                else:
-                    road_condition3.append(np.nan)
-            return road_condition3
-        cameraPres = [dico['cameraPresets'] for dico in self.data_camera['cameraStations']]
-        cameraPres = [d[i] for d in cameraPres for i in range(len(d))]
+            road_condition = self.conditiondf['road_condition'].astype(object)
+            road_condition = road_condition.where(road_condition != 'undefined')
+            road_condition2 = self.conditiondf['road_condition2'].astype(object)
+            road_condition2 = road_condition2.where(road_condition2 != 'undefined')
+            road_condition3 = road_condition.str.cat(road_condition2, sep=' / ')
+            road_condition3 = road_condition3.fillna(road_condition).fillna(road_condition2)
+            return road_condition3.tolist()
+        if 'vote_roadCondition' in self.conditiondf:
+            return self.conditiondf
+        id1, id2 = self.metadata['colocated']
+        road_condition3 = road_conditions_sameLocated_weatherStations()
+        vote_condition = self.vote_roadCondition(road_condition3)
+        self.conditiondf['vote_roadCondition'] = vote_condition
+        self.conditiondf['vote_weatherCondition'] = self.vote_weatherCondition()
+        self.conditiondf.drop(columns=['road_condition', 'road_condition2', 'weather_condition'], inplace=True)
+        return self.conditiondf
+
+    def images_chunk(self, cameraPres):
+        """
+        Build the images of a list of camera presets (see build_dataset)
+        """
         cameraPresets = pd.DataFrame(cameraPres)
         cameraPresets.rename(columns={'id':'id_camera'}, inplace=True)
+        if 'measuredTime' not in cameraPresets:
+            cameraPresets['measuredTime'] = None
         cameraPresets['id_cameraStation'] = cameraPresets['id_camera'].apply(lambda x: x[:6])
         camera_dataset = cameraPresets.merge(self.cameraStations[['id_cameraStation', 'nearestWeatherStationId']],
                                              on="id_cameraStation", how='inner')
-        weather_group = self.weatherStations_map.groupby(by=['latitude', 'longitude'])
-        id1 = []
-        id2 = []
-        for ar in weather_group.indices.values():
-            ar = ar.tolist()
-            if len(ar) == 2:
-                id1.append(self.weatherStations_map.iloc[ar[0]]['weatherStationId'])
-                id2.append(self.weatherStations_map.iloc[ar[1]]['weatherStationId'])
-        road_condition3 = road_conditions_sameLocated_weatherStations()
-        vote_condition = self.vote_roadCondition(road_condition3)
-        self.conditiondf['vote_roadCondition'] = vote_condition
-        self.conditiondf['weather_condition'] = self.conditiondf['weather_condition'].replace({'Moderate': 'Mediocre', 'Light': 'Weak', 'Abundant': 'Heavy', 'Drizzle': 'Weak rain', 'Hails': 'Heavy snow/sleet', 'Dry': 'Clear', 'Snowfall': 'snow/sleet'})
-        self.conditiondf['weather_condition'] = self.conditiondf['weather_condition'].apply(weather_intensity)
-        vote_weather = self.vote_weatherCondition()
-        self.conditiondf['vote_weatherCondition'] = vote_weather
-        self.conditiondf.drop(columns=['road_condition', 'road_condition2', 'weather_condition'], inplace=True)
-        images_database = camera_dataset.merge(self.conditiondf, on='nearestWeatherStationId', how='inner')
+        images_database = camera_dataset.merge(self.station_votes(), on='nearestWeatherStationId', how='inner')
         images_database['measuredTime'] = pd.to_datetime(images_database['measuredTime'])
         images_database['vote_roadCondition'].fillna('undefined', inplace=True)
         images_database['vote_weatherCondition'].fillna('undefined', inplace=True)
+        images_database['image_name'] = image_names(images_database)
         images_database['measuredTime'].fillna('undefined', inplace=True)
-        images_database['image_name'] = images_database.apply(lambda x: "{}_r{}_w{}_{}".format(x['id_camera'], road_dic.get(x['vote_roadCondition'], 'nan'), weather_dic.get(x['vote_weatherCondition'], 'nan'), str(x['measuredTime']).replace(' ', '_').split('+')[0].replace(':', '-')), axis=1)
         return images_database
+
+    def dataset_chunks(self, chunk_size=None):
+        """
+        Generate the images database by chunks of camera presets: the conditions are voted once
+        per weather station, then the images of each chunk of camera stations are built when the
+        chunk is requested (the first images can be processed before the last ones are built)
+
+        Arguments:
+        chunk_size -- minimum number of camera presets per chunk (whole camera stations,
+                      None for a single chunk)
+
+        Return:
+        chunks -- generator of dataframes (see build_dataset)
+        """
+        cameraPres = []
+        for dico in self.data_camera['cameraStations']:
+            cameraPres.extend(dico['cameraPresets'])
+            if chunk_size is not None and len(cameraPres) >= chunk_size:
+                yield self.images_chunk(cameraPres)
+                cameraPres = []
+        if cameraPres or chunk_size is None:
+            yield self.images_chunk(cameraPres)
+
+    def build_dataset(self):
+        """
+        Generate 'images_database' dataframe that contains: information about the images(image_url,image_name), road condition, weather condition...
+
+        Return:
+        images_database -- dataframe
+        """
+        return next(self.dataset_chunks())
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only columnar dataset of the images and sensors databases (parquet files), stored with a
+storage backend (see storage.py) and partitioned by date and by station:
+    <prefix>/<table>/date=YYYY-MM-DD/bucket=NN/part-<time>-<id>.parquet
+The stations are hashed into STATION_BUCKETS buckets rather than having one directory each,
+a crawl then writes a few files per table instead of one tiny file per station.
+Queries only read the partitions matching the time range and stations (partition pruning)
+and the requested columns (column projection).
+"""
+# Import libraries
+import uuid
+import zlib
+import numbers
+import datetime
+from io import BytesIO
+import pandas as pd
+from utils import road_dic, weather_dic, typed_images
+
+TABLES = ['images', 'sensors']
+STATION_BUCKETS = 16
+# Column of each table used to partition by station
+station_columns = {'images': 'id_cameraStation', 'sensors': 'weatherStationId'}
+UNKNOWN_DATE = 'unknown' # partition of the rows without measuredTime
+
+
+def station_bucket(station):
+    """
+    Get the bucket of a station (camera station id or weather station id)
+    """
+    if isinstance(station, numbers.Number):
+        station = int(station)
+    return zlib.crc32(str(station).encode('utf-8')) % STATION_BUCKETS
+
+def camera_station(id_camera):
+    """
+    Get the camera station of a camera preset (same rule as TrafficCrawler.build_dataset)
+    """
+    return id_camera[:6]
+
+def parse_key(key):
+    """
+    Get the partition (date, bucket) of a file from its key
+    """
+    parts = dict(part.split('=', 1) for part in key.split('/') if '=' in part)
+    return parts.get('date'), int(parts.get('bucket', -1))
+
+
+class ColumnarDataset():
+    """
+    Partitioned parquet dataset of the images and sensors databases with a query API
+    """
+    def __init__(self, storage, prefix='dataset'):
+        """
+        Arguments:
+        storage -- storage backend where the files are saved (LocalStorage or S3Storage)
+        prefix -- prefix of the keys of the dataset
+        """
+        self.storage = storage
+        self.prefix = prefix
+
+    def table_prefix(self, table):
+        if table not in TABLES:
+            raise ValueError('unknown table {}, expected one of {}'.format(table, TABLES))
+        return '{}/{}/'.format(self.prefix, table)
+
+    def prepare_images(self, images_database):
+        """
+        Type the images database: measuredTime as UTC datetimes, condition codes as integers
+        """
+        return typed_images(images_database)
+
+    def append(self, table, df):
+        """
+        Append rows to a table, one new parquet file per partition
+
+        Arguments:
+        table -- 'images' (images database) or 'sensors' (sensors data)
+        df -- dataframe of the rows
+
+        Return:
+        keys -- list of the keys of the written files
+        """
+        prefix = self.table_prefix(table)
+        if df.empty:
+            return []
+        if table == 'images':
+            df = self.prepare_images(df)
+        dates = df['measuredTime'].dt.strftime('%Y-%m-%d').fillna(UNKNOWN_DATE)
+        buckets = df[station_columns[table]].map(station_bucket)
+        name = 'part-{}-{}.parquet'.format(datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S'),
+                                           uuid.uuid4().hex[:8])
+        keys = []
+        for (date, bucket), part in df.groupby([dates, buckets], sort=True):
+            key = '{}date={}/bucket={:02d}/{}'.format(prefix, date, bucket, name)
+            buffer = BytesIO()
+            part.to_parquet(buffer, compression='snappy', index=False)
+            self.storage.write(key, buffer.getvalue())
+            keys.append(key)
+        return keys
+
+    def partitions(self, table, start=None, end=None, buckets=None):
+        """
+        List the files of the partitions matching the time range and the station buckets
+
+        Arguments:
+        table -- 'images' or 'sensors'
+        start, end -- time range (UTC timestamps, None for an open range)
+        buckets -- set of the station buckets (None for every bucket)
+
+        Return:
+        keys -- list of the keys of the files
+        """
+        prefix = self.table_prefix(table)
+        if start is not None and end is not None:
+            # one listing per day of the range
+            days = pd.date_range(start.normalize(), end.normalize(), freq='D')
+            keys = [key for day in days
+                    for key in self.storage.list('{}date={}/'.format(prefix, day.strftime('%Y-%m-%d')))]
+        else:
+            keys = self.storage.list(prefix)
+        selected = []
+        for key in keys:
+            date, bucket = parse_key(key)
+            if date is None or not key.endswith('.parquet'):
+                continue
+            if date == UNKNOWN_DATE:
+                if start is not None or end is not None:
+                    continue
+            else:
+                day = pd.Timestamp(date, tz='UTC')
+                if (start is not None and day < start.normalize()) or (end is not None and day > end):
+                    continue
+            if buckets is not None and bucket not in buckets:
+                continue
+            selected.append(key)
+        return selected
+
+    def query(self, table, start=None, end=None, stations=None, cameras=None,
+              road_conditions=None, weather_conditions=None, columns=None):
+        """
+        Query a table
+
+        Arguments:
+        table -- 'images' or 'sensors'
+        start, end -- time range of measuredTime, bounds included (naive times are taken as UTC)
+        stations -- list of the stations (id_cameraStation for images, weatherStationId for sensors)
+        cameras -- list of the camera presets (id_camera, images only)
+        road_conditions -- list of the road conditions (codes or names, images only)
+        weather_conditions -- list of the weather conditions (codes or names, images only)
+        columns -- list of the columns to be returned (None for every column)
+
+        Return:
+        df -- dataframe of the matching rows
+        """
+        start = self.timestamp(start)
+        end = self.timestamp(end)
+        filters = {}
+        if stations is not None:
+            filters[station_columns[table]] = list(stations)
+        if cameras is not None:
+            filters['id_camera'] = list(cameras)
+        if road_conditions is not None:
+            filters['road_code'] = [road_dic.get(c, c) for c in road_conditions]
+        if weather_conditions is not None:
+            filters['weather_code'] = [weather_dic.get(c, c) for c in weather_conditions]
+        if table != 'images' and set(filters) - {station_columns[table]}:
+            raise ValueError('cameras and conditions filters are only available for images')
+        buckets = None
+        if stations is not None or cameras is not None:
+            candidates = list(stations or [])+[camera_station(c) for c in cameras or []]
+            buckets = {station_bucket(station) for station in candidates}
+        read_columns = None
+        if columns is not None:
+            read_columns = list(dict.fromkeys(list(columns)+list(filters)+
+                                              (['measuredTime'] if start or end else [])))
+        parts = []
+        for key in self.partitions(table, start, end, buckets):
+            part = pd.read_parquet(BytesIO(self.storage.read(key)), columns=read_columns)
+            mask = pd.Series(True, index=part.index)
+            if start is not None:
+                mask &= part['measuredTime'] >= start
+            if end is not None:
+                mask &= part['measuredTime'] <= end
+            for column, values in filters.items():
+                mask &= part[column].isin(values)
+            parts.append(part[mask])
+        if not parts:
+            return pd.DataFrame(columns=columns)
+        df = pd.concat(parts, ignore_index=True)
+        return df if columns is None else df[list(columns)]
+
+    @staticmethod
+    def timestamp(value):
+        if value is None:
+            return None
+        value = pd.Timestamp(value)
+        return value.tz_localize('UTC') if value.tzinfo is None else value.tz_convert('UTC')
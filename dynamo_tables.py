@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+Key design of the DynamoDB tables 'images_database' and 'sensors_database' and read helpers.
+
+images_database -- partition key id_camera, sort key measuredTime
+    station-time index: id_cameraStation / measuredTime
+    day-time index:     day (YYYY-MM-DD) / measuredTime
+    road-time index:    road_day (road condition code#day) / measuredTime
+    weather-time index: weather_day (weather condition code#day) / measuredTime
+sensors_database -- partition key sensor_key (weatherStationId#id_sensor), sort key measuredTime
+    station-time index: weatherStationId / measuredTime
+
+measuredTime is an ISO 8601 UTC string ('undefined' when it is missing), so the time ranges are
+sort key conditions ('undefined' sorts after every time: a range without end is bounded by
+MAX_TIME). The condition codes are combined with the day in the index keys, a code then
+does not put every image in one partition. The items without day or condition code are not in
+the corresponding indexes (sparse indexes).
+"""
+# Import libraries
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+import pandas as pd
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+from dynamo_writer import to_items
+from utils import road_dic, weather_dic, typed_images
+
+UNDEFINED_TIME = 'undefined'
+# Upper bound of the ranges without end, below UNDEFINED_TIME
+MAX_TIME = '9999'
+SCAN_SEGMENTS = 8
+
+# Keys and secondary indexes of the tables: name -> (partition key, sort key), attribute types
+tables = {
+    'images_database': {'key': ('id_camera', 'measuredTime'),
+                        'indexes': {'station-time': ('id_cameraStation', 'measuredTime'),
+                                    'day-time': ('day', 'measuredTime'),
+                                    'road-time': ('road_day', 'measuredTime'),
+                                    'weather-time': ('weather_day', 'measuredTime')},
+                        'types': {}},
+    'sensors_database': {'key': ('sensor_key', 'measuredTime'),
+                         'indexes': {'station-time': ('weatherStationId', 'measuredTime')},
+                         'types': {'weatherStationId': 'N'}}}
+
+
+def table_definition(table_name):
+    """
+    Arguments of create_table for a table (on demand capacity, indexes projecting every attribute)
+    """
+    table = tables[table_name]
+
+    def key_schema(partition_key, sort_key):
+        return [{'AttributeName': partition_key, 'KeyType': 'HASH'},
+                {'AttributeName': sort_key, 'KeyType': 'RANGE'}]
+
+    names = sorted({name for keys in [table['key']]+list(table['indexes'].values()) for name in keys})
+    return {'TableName': table_name, 'KeySchema': key_schema(*table['key']),
+            'AttributeDefinitions': [{'AttributeName': name, 'AttributeType': table['types'].get(name, 'S')}
+                                     for name in names],
+            'GlobalSecondaryIndexes': [{'IndexName': index, 'KeySchema': key_schema(*keys),
+                                        'Projection': {'ProjectionType': 'ALL'}}
+                                       for index, keys in table['indexes'].items()],
+            'BillingMode': 'PAY_PER_REQUEST'}
+
+def create_tables(dynamodb=None):
+    """
+    Create the tables (with their indexes) that do not exist yet
+
+    Return:
+    created -- list of the created tables
+    """
+    dynamodb = dynamodb or boto3.resource('dynamodb')
+    existing = set(dynamodb.meta.client.list_tables()['TableNames'])
+    created = []
+    for table_name in tables:
+        if table_name not in existing:
+            dynamodb.create_table(**table_definition(table_name)).wait_until_exists()
+            created.append(table_name)
+    return created
+
+def time_keys(column):
+    """
+    Convert measuredTime to sort keys: ISO 8601 UTC strings, 'undefined' when missing
+    """
+    times = pd.to_datetime(column, errors='coerce', utc=True)
+    return pd.Series([UNDEFINED_TIME if pd.isna(time) else time.isoformat() for time in times],
+                     index=column.index, dtype=object)
+
+def condition_days(codes, days):
+    """
+    Build the keys code#day of the condition indexes (None when the code or the day is missing)
+    """
+    return [None if pd.isna(code) or day is None else '{}#{}'.format(int(code), day)
+            for code, day in zip(codes, days)]
+
+def image_items(images_database):
+    """
+    Convert the images database to items: keys and attributes of the indexes added
+    (measuredTime as sort key, day, road_code, weather_code, road_day, weather_day)
+
+    Arguments:
+    images_database -- dataframe of the images (see TrafficCrawler.build_dataset)
+
+    Return:
+    items -- list of dictionaries (items)
+    """
+    images = typed_images(images_database)
+    images['measuredTime'] = time_keys(images['measuredTime'])
+    days = [None if time == UNDEFINED_TIME else time[:10] for time in images['measuredTime']]
+    images['day'] = days
+    images['road_day'] = condition_days(images['road_code'], days)
+    images['weather_day'] = condition_days(images['weather_code'], days)
+    return to_items(images)
+
+def sensor_items(sensors_data):
+    """
+    Convert the sensors data to items: partition key sensor_key (weatherStationId#id_sensor)
+    and measuredTime as sort key, a reading written twice overwrites the same item
+
+    Arguments:
+    sensors_data -- dataframe of the sensors readings
+
+    Return:
+    items -- list of dictionaries (items)
+    """
+    readings = sensors_data.copy()
+    readings['sensor_key'] = sensor_keys(readings)
+    readings['measuredTime'] = time_keys(readings['measuredTime'])
+    return to_items(readings)
+
+def sensor_keys(sensors_data):
+    """
+    Partition keys of the sensors readings: weatherStationId#id_sensor
+    """
+    return sensors_data['weatherStationId'].astype(str)+'#'+sensors_data['id_sensor'].astype(str)
+
+def time_bound(value):
+    """
+    Convert a bound of a time range to a sort key (naive times are taken as UTC)
+    """
+    if value is None:
+        return None
+    value = pd.Timestamp(value)
+    return (value.tz_localize('UTC') if value.tzinfo is None else value.tz_convert('UTC')).isoformat()
+
+def time_condition(condition, start, end):
+    """
+    Add the time range (bounds included) to a key condition
+    """
+    start, end = time_bound(start), time_bound(end)
+    if start is not None and end is not None:
+        return condition & Key('measuredTime').between(start, end)
+    if start is not None:
+        return condition & Key('measuredTime').between(start, MAX_TIME)
+    if end is not None:
+        return condition & Key('measuredTime').lte(end)
+    return condition
+
+
+class TableReader():
+    """
+    Read helpers of the tables: range queries on the keys and the indexes with pagination,
+    parallel segment scans as a fallback
+    """
+    def __init__(self, dynamodb=None, segments=SCAN_SEGMENTS, page_size=None):
+        """
+        Arguments:
+        dynamodb -- boto3 DynamoDB resource (created if None)
+        segments -- number of parallel segments of the scans
+        page_size -- maximum number of items read per query or scan request (None: up to 1MB per page)
+        """
+        self.dynamodb = dynamodb or boto3.resource('dynamodb')
+        self.segments = segments
+        self.page_size = page_size
+
+    def query_page(self, table_name, partition, start=None, end=None, index=None, filter_expression=None,
+                   limit=None, page=None, descending=False):
+        """
+        Query one page of the items of a partition in a time range
+
+        Arguments:
+        table_name -- 'images_database' or 'sensors_database'
+        partition -- (name, value) of the partition key of the table or of the index
+        start, end -- time range of measuredTime, bounds included (None for an open range)
+        index -- name of the index (None for the table)
+        filter_expression -- condition on the other attributes (boto3.dynamodb.conditions.Attr)
+        limit -- maximum number of items read
+        page -- key returned by the previous page (None for the first page)
+        descending -- if True the most recent items come first
+
+        Return:
+        items -- list of the items
+        next_page -- key of the next page (None if it was the last page)
+        """
+        arguments = {'KeyConditionExpression': time_condition(Key(partition[0]).eq(partition[1]), start, end),
+                     'ScanIndexForward': not descending}
+        if index is not None:
+            arguments['IndexName'] = index
+        if filter_expression is not None:
+            arguments['FilterExpression'] = filter_expression
+        if limit is not None:
+            arguments['Limit'] = limit
+        if page is not None:
+            arguments['ExclusiveStartKey'] = page
+        response = self.dynamodb.Table(table_name).query(**arguments)
+        return response['Items'], response.get('LastEvaluatedKey')
+
+    def query(self, table_name, partition, start=None, end=None, index=None, filter_expression=None,
+              descending=False):
+        """
+        Query every item of a partition in a time range (all the pages, see query_page). If the
+        index does not exist (table created before the indexes) the table is scanned instead.
+
+        Return:
+        items -- list of the items
+        """
+        items = []
+        page = None
+        try:
+            while True:
+                page_items, page = self.query_page(table_name, partition, start, end, index, filter_expression,
+                                                   limit=self.page_size, page=page, descending=descending)
+                items.extend(page_items)
+                if page is None:
+                    return items
+        except ClientError as e:
+            if index is None or e.response['Error']['Code'] not in ('ValidationException', 'ResourceNotFoundException'):
+                raise
+        condition = time_condition(Attr(partition[0]).eq(partition[1]), start, end)
+        if filter_expression is not None:
+            condition &= filter_expression
+        items = self.scan(table_name, condition)
+        return sorted(items, key=lambda item: item['measuredTime'], reverse=descending)
+
+    def scan(self, table_name, filter_expression=None):
+        """
+        Scan a table with parallel segments
+
+        Arguments:
+        table_name -- 'images_database' or 'sensors_database'
+        filter_expression -- condition on the attributes (boto3.dynamodb.conditions.Attr)
+
+        Return:
+        items -- list of the items
+        """
+        table = self.dynamodb.Table(table_name)
+
+        def scan_segment(segment):
+            arguments = {'Segment': segment, 'TotalSegments': self.segments}
+            if filter_expression is not None:
+                arguments['FilterExpression'] = filter_expression
+            if self.page_size is not None:
+                arguments['Limit'] = self.page_size
+            items = []
+            while True:
+                response = table.scan(**arguments)
+                items.extend(response['Items'])
+                if 'LastEvaluatedKey' not in response:
+                    return items
+                arguments['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        with ThreadPoolExecutor(max_workers=self.segments) as executor:
+            return [item for items in executor.map(scan_segment, range(self.segments)) for item in items]
+
+    def camera_images(self, id_camera, start=None, end=None, descending=False):
+        """
+        Images of a camera preset in a time range
+        """
+        return self.query('images_database', ('id_camera', id_camera), start, end, descending=descending)
+
+    def station_images(self, id_cameraStation, start=None, end=None, descending=False):
+        """
+        Images of the presets of a camera station in a time range
+        """
+        return self.query('images_database', ('id_cameraStation', id_cameraStation), start, end,
+                          index='station-time', descending=descending)
+
+    def images(self, start, end, road_condition=None, weather_condition=None):
+        """
+        Images of every camera in a time range (one query per day), optionally with a road and/or
+        weather condition (see utils.road_dic and utils.weather_dic)
+
+        Arguments:
+        start, end -- time range of measuredTime, bounds included
+        road_condition, weather_condition -- voted conditions (e.g. 'Wet', 'Heavy snow/sleet')
+
+        Return:
+        items -- list of the items sorted by measuredTime
+        """
+        index, name, code, filter_expression = 'day-time', 'day', None, None
+        if road_condition is not None:
+            index, name, code = 'road-time', 'road_day', road_dic[road_condition]
+            if weather_condition is not None:
+                filter_expression = Attr('weather_code').eq(weather_dic[weather_condition])
+        elif weather_condition is not None:
+            index, name, code = 'weather-time', 'weather_day', weather_dic[weather_condition]
+        days = pd.date_range(pd.Timestamp(time_bound(start)).normalize(),
+                             pd.Timestamp(time_bound(end)).normalize(), freq='D')
+        items = []
+        for day in days:
+            value = day.strftime('%Y-%m-%d') if code is None else '{}#{}'.format(code, day.strftime('%Y-%m-%d'))
+            items.extend(self.query('images_database', (name, value), start, end, index=index,
+                                    filter_expression=filter_expression))
+        return items
+
+    def sensor_readings(self, weatherStationId, id_sensor, start=None, end=None, descending=False):
+        """
+        Readings of a sensor of a weather station in a time range
+        """
+        return self.query('sensors_database', ('sensor_key', '{}#{}'.format(weatherStationId, id_sensor)),
+                          start, end, descending=descending)
+
+    def station_readings(self, weatherStationId, start=None, end=None, descending=False):
+        """
+        Readings of every sensor of a weather station in a time range
+        """
+        return self.query('sensors_database', ('weatherStationId', weatherStationId), start, end,
+                          index='station-time', descending=descending)
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+DynamoDB writer shared by the lambda functions 'LambdaTraffic' and 'LambdaTrafficSensors'.
+Items are sent by batches of 25 from a pool of threads, unprocessed items and throttled
+requests are retried with exponential backoff and jitter, and the write rate adapts to the
+provisioned capacity of the table.
+"""
+# Import libraries
+import time
+import math
+import queue
+import random
+import threading
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+import botocore
+import pandas as pd
+
+BATCH_SIZE = 25 # maximum number of items of a BatchWriteItem request
+WORKERS = 8
+MAX_RETRIES = 8
+BASE_DELAY = 0.05 # in seconds
+MAX_DELAY = 5 # in seconds
+FLUSH_DELAY = 0.05 # in seconds, wait for more items before sending an incomplete batch (write_from)
+# Errors of a whole request that are worth retrying
+RETRYABLE_ERRORS = ['ProvisionedThroughputExceededException', 'ThrottlingException',
+                    'RequestLimitExceeded', 'InternalServerError', 'ServiceUnavailable']
+
+
+class RateLimiter():
+    """
+    Token bucket (items per second) shared by the writer threads.
+    With adapt=True the rate is decreased when a request is throttled (at most once per
+    second, the threads report the same congestion) and increased again (up to max_rate)
+    while requests succeed.
+    """
+    decrease = 0.7
+    min_rate = BATCH_SIZE
+    cooldown = 1 # in seconds
+
+    def __init__(self, rate=None, max_rate=None, adapt=True):
+        """
+        Arguments:
+        rate -- initial rate in items per second (None: unlimited until the first throttling)
+        max_rate -- maximum rate in items per second (None: no maximum)
+        adapt -- if the rate adapts to throttling
+        """
+        self.rate = rate
+        self.max_rate = max_rate
+        self.adapt = adapt
+        self.tokens = rate or 0
+        self.last = time.monotonic()
+        self.last_decrease = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, count):
+        """
+        Wait until count items can be written
+        """
+        while True:
+            with self.lock:
+                if self.rate is None:
+                    return
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens+(now-self.last)*self.rate)
+                self.last = now
+                if self.tokens >= min(count, self.rate):
+                    self.tokens -= count
+                    return
+                wait = (min(count, self.rate)-self.tokens)/self.rate
+            time.sleep(wait)
+
+    def throttled(self, throughput):
+        """
+        Decrease the rate after a throttling
+
+        Arguments:
+        throughput -- items per second measured so far (used if the rate was unlimited)
+        """
+        if not self.adapt:
+            return
+        with self.lock:
+            now = time.monotonic()
+            if now-self.last_decrease < self.cooldown:
+                return
+            self.last_decrease = now
+            rate = self.rate if self.rate is not None else throughput
+            self.rate = max(rate*self.decrease, self.min_rate)
+            self.tokens = min(self.tokens, self.rate)
+
+    def succeeded(self, count):
+        """
+        Increase the rate after a successful request
+        """
+        if not self.adapt or self.rate is None:
+            return
+        with self.lock:
+            self.rate += count/10
+            if self.max_rate is not None:
+                self.rate = min(self.rate, self.max_rate)
+
+
+class DynamoWriter():
+    """
+    Write items into a DynamoDB table with a pool of threads
+    """
+    def __init__(self, table_name, workers=WORKERS, max_retries=MAX_RETRIES, rate=None,
+                 adapt=True, dynamodb=None):
+        """
+        Arguments:
+        table_name -- name of the DynamoDB table to be filled
+        workers -- number of writer threads
+        max_retries -- maximum number of retries of a batch
+        rate -- maximum write rate in items per second (None: the provisioned write capacity of
+                the table, unlimited for on-demand tables)
+        adapt -- if the write rate adapts to throttling
+        dynamodb -- boto3 DynamoDB resource (created if None)
+        """
+        self.table_name = table_name
+        self.workers = workers
+        self.max_retries = max_retries
+        dynamodb = dynamodb or boto3.resource('dynamodb')
+        # the resource client serializes python items, clients are thread safe
+        self.client = dynamodb.meta.client
+        if rate is None:
+            rate = self.provisioned_capacity()
+        self.limiter = RateLimiter(rate, max_rate=rate, adapt=adapt)
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.failed_items = []
+
+    def provisioned_capacity(self):
+        """
+        Get the provisioned write capacity of the table (None for on-demand tables)
+        """
+        try:
+            table = self.client.describe_table(TableName=self.table_name)['Table']
+        except botocore.exceptions.ClientError:
+            return None
+        if table.get('BillingModeSummary', {}).get('BillingMode') == 'PAY_PER_REQUEST':
+            return None
+        return table.get('ProvisionedThroughput', {}).get('WriteCapacityUnits') or None
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.metrics[name] += value
+
+    def backoff(self, attempt):
+        """
+        Sleep before a retry: exponential backoff with full jitter
+        """
+        self.count('retries')
+        time.sleep(random.uniform(0, min(MAX_DELAY, BASE_DELAY*2**attempt)))
+
+    def write_batch(self, items):
+        """
+        Write a batch of items (at most 25), retrying unprocessed items
+        """
+        requests = [{'PutRequest': {'Item': item}} for item in items]
+        attempt = 0
+        while requests:
+            self.limiter.acquire(len(requests))
+            try:
+                response = self.client.batch_write_item(RequestItems={self.table_name: requests})
+            except botocore.exceptions.ClientError as exc:
+                if exc.response['Error']['Code'] not in RETRYABLE_ERRORS or attempt >= self.max_retries:
+                    raise
+                self.count('throttled')
+                self.limiter.throttled(self.throughput())
+                self.backoff(attempt)
+                attempt += 1
+                continue
+            unprocessed = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            self.count('written', len(requests)-len(unprocessed))
+            self.limiter.succeeded(len(requests)-len(unprocessed))
+            requests = unprocessed
+            if requests:
+                if attempt >= self.max_retries:
+                    break
+                self.count('unprocessed', len(requests))
+                self.limiter.throttled(self.throughput())
+                self.backoff(attempt)
+                attempt += 1
+        return [request['PutRequest']['Item'] for request in requests]
+
+    def write_shard(self, batches):
+        """
+        Write the batches of a shard (one writer thread)
+        """
+        failed = []
+        for batch in batches:
+            try:
+                failed.extend(self.write_batch(batch))
+            except botocore.exceptions.ClientError as exc:
+                self.count('errors')
+                print('batch of {} items not written: {}'.format(len(batch), exc))
+                failed.extend(batch)
+        return failed
+
+    def throughput(self):
+        return self.metrics['written']/max(time.monotonic()-self.start, 1e-3)
+
+    def write(self, items):
+        """
+        Write items into the table
+
+        Arguments:
+        items -- list of dictionaries (items)
+
+        Return:
+        metrics -- dictionary: numbers of items, written, failed, retries, throttled requests,
+        unprocessed items (retried), errors, duration (seconds) and items_per_sec
+        """
+        self.reset(len(items))
+        batches = [items[i:i+BATCH_SIZE] for i in range(0, len(items), BATCH_SIZE)]
+        shards = [batches[i::self.workers] for i in range(self.workers)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            self.failed_items = [item for failed in executor.map(self.write_shard, shards) for item in failed]
+        return self.summary()
+
+    def reset(self, items=0):
+        self.metrics = {'items': items, 'written': 0, 'failed': 0, 'retries': 0,
+                        'throttled': 0, 'unprocessed': 0, 'errors': 0}
+        self.start = time.monotonic()
+
+    def summary(self):
+        self.metrics['failed'] = len(self.failed_items)
+        self.metrics['duration'] = round(time.monotonic()-self.start, 3)
+        self.metrics['items_per_sec'] = round(self.throughput(), 1)
+        return dict(self.metrics)
+
+    def next_batch(self, items_queue):
+        """
+        Take a batch from a queue: wait for the first item, then for more items while the batch
+        is incomplete (at most FLUSH_DELAY between two items)
+
+        Return:
+        batch -- list of items (empty at the end of the stream)
+        done -- True if the end of the stream (None) was received
+        """
+        batch = []
+        while len(batch) < BATCH_SIZE:
+            try:
+                item = items_queue.get(timeout=FLUSH_DELAY) if batch else items_queue.get()
+            except queue.Empty:
+                return batch, False
+            if item is None:
+                # left in the queue for the other writer threads
+                items_queue.put(None)
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def write_from(self, items_queue):
+        """
+        Write the items of a queue as they arrive, until None is put in the queue: each writer
+        thread sends a batch as soon as it has 25 items or no more items come in FLUSH_DELAY.
+        The producer is slowed down by a bounded queue when the writes fall behind.
+
+        Arguments:
+        items_queue -- queue.Queue of items (dictionaries), None at the end of the stream
+
+        Return:
+        metrics -- dictionary of the writing metrics (see write)
+        """
+        self.reset()
+
+        def consume():
+            failed = []
+            done = False
+            while not done:
+                batch, done = self.next_batch(items_queue)
+                if batch:
+                    self.count('items', len(batch))
+                    try:
+                        failed.extend(self.write_shard([batch]))
+                    except Exception as exc:
+                        # the thread keeps consuming: a stopped consumer would block the producer
+                        self.count('errors')
+                        print('batch of {} items not written: {}'.format(len(batch), exc))
+                        failed.extend(batch)
+            return failed
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(consume) for _ in range(self.workers)]
+            self.failed_items = [item for future in futures for item in future.result()]
+        return self.summary()
+
+def column_values(column):
+    """
+    Convert a column to DynamoDB native values: Decimal for numbers (DynamoDB Number),
+    bool, str (datetimes in ISO 8601), None for missing values (attribute not written)
+    """
+    values = column.tolist()
+    if pd.api.types.is_bool_dtype(column):
+        return values
+    if pd.api.types.is_numeric_dtype(column):
+        # repr gives the shortest string that round trips the float (0.1 -> Decimal('0.1'))
+        return [None if pd.isna(v) or not math.isfinite(v) else Decimal(repr(v)) for v in values]
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return [v.isoformat() if not pd.isna(v) else None for v in values]
+    return [v if isinstance(v, (str, bool)) else None if pd.isna(v) else str(v) for v in values]
+
+def to_items(df):
+    """
+    Convert a dataframe to a list of items with native DynamoDB types
+    (missing values are not written, DynamoDB does not support NaN)
+
+    Arguments:
+    df -- dataframe
+
+    Return:
+    items -- list of dictionaries (items)
+    """
+    names = df.columns.tolist()
+    columns = [column_values(df[name]) for name in names]
+    return [{name: value for name, value in zip(names, row) if value is not None}
+            for row in zip(*columns)]
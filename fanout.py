@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Sharded fan-out of the 'LambdaTraffic' crawl: a coordinator downloads the json files and runs
+TrafficCrawler.build_dataset once, then partitions the images to download by camera station
+into shards processed by parallel workers (image transfers, DynamoDB and dataset writes), and
+the results and failures of the shards are merged into one run summary.
+
+The shards and their results go through the storage ('shards/<run_id>/'), so the workers can be
+a pool of processes on this machine (run_local) or the iterations of a Step Functions Map state
+(start_handler -> shard_handler -> merge_handler, see state_machine).
+
+Usage:
+python fanout.py --root ./data --shards 4 --dynamodb-endpoint http://localhost:8000
+python fanout.py --state-machine START_ARN SHARD_ARN MERGE_ARN
+"""
+# Import libraries
+import sys
+import json
+import heapq
+import pickle
+import argparse
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import boto3
+import handler
+from storage import LocalStorage
+from station_cache import StationCache
+from instrumentation import StageRecorder
+
+DEFAULT_SHARDS = 4
+SHARDS_PREFIX = 'shards/'
+# Metrics of the DynamoDB writes summed over the shards
+writer_counters = ['items', 'written', 'failed', 'retries', 'throttled', 'unprocessed', 'errors']
+
+
+def partition_images(images_database, shards):
+    """
+    Partition the images by camera station into balanced shards: the stations (largest number of
+    presets first) are assigned to the least loaded shard
+
+    Arguments:
+    images_database -- dataframe of the images (id_cameraStation)
+    shards -- number of shards
+
+    Return:
+    partitions -- list of shards dataframes (some can be empty)
+    """
+    presets = images_database.groupby('id_cameraStation', sort=True).size()
+    presets = presets.sort_values(ascending=False, kind='mergesort')
+    loads = [(0, shard) for shard in range(shards)]
+    assignment = {}
+    for station, count in presets.items():
+        load, shard = heapq.heappop(loads)
+        assignment[station] = shard
+        heapq.heappush(loads, (load+count, shard))
+    shard_ids = images_database['id_cameraStation'].map(assignment)
+    return [images_database[shard_ids == shard] for shard in range(shards)]
+
+def shard_key(run_id, shard, ext):
+    return '{}{}/shard-{:03d}.{}'.format(SHARDS_PREFIX, run_id, shard, ext)
+
+def start(event, recorder, storage, cache, shards=DEFAULT_SHARDS):
+    """
+    Coordinator: download the json files, build the images database once, save the shards of
+    the images to download and the sensors data
+
+    Arguments:
+    event -- options of the run (see handler.scrape)
+    recorder -- StageRecorder of the run
+    storage -- storage of the crawler files
+    cache -- StationCache of the station feeds
+    shards -- number of shards
+
+    Return:
+    run -- dictionary: run_id, event, number of images and of skipped images (same measuredTime),
+    shards (list of tasks: run_id, shard, key, images)
+    """
+    images_database, new_sensors_data, archiving = handler.prepare_crawl(event, recorder, storage, cache)
+    with recorder.stage('partition') as stage:
+        manifest = {} if event.get('full_crawl') else handler.load_manifest(storage)
+        unchanged = handler.unchanged_images(images_database, manifest)
+        run_id = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%S')
+        tasks = []
+        for shard, images in enumerate(partition_images(images_database[~unchanged], shards)):
+            if images.empty:
+                continue
+            # validators of the last saved images, used for the conditional requests
+            validators = {id_camera: manifest[id_camera] for id_camera in images['id_camera'] if id_camera in manifest}
+            key = shard_key(run_id, shard, 'pkl')
+            storage.write(key, pickle.dumps({'images': images, 'manifest': validators}))
+            tasks.append({'run_id': run_id, 'shard': shard, 'key': key, 'images': len(images)})
+        stage.count(items=len(tasks))
+    handler.upload_sensors(recorder, storage, new_sensors_data)
+    handler.finish_archive(recorder, archiving)
+    return {'run_id': run_id, 'event': event, 'images': len(images_database),
+            'skipped': int(unchanged.sum()), 'shards': tasks}
+
+def process_shard(task, event, storage, dynamodb=None):
+    """
+    Worker: download the images of a shard and write the saved ones to DynamoDB (and to the
+    parquet dataset), the result of the shard is saved next to it in the storage
+
+    Arguments:
+    task -- task of the shard (see start)
+    event -- options of the run (see handler.scrape)
+    storage -- storage of the crawler files
+    dynamodb -- boto3 DynamoDB resource (created by the writer if None)
+
+    Return:
+    result -- dictionary: shard, number of images, not_modified, saved and failed
+    """
+    recorder = StageRecorder('shard')
+    try:
+        shard = pickle.loads(storage.read(task['key']))
+        images, manifest = shard['images'], shard['manifest']
+        with recorder.stage('image_pipeline') as stage:
+            saved_images, counts, metrics = handler.stream_images(event, storage, [images], manifest, dynamodb)
+            stage.count(items=len(images), errors=counts['failed'])
+        print(json.dumps({'images_database': metrics}))
+        handler.append_dataset(event, recorder, storage, saved_images)
+        result = {'shard': task['shard'], 'images': len(images)}
+        result.update({key: counts[key] for key in ['not_modified', 'saved', 'failed']})
+        storage.write(shard_key(task['run_id'], task['shard'], 'json'),
+                      json.dumps(dict(result, manifest=manifest, images_database=metrics)))
+    finally:
+        recorder.finish()
+    return result
+
+def merge(run, recorder, storage, errors=None):
+    """
+    Merge the results of the shards: update the manifest, sum the counts and the DynamoDB
+    metrics and delete the shards files. The images of a shard without result are counted as
+    failed (their manifest entries are not updated, so they are retried at the next run).
+
+    Arguments:
+    run -- run returned by start
+    recorder -- StageRecorder of the run
+    storage -- storage of the crawler files
+    errors -- dictionary shard: error message of the failed shards
+
+    Return:
+    summary -- dictionary of the number of images: skipped, not_modified, saved and failed,
+    number of shards and failed shards, errors and DynamoDB metrics
+    """
+    errors = dict(errors or {})
+    with recorder.stage('merge') as stage:
+        manifest = {} if run['event'].get('full_crawl') else handler.load_manifest(storage)
+        summary = {'images': run['images'], 'skipped': run['skipped'], 'not_modified': 0, 'saved': 0, 'failed': 0}
+        metrics = dict.fromkeys(writer_counters, 0)
+        for task in run['shards']:
+            data = storage.read(shard_key(run['run_id'], task['shard'], 'json'))
+            if data is None:
+                summary['failed'] += task['images']
+                errors.setdefault(task['shard'], 'no result')
+                continue
+            result = json.loads(data)
+            manifest.update(result['manifest'])
+            for key in ['not_modified', 'saved', 'failed']:
+                summary[key] += result[key]
+            for key in writer_counters:
+                metrics[key] += result['images_database'].get(key, 0)
+        handler.save_manifest(storage, manifest)
+        storage.delete_many(storage.list(SHARDS_PREFIX+run['run_id']+'/'))
+        summary.update({'shards': len(run['shards']), 'failed_shards': len(errors),
+                        'errors': {str(shard): error for shard, error in sorted(errors.items())},
+                        'images_database': metrics})
+        stage.count(items=len(run['shards']), errors=len(errors))
+    print(json.dumps(summary))
+    return summary
+
+def local_shard(task, event, storage, dynamodb_options=None):
+    """
+    Process a shard in a worker process (the DynamoDB resource is created in the process)
+    """
+    dynamodb = boto3.resource('dynamodb', **dynamodb_options) if dynamodb_options else None
+    return process_shard(task, event, storage, dynamodb)
+
+def run_local(event, storage, shards=DEFAULT_SHARDS, workers=None, cache=None, dynamodb_options=None):
+    """
+    Run the fan-out on this machine: the coordinator in this process and the shards in a pool of processes
+
+    Arguments:
+    event -- options of the run (see handler.scrape)
+    storage -- storage of the crawler files (LocalStorage: it is handed to the worker processes)
+    shards -- number of shards
+    workers -- number of worker processes (default: one per shard)
+    cache -- StationCache of the station feeds (default: persisted in the storage)
+    dynamodb_options -- arguments of boto3.resource('dynamodb') in the workers (endpoint_url, region_name)
+
+    Return:
+    summary -- summary of the run (see merge)
+    """
+    recorder = StageRecorder('fanout')
+    try:
+        run = start(event, recorder, storage, cache or StationCache(storage), shards)
+        errors = {}
+        with recorder.stage('shards') as stage:
+            # spawned (not forked) workers: the HTTP and AWS connection pools are not shared
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(workers or max(len(run['shards']), 1), mp_context=context) as executor:
+                futures = {executor.submit(local_shard, task, run['event'], storage, dynamodb_options): task['shard']
+                           for task in run['shards']}
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        errors[futures[future]] = '{}: {}'.format(type(e).__name__, e)
+            stage.count(items=len(futures), errors=len(errors))
+        return merge(run, recorder, storage, errors)
+    finally:
+        recorder.finish()
+
+def start_handler(event, context):
+    """
+    Handler of the lambda function of the 'Start' state (coordinator), optional event key
+    shards (number of shards) besides the ones of handler.scrape
+    """
+    event = event or {}
+    recorder = StageRecorder('fanout_start')
+    try:
+        return start(event, recorder, handler.bucket_storage, handler.station_cache,
+                     int(event.get('shards', DEFAULT_SHARDS)))
+    finally:
+        recorder.finish()
+
+def shard_handler(event, context):
+    """
+    Handler of the lambda function of the 'Shard' state (iteration of the Map state): {task, event}
+    """
+    return process_shard(event['task'], event['event'], handler.bucket_storage)
+
+def merge_handler(event, context):
+    """
+    Handler of the lambda function of the 'Merge' state: the run with the results of the Map state
+    """
+    errors = {result['task']['shard']: result['error'].get('Cause', result['error'].get('Error'))
+              for result in event.get('results', []) if 'error' in result}
+    recorder = StageRecorder('fanout_merge')
+    try:
+        return merge(event, recorder, handler.bucket_storage, errors)
+    finally:
+        recorder.finish()
+
+def state_machine(start_arn, shard_arn, merge_arn, max_concurrency=DEFAULT_SHARDS):
+    """
+    Step Functions definition (Amazon States Language) of the fan-out: Start -> Map of Shard -> Merge,
+    a failed shard is caught and reported to the merge
+
+    Arguments:
+    start_arn, shard_arn, merge_arn -- ARNs of the lambda functions of start_handler, shard_handler and merge_handler
+    max_concurrency -- maximum number of shards processed at the same time (0: no limit)
+
+    Return:
+    definition -- dictionary (to be dumped as json)
+    """
+    retry = [{'ErrorEquals': ['Lambda.ServiceException', 'Lambda.TooManyRequestsException'],
+              'IntervalSeconds': 2, 'MaxAttempts': 3, 'BackoffRate': 2}]
+    return {'Comment': 'Sharded fan-out of the LambdaTraffic crawl',
+            'StartAt': 'Start',
+            'States': {
+                'Start': {'Type': 'Task', 'Resource': start_arn, 'Retry': retry, 'Next': 'Shards'},
+                'Shards': {'Type': 'Map', 'ItemsPath': '$.shards', 'MaxConcurrency': max_concurrency,
+                           'Parameters': {'task.$': '$$.Map.Item.Value', 'event.$': '$.event'},
+                           'Iterator': {'StartAt': 'Shard', 'States': {
+                               'Shard': {'Type': 'Task', 'Resource': shard_arn, 'Retry': retry,
+                                         'Catch': [{'ErrorEquals': ['States.ALL'], 'ResultPath': '$.error',
+                                                    'Next': 'ShardFailed'}],
+                                         'End': True},
+                               'ShardFailed': {'Type': 'Pass', 'End': True}}},
+                           'ResultPath': '$.results', 'Next': 'Merge'},
+                'Merge': {'Type': 'Task', 'Resource': merge_arn, 'Retry': retry, 'End': True}}}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--root', default='data', help='directory of the local storage')
+    parser.add_argument('--shards', type=int, default=DEFAULT_SHARDS, help='number of shards')
+    parser.add_argument('--workers', type=int, help='number of worker processes (default: one per shard)')
+    parser.add_argument('--dynamodb-endpoint', help='url of a DynamoDB compatible server')
+    parser.add_argument('--region', default='eu-central-1')
+    parser.add_argument('--event', type=json.loads, default={}, help='options of the crawl (json)')
+    parser.add_argument('--state-machine', nargs=3, metavar=('START_ARN', 'SHARD_ARN', 'MERGE_ARN'),
+                        help='print the Step Functions definition and exit')
+    args = parser.parse_args()
+
+    if args.state_machine:
+        print(json.dumps(state_machine(*args.state_machine, max_concurrency=args.shards), indent=2))
+        return 0
+    dynamodb_options = {'endpoint_url': args.dynamodb_endpoint, 'region_name': args.region}
+    summary = run_local(args.event, LocalStorage(args.root), args.shards, args.workers,
+                        dynamodb_options=dynamodb_options)
+    return 1 if summary['failed_shards'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
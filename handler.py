@@ -4,25 +4,100 @@ Handler of the lambda function 'LambdaTraffic'.
 """
 # Import libraries
 from __future__ import print_function
-from io import StringIO
-import sys
+from io import BytesIO
+import os
+import gzip
 import pickle
 import json
-import uuid
-from urllib.request import urlopen
-from bs4 import BeautifulSoup
+import queue
+import datetime
+from concurrent.futures import ThreadPoolExecutor
 import requests
+import requests.adapters
+import pandas as pd
 import boto3
+import boto3.s3.transfer
 import botocore
 import botocore.config
-from data_processing import *
+from data_processing import TrafficCrawler
+from storage import S3Storage
+from instrumentation import StageRecorder, profiled
+from dynamo_writer import DynamoWriter
+from dynamo_tables import image_items
+from station_cache import StationCache, STATION_FEEDS
 
 
 jsons = ['camera-data', 'camera-stations', 'road-conditions',
          'weather-data', 'forecast-sections', 'weather-stations']
+# Json files that are not used to build the databases (only downloaded to be archived)
+unused_jsons = ['road-conditions', 'forecast-sections']
 
-cfg = botocore.config.Config(retries={'max_attempts': 0})
+# Image transfer settings (can be overridden by the 'max_workers' and 'timeout' event keys)
+MAX_WORKERS = 32
+REQUEST_TIMEOUT = 30 # in seconds
+# Streaming pipeline of the images (can be overridden by the 'chunk_size' and 'queue_size' event keys):
+# camera presets per chunk of the images database, images waiting in each queue
+DATASET_CHUNK = 500
+QUEUE_SIZE = 256
+# Size of the chunks streamed from the http response to s3 (5MB is the minimal multipart part size),
+# each transfer holds at most one chunk in memory
+CHUNK_SIZE = 5*1024*1024
+# Manifest of the last saved image of each camera preset (measuredTime, ETag, Last-Modified)
+MANIFEST_KEY = 'images_manifest.json'
+# Sensors data handed to 'LambdaTrafficSensors' (parquet file: typed columns, snappy compressed)
+SENSORS_KEY = 'sensors_data.parquet'
+
+cfg = botocore.config.Config(retries={'max_attempts': 0}, max_pool_connections=MAX_WORKERS,
+                             connect_timeout=REQUEST_TIMEOUT, read_timeout=REQUEST_TIMEOUT)
 client = boto3.client('s3', config=cfg)
+# Transfers are already parallelized by the download workers: one thread and one chunk per transfer
+transfer_config = boto3.s3.transfer.TransferConfig(multipart_threshold=CHUNK_SIZE,
+                                                   multipart_chunksize=CHUNK_SIZE,
+                                                   max_io_queue=1, use_threads=False)
+
+def mount_pool(session, pool_size):
+    """
+    Mount a connection pool of pool_size connections per host on a HTTP session (replaces the
+    previous pool)
+    """
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.pool_size = pool_size
+
+def make_session(pool_size):
+    """
+    Create a keep-alive HTTP session shared by the download workers
+
+    Arguments:
+    pool_size -- maximum number of pooled connections per host
+
+    Return:
+    session -- requests session
+    """
+    session = requests.Session()
+    mount_pool(session, pool_size)
+    return session
+
+def grow_pools(storage, pool_size):
+    """
+    Grow the connection pools of the HTTP session and of the storage client to the number of
+    download workers (created for MAX_WORKERS, the event can ask for more workers)
+    """
+    if session.pool_size < pool_size:
+        mount_pool(session, pool_size)
+    storage.grow_pool(pool_size)
+
+session = make_session(MAX_WORKERS)
+# Storage of the crawler files (images, manifest, sensors data, archives)
+bucket_storage = S3Storage(client, 'reconai-traffic', transfer_config)
+# Parsed station feeds, kept in memory while the lambda container is warm and persisted in s3
+station_cache = StationCache(bucket_storage)
+# Single background thread archiving the json files while the images are processed
+archiver = ThreadPoolExecutor(max_workers=1)
+# Segment archives of the snapshots (see snapshot_archive.py) kept open by root directory
+snapshot_archives = {}
+SNAPSHOTS_DIR = 'snapshots'
 
 def file_checker(client, bucket, key):
     try:
@@ -33,75 +108,259 @@ def file_checker(client, bucket, key):
             return False
         else:
             raise
-def make_soup(url):
-    html = urlopen(url).read()
-    return BeautifulSoup(html, "lxml")
+def make_soup(url, timeout=REQUEST_TIMEOUT):
+    # bs4 (and lxml) are only imported when the page is parsed
+    from bs4 import BeautifulSoup
+    with session.get(url, timeout=timeout) as r:
+        r.raise_for_status()
+        return BeautifulSoup(r.content, "lxml")
 
-def save_file_to_s3(bucket, file_name, ext, urlfile):
+def save_file_to_s3(storage, file_name, ext, urlfile, timeout=REQUEST_TIMEOUT, validators=None):
     """
     Download files (Json and Images)
 
     Arguments:
-    bucket -- s3 bucket name where to save file
+    storage -- storage where to save file (see storage.py, s3 bucket 'reconai-traffic' for the lambda)
     ext -- the extension of the file
     file_name -- the name of downloaded file
-    path -- the path where to save the file
+    urlfile -- the link used for downloading the file
+    timeout -- timeout of the http request in seconds
+    validators -- dictionary (etag, last_modified) of the previously saved version of the file,
+    used to send a conditional request
+
+    Return:
+    result -- dictionary: status ('saved', 'not_modified' or 'failed'), etag and last_modified
+    of the downloaded file and error message (None if the file is saved)
     """
+    headers = {}
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
     try:
-        r = requests.get(urlfile, stream=True)
-        r.raw.decode_content = True
-        if ext == 'json':
-            client.put_object(Body=pickle.dumps(r.json()), Bucket=bucket, Key=file_name+'.'+ext)
-        else:
-            client.put_object(Body=r.content, Bucket=bucket, Key='images/'+file_name+'.'+ext)
+        with session.get(urlfile, stream=True, timeout=timeout, headers=headers) as r:
+            if r.status_code == 304:
+                return {'status': 'not_modified', 'etag': r.headers.get('ETag', validators.get('etag')),
+                        'last_modified': r.headers.get('Last-Modified', validators.get('last_modified')),
+                        'error': None}
+            r.raise_for_status()
+            r.raw.decode_content = True
+            if ext == 'json':
+                storage.write(file_name+'.'+ext, pickle.dumps(r.json()))
+            else:
+                # stream the response body to the storage chunk by chunk instead of buffering it
+                storage.write_stream('images/'+file_name+'.'+ext, r.raw)
+            return {'status': 'saved', 'etag': r.headers.get('ETag'),
+                    'last_modified': r.headers.get('Last-Modified'), 'error': None}
     except Exception as e:
-        exc_type, exc_obj, exc_tb = sys.exc_info()
-        print('url_file', urlfile)
-        print("Oups!!!! an exception: ", e, exc_type, exc_tb.tb_lineno)
+        return {'status': 'failed', 'etag': None, 'last_modified': None,
+                'error': '{}: {}'.format(type(e).__name__, e)}
 
-def batch_write(table_name, items, add_key=False):
+def stream_images(event, storage, chunks, manifest, dynamodb=None):
     """
-    write list of items dictionaries into a DynamoDB table
+    Streaming pipeline of the images: the images of each chunk of the images database that
+    changed since the manifest are queued for a pool of download threads, and each saved image
+    is queued for the DynamoDB writer threads as soon as its transfer succeeds. Both queues are
+    bounded: a slow stage blocks the stages feeding it (backpressure), so only the images in
+    flight are held as items, and the chunks are only built when there is room in the queue.
 
     Arguments:
-    table_name -- name of the DynamoDB table to be filled
-    items -- list of dictionaries (items)
-    add_key -- if a generated primary key need to be added to the items
+    event -- options of the run (max_workers, timeout, queue_size, dataset)
+    storage -- storage where to save the images
+    chunks -- iterable of dataframes of the images (see TrafficCrawler.dataset_chunks)
+    manifest -- dictionary of the last saved image of each camera preset (see load_manifest),
+    its validators are used to send conditional requests (updated in place)
+    dynamodb -- boto3 DynamoDB resource (created by the writer if None)
+
+    Return:
+    saved_images -- dataframe of the saved images, only kept for the parquet dataset (None if the
+    event key dataset is not set: the rows are not held until the end of the run)
+    counts -- dictionary of the number of images: images, skipped, not_modified, saved (and written
+    to DynamoDB) and failed (transfer or DynamoDB write)
+    metrics -- dictionary of the writing metrics (see dynamo_writer.DynamoWriter.write)
     """
-    dynamodb = boto3.resource('dynamodb')
-    db = dynamodb.Table(table_name)
-    with db.batch_writer() as batch:
-        for item in items:
-            if add_key:
-                item["elt_id"] = str(uuid.uuid4())
-            batch.put_item(Item=item)
+    max_workers = int(event.get('max_workers', MAX_WORKERS))
+    timeout = float(event.get('timeout', REQUEST_TIMEOUT))
+    queue_size = int(event.get('queue_size', QUEUE_SIZE))
+    grow_pools(storage, max_workers)
+    downloads = queue.Queue(maxsize=queue_size)
+    writes = queue.Queue(maxsize=queue_size)
+    writer = DynamoWriter('images_database', dynamodb=dynamodb)
+    results = []
+
+    def download():
+        while True:
+            image = downloads.get()
+            if image is None:
+                return
+            id_camera, image_name, urlfile, measured_time, item = image
+            result = save_file_to_s3(storage, image_name, 'jpg', urlfile, timeout, manifest.get(id_camera))
+            if result['status'] == 'saved':
+                writes.put(item)
+            results.append((id_camera, urlfile, measured_time, result))
 
-def load_json(bucket, file_name):
+    counts = {'images': 0, 'skipped': 0}
+    changed = [] if event.get('dataset') else None
+    with ThreadPoolExecutor(max_workers=1) as writing, ThreadPoolExecutor(max_workers=max_workers) as downloading:
+        written = writing.submit(writer.write_from, writes)
+        workers = [downloading.submit(download) for _ in range(max_workers)]
+        try:
+            for chunk in chunks:
+                unchanged = unchanged_images(chunk, manifest)
+                images = chunk[~unchanged]
+                counts['images'] += len(chunk)
+                counts['skipped'] += int(unchanged.sum())
+                if changed is not None:
+                    changed.append(images)
+                for image in zip(images['id_camera'].tolist(), images['image_name'].tolist(),
+                                 images['imageUrl'].tolist(), images['measuredTime'].astype(str).tolist(),
+                                 image_items(images)):
+                    downloads.put(image)
+        finally:
+            # end of the stream: the download threads stop, then the writer threads
+            for _ in workers:
+                downloads.put(None)
+            for worker in workers:
+                worker.result()
+            writes.put(None)
+        metrics = written.result()
+    # the images whose DynamoDB write failed are left out of the manifest: downloaded again next run
+    unwritten = {item['id_camera'] for item in writer.failed_items}
+    saved = []
+    for id_camera, urlfile, measured_time, result in results:
+        if result['status'] == 'failed':
+            report_error(urlfile, result['error'])
+            continue
+        if result['status'] == 'saved':
+            if id_camera in unwritten:
+                continue
+            saved.append(id_camera)
+        manifest[id_camera] = {'measuredTime': measured_time, 'etag': result['etag'],
+                               'last_modified': result['last_modified']}
+    counts.update({'not_modified': sum(result['status'] == 'not_modified' for *_, result in results),
+                   'saved': len(saved),
+                   'failed': sum(result['status'] == 'failed' for *_, result in results)+len(unwritten)})
+    if changed is None:
+        return None, counts, metrics
+    images = pd.concat(changed, ignore_index=True) if changed else pd.DataFrame(columns=['id_camera'])
+    return images[images['id_camera'].isin(saved)], counts, metrics
+
+def load_manifest(storage, key=MANIFEST_KEY):
+    """
+    Load the manifest of the last saved image of each camera preset
+
+    Arguments:
+    storage -- storage where the manifest is saved
+    key -- key of the manifest
+
+    Return:
+    manifest -- dictionary id_camera: {measuredTime, etag, last_modified}
+    (empty if the manifest does not exist yet)
+    """
+    data = storage.read(key)
+    return json.loads(data) if data else {}
+
+def save_manifest(storage, manifest, key=MANIFEST_KEY):
+    """
+    Save the manifest of the last saved image of each camera preset
+    """
+    storage.write(key, json.dumps(manifest))
+
+def unchanged_images(images_database, manifest):
+    """
+    Find the camera presets whose image has the same measuredTime as the last saved one
+
+    Arguments:
+    images_database -- dataframe of the images (id_camera, measuredTime)
+    manifest -- dictionary of the last saved image of each camera preset
+
+    Return:
+    unchanged -- boolean series (True if the image does not need to be downloaded)
+    """
+    saved_times = images_database['id_camera'].map(
+        {id_camera: entry.get('measuredTime') for id_camera, entry in manifest.items()})
+    measured_times = images_database['measuredTime'].astype(str)
+    return (measured_times == saved_times) & (measured_times != 'undefined')
+
+def report_error(urlfile, error):
+    """
+    Print the error raised while saving a file (if any)
+    """
+    if error is not None:
+        print(json.dumps({'url_file': urlfile, 'error': error}))
+
+def load_json(storage, file_name):
     """
     Load the downloaded json file
 
     Arugments:
-    bucket -- s3 bucket name from where the json file will be loaded
-    path -- the path where the file is saved
+    storage -- storage from where the json file will be loaded
+    file_name -- the name of the file
     Return:
     data -- loaded data from json file
     """
-    s3_clientobj = client.get_object(Bucket=bucket, Key=file_name+'.json')
-    s3_clientdata = s3_clientobj['Body'].read()
-    data = pickle.loads(s3_clientdata)
+    data = pickle.loads(storage.read(file_name+'.json'))
     return data
 
-def get_json_links(section_url):
+def fetch_json(urlfile, timeout=REQUEST_TIMEOUT, parse=True):
+    """
+    Download and parse a json file in memory
+
+    Arguments:
+    urlfile -- the link used for downloading the file
+    timeout -- timeout of the http request in seconds
+    parse -- if False the raw json is returned as a binary file object (to be parsed incrementally)
+
+    Return:
+    data -- loaded data from json file
+    """
+    with session.get(urlfile, timeout=timeout) as r:
+        r.raise_for_status()
+        return r.json() if parse else BytesIO(r.content)
+
+def archive_jsons(storage, payloads, prefix):
     """
-    Extract the json links
+    Save gzip compressed json files
+
+    Arguments:
+    storage -- storage where to save the files
+    payloads -- dictionary file_name: loaded data (or raw json binary file object)
+    prefix -- prefix of the keys of the archived files
+    """
+    for file_name, data in payloads.items():
+        body = data.getvalue() if isinstance(data, BytesIO) else json.dumps(data).encode('utf-8')
+        storage.write(prefix+file_name+'.json.gz', gzip.compress(body))
+
+def open_snapshot_archive(storage):
+    """
+    Open (once) the segment archive of the snapshots in 'snapshots/' of a local storage
+    """
+    root = getattr(storage, 'root', None)
+    if root is None:
+        raise ValueError('the segments archive format needs a local storage')
+    if root not in snapshot_archives:
+        from snapshot_archive import SnapshotArchive
+        snapshot_archives[root] = SnapshotArchive(os.path.join(root, SNAPSHOTS_DIR))
+    return snapshot_archives[root]
+
+def delete_jsons(storage, file_names):
+    """
+    Delete the downloaded json files (a single request on s3)
+    """
+    storage.delete_many([k+'.json' for k in file_names])
+
+def find_json_links(section_url):
+    """
+    Extract the json links from the traffic website
 
     Arguments:
     section_url -- the url of webpage to crawl 'https://www.digitraffic.fi/en/road-traffic/'
 
     Return :
-    links -- a list of the extracted links
+    json_links -- a list of tuples (file_name, link)
     """
-    links = []
+    json_links = []
     soup = make_soup(section_url)
     for link in soup.find_all('a'):
         li = link.get('href')
@@ -109,62 +368,277 @@ def get_json_links(section_url):
         if file_name in jsons:
             if file_name in ['road-conditions', 'forecast-sections', 'weather-stations']:
                 if li.split('/')[-3] == 'v1':
-                    save_file_to_s3('reconai-traffic', file_name, 'json', li)
-                    links.append(li)
+                    json_links.append((file_name, li))
                 else:
                     pass
             else:
-                save_file_to_s3('reconai-traffic', file_name, 'json', li)
-                links.append(li)
-    return links
+                json_links.append((file_name, li))
+    return json_links
+
+def download_jsons(json_links, skip=(), payloads=None, raw=(), storage=None):
+    """
+    Download the json files
+
+    Arguments:
+    json_links -- a list of tuples (file_name, link) (see find_json_links)
+    skip -- names of the json files that are not downloaded
+    payloads -- if a dictionary is given the json files are loaded in it (file_name: data)
+    instead of being saved in the storage
+    raw -- names of the json files kept unparsed in payloads (binary file objects)
+    storage -- storage where the json files are saved if payloads is None (default: s3 bucket)
+
+    Return:
+    downloaded -- number of downloaded files
+    failed -- number of files that could not be downloaded
+    """
+    downloaded = 0
+    failed = 0
+    for file_name, li in json_links:
+        if file_name in skip:
+            continue
+        if payloads is None:
+            error = save_file_to_s3(storage or bucket_storage, file_name, 'json', li)['error']
+        else:
+            try:
+                payloads[file_name] = fetch_json(li, parse=file_name not in raw)
+                error = None
+            except Exception as e:
+                error = '{}: {}'.format(type(e).__name__, e)
+        report_error(li, error)
+        downloaded += error is None
+        failed += error is not None
+    return downloaded, failed
+
+def get_json_links(section_url, skip=(), payloads=None, raw=(), storage=None):
+    """
+    Extract the json links and download the json files
+
+    Arguments:
+    section_url -- the url of webpage to crawl 'https://www.digitraffic.fi/en/road-traffic/'
+    skip -- names of the json files that are not downloaded (their links are still returned)
+    payloads -- if a dictionary is given the json files are loaded in it (file_name: data)
+    instead of being saved in s3
+    raw -- names of the json files kept unparsed in payloads (binary file objects)
+    storage -- storage where the json files are saved if payloads is None (default: s3 bucket)
+
+    Return :
+    links -- a list of the extracted links
+    """
+    json_links = find_json_links(section_url)
+    download_jsons(json_links, skip, payloads, raw, storage)
+    return [li for _, li in json_links]
+
+def parse_feeds(event, recorder, storage, cache):
+    """
+    Download and parse the json files (first stages of crawl), the images database is then built
+    from the returned TrafficCrawler (see prepare_crawl and TrafficCrawler.dataset_chunks)
+
+    Arguments:
+    event -- options of the run (see scrape)
+    recorder -- StageRecorder of the run
+    storage -- storage of the crawler files
+    cache -- StationCache of the station feeds
+
+    Return:
+    traffic_crawler -- TrafficCrawler of the json files (only the sensors of the weather stations
+    nearby the cameras are parsed)
+    archiving -- (future, prefix, number of files) of the background archive, None if not archived
+    """
+    if storage.exists(SENSORS_KEY):
+        storage.delete(SENSORS_KEY)
+
+    in_memory = event.get('in_memory', True)
+    archive = in_memory and event.get('archive', False)
+    # the segments archive also keeps the station feeds (deduplicated while they do not change),
+    # they are taken from the station cache instead of being downloaded twice
+    segments = archive and event.get('archive_format') == 'segments'
+    payloads = {} if in_memory else None
+    skip = STATION_FEEDS if archive or not in_memory else STATION_FEEDS+unused_jsons
+    raw = ['weather-data']
+    if segments:
+        snapshots = open_snapshot_archive(storage)
+    with recorder.stage('discovery') as stage:
+        json_links = find_json_links('https://www.digitraffic.fi/en/road-traffic/')
+        stage.count(items=len(json_links))
+    with recorder.stage('fetch_json') as stage:
+        # weather-data is parsed incrementally by sensors_values (only the sensors nearby the cameras are kept)
+        stage.count(*download_jsons(json_links, skip=skip, payloads=payloads, raw=raw, storage=storage))
+    with recorder.stage('station_metadata'):
+        station_urls = {file_name: li for file_name, li in json_links if file_name in STATION_FEEDS}
+        metadata = cache.get(station_urls, session, ttl=event.get('stations_ttl'), bodies=segments)
+    archiving = None
+    if segments:
+        payloads.update(cache.bodies())
+        archiving = (archiver.submit(snapshots.append, datetime.datetime.utcnow(), payloads),
+                     SNAPSHOTS_DIR, len(payloads))
+    elif archive:
+        prefix = 'archive/{}/'.format(datetime.datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%S'))
+        archiving = (archiver.submit(archive_jsons, storage, payloads, prefix), prefix, len(payloads))
+    # ***************** Load Json files ******************
+    if in_memory:
+        camera_data = payloads['camera-data']
+        weather_data = payloads['weather-data']
+    else:
+        with recorder.stage('load_json'):
+            camera_data = load_json(storage, 'camera-data')
+            weather_data = load_json(storage, 'weather-data')
+    with recorder.stage('parse') as stage:
+        traffic_crawler = TrafficCrawler(camera_data, weather_data, None, None, metadata, pushdown=True)
+        stage.count(items=len(traffic_crawler.sensors_data))
+    # ***************** Delete jsons ******************
+    if not in_memory:
+        with recorder.stage('delete_json'):
+            delete_jsons(storage, [k for k in jsons if k not in skip])
+    return traffic_crawler, archiving
+
+def nearby_sensors(sensors_data, weather_stations):
+    """
+    Keep the sensors data of the weather stations used by the images (nearestWeatherStationId)
+    """
+    return sensors_data[sensors_data['weatherStationId'].astype('float64').isin(list(weather_stations))]
+
+def prepare_crawl(event, recorder, storage, cache):
+    """
+    Download the json files and build the whole images database (see parse_feeds)
+
+    Return:
+    images_database -- dataframe of the images
+    new_sensors_data -- dataframe of the sensors of the weather stations nearby the cameras
+    archiving -- (future, prefix, number of files) of the background archive, None if not archived
+    """
+    traffic_crawler, archiving = parse_feeds(event, recorder, storage, cache)
+    with recorder.stage('build_dataset') as stage:
+        images_database = traffic_crawler.build_dataset()
+        stage.count(items=len(images_database))
+    new_sensors_data = nearby_sensors(traffic_crawler.sensors_data,
+                                      images_database['nearestWeatherStationId'].unique().tolist())
+    return images_database, new_sensors_data, archiving
+
+def upload_sensors(recorder, storage, new_sensors_data):
+    """
+    Save the sensors data handed to 'LambdaTrafficSensors' (parquet file)
+    """
+    with recorder.stage('sensors_upload') as stage:
+        parquet_buffer = BytesIO()
+        new_sensors_data.to_parquet(parquet_buffer, compression='snappy', index=False)
+        storage.write(SENSORS_KEY, parquet_buffer.getvalue())
+        stage.count(items=len(new_sensors_data))
+
+def append_dataset(event, recorder, storage, saved_images):
+    """
+    Append the saved images to the parquet dataset if the event key dataset is set
+    """
+    if event.get('dataset'):
+        with recorder.stage('dataset') as stage:
+            from dataset import ColumnarDataset
+            ColumnarDataset(storage).append('images', saved_images)
+            stage.count(items=len(saved_images))
+
+def finish_archive(recorder, archiving):
+    """
+    Wait for the background archive of the json files (if any)
+    """
+    if archiving is None:
+        return
+    archive, prefix, files = archiving
+    # the lambda container is frozen once the handler returns: wait for the archive
+    with recorder.stage('archive') as stage:
+        try:
+            archive.result()
+            stage.count(items=files)
+        except Exception as e:
+            stage.count(errors=1)
+            report_error(prefix, '{}: {}'.format(type(e).__name__, e))
 
-def extract_data(camera_data, cameraStations_data, weatherStations_data, weather_data):
+def crawl(event, recorder, storage=None, cache=None, dynamodb=None):
     """
-    Parse the json files and extract useful informations (Map , images & sensors databases)
+    Run the 'LambdaTraffic' pipeline (see scrape), each stage is measured by the recorder
+
+    Arguments:
+    event -- options of the run (see scrape)
+    recorder -- StageRecorder of the run
+    storage -- storage of the crawler files (default: s3 bucket 'reconai-traffic')
+    cache -- StationCache of the station feeds (default: persisted in the s3 bucket)
+    dynamodb -- boto3 DynamoDB resource (created by the writer if None)
+
+    Return:
+    summary -- dictionary of the number of images: skipped, not_modified, saved and failed
     """
-    traffic_crawler = TrafficCrawler(camera_data, weather_data,
-                                     weatherStations_data, cameraStations_data)
-    images_database = traffic_crawler.build_dataset()
-    return images_database, traffic_crawler.sensors_data
+    storage = storage or bucket_storage
+    cache = cache or station_cache
+    traffic_crawler, archiving = parse_feeds(event, recorder, storage, cache)
+    weather_stations = set()
+
+    def chunks():
+        for chunk in traffic_crawler.dataset_chunks(int(event.get('chunk_size', DATASET_CHUNK))):
+            weather_stations.update(chunk['nearestWeatherStationId'].tolist())
+            yield chunk
+
+    # ***************** Build, download and write the images (streaming) ******************
+    with recorder.stage('image_pipeline') as stage:
+        manifest = {} if event.get('full_crawl') else load_manifest(storage)
+        saved_images, summary, metrics = stream_images(event, storage, chunks(), manifest, dynamodb)
+        stage.count(items=summary['images']-summary['skipped'], errors=summary['failed'])
+    print(json.dumps(summary))
+    print(json.dumps({'images_database': metrics}))
+    # ***************** upload sensors data parquet to s3 bucket ******************
+    upload_sensors(recorder, storage, nearby_sensors(traffic_crawler.sensors_data, weather_stations))
+    append_dataset(event, recorder, storage, saved_images)
+    with recorder.stage('save_manifest'):
+        save_manifest(storage, manifest)
+    finish_archive(recorder, archiving)
+    return summary
 
 def scrape(event, context):
     """
     Handler of the lambda function 'LambdaTraffic':
-    Json files are downloaded from the traffic website to s3 bucket 'reconai-traffic'.
+    Json files are downloaded from the traffic website (in memory, or to s3 bucket
+    'reconai-traffic' if in_memory is False).
     From these files informations are extracted: dataframe of the camera stations images.
     and dataframe of the data of sensors corresponding
     to the weather stations located nearby camera stations.
     Once informations are extracted, the images are downloaded in the directory
     'images' in 'reconai-traffic' bucket and json files are deleted.
-    Then the images database is saved in DynamoDB table 'images_database',
-    and the sensors data is saved as a csv file in 'reconai-traffic' bucket
+    The images database is built by chunks and streamed through bounded queues to the
+    download threads, each saved image being written to DynamoDB table 'images_database'
+    as soon as its transfer succeeds (see stream_images).
+    Then the sensors data is saved as a parquet file in 'reconai-traffic' bucket
     to be used by another lambda function 'LambdaTrafficSensors'.
-    """
-    if file_checker(client, "reconai-traffic", 'sensors_data.csv'):
-        client.delete_object(Bucket="reconai-traffic", Key='sensors_data.csv')
 
-    get_json_links('https://www.digitraffic.fi/en/road-traffic/')
-    # ***************** Load Json files ******************
-    camera_data = load_json('reconai-traffic', 'camera-data')
-    cameraStations_data = load_json('reconai-traffic', 'camera-stations')
-    weatherStations_data = load_json('reconai-traffic', 'weather-stations')
-    weather_data = load_json('reconai-traffic', 'weather-data')
-    images_database, sensors_data = extract_data(camera_data, cameraStations_data,
-                                                 weatherStations_data, weather_data)
-    weatherStations_keep = images_database['nearestWeatherStationId'].unique().tolist()
-    new_sensors_data = sensors_data[sensors_data['weatherStationId'].astype('float64').isin(weatherStations_keep)]
-    # ***************** Delete jsons ******************
-    for k in jsons:
-        client.delete_object(Bucket="reconai-traffic", Key=k+'.json')
-    # ***************** Download the images ******************
-    for i in range(len(images_database)):
-        save_file_to_s3('reconai-traffic', images_database.iloc[i]['image_name'],
-                        'jpg', images_database.iloc[i]['imageUrl'])
-    # ***************** upload sensors data csv to s3 bucket ******************
-    csv_buffer = StringIO()
-    new_sensors_data.to_csv(csv_buffer)
-    client.put_object(Body=csv_buffer.getvalue(), Bucket='reconai-traffic', Key='sensors_data.csv')
-    # ***************** Fill dynamodb *****************************************
-    images_database = images_database.astype(str)
-    database = images_database.to_dict('records')
-    batch_write('images_database', database)
+    Only the images whose measuredTime changed since the last saved one (see the manifest)
+    are requested, with conditional headers (ETag / Last-Modified), and only the saved
+    images are written to DynamoDB.
+
+    The wall time, peak RSS, item and error counts of each stage are printed as
+    CloudWatch embedded metric format log lines (see instrumentation.py).
+
+    Optional event keys:
+    max_workers -- number of concurrent image transfers
+    timeout -- timeout of each image request in seconds
+    chunk_size -- camera presets per chunk of the images database
+    queue_size -- images waiting in each queue of the streaming pipeline
+    full_crawl -- if True the manifest is ignored and every image is downloaded
+    stations_ttl -- maximum age (in seconds) of the cached station feeds (0 to revalidate them)
+    in_memory -- if False the json files go through s3 (pickled) instead of memory
+    archive -- if True the downloaded json files are also archived (gzip compressed)
+    in 'archive/<time>/' of 'reconai-traffic' bucket, in the background (in_memory mode only)
+    archive_format -- 'segments' to archive the six json files in the segment archive
+    'snapshots/' of a local storage instead (see snapshot_archive.py, service.py only)
+    dataset -- if True the saved images are also appended to the parquet dataset
+    'dataset/images/' of 'reconai-traffic' bucket (see dataset.py)
+    profile -- if True the run is profiled with cProfile and the profile is saved
+    in 'profiles/' of 'reconai-traffic' bucket
+
+    Return:
+    summary -- dictionary of the number of images: skipped (same measuredTime),
+    not_modified (conditional request), saved and failed
+    """
+    event = event or {}
+    recorder = StageRecorder('scrape')
+    profile_key = 'profiles/scrape-{}.prof'.format(datetime.datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%S'))
+    with profiled(event.get('profile'), bucket_storage, profile_key):
+        try:
+            summary = crawl(event, recorder)
+        finally:
+            recorder.finish()
+    return summary
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Stage level instrumentation of the lambda functions: wall time, peak RSS, item and error counts
+of each stage, printed as CloudWatch embedded metric format (EMF) log lines, and opt-in
+cProfile capture of a whole run.
+"""
+# Import libraries
+import io
+import os
+import json
+import time
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    # not available on Windows: the peak RSS is not recorded
+    resource = None
+
+NAMESPACE = 'ReconaiTraffic'
+# Metrics of a stage: name -> CloudWatch unit
+stage_metrics = {'Duration': 'Milliseconds', 'PeakRSS': 'Megabytes', 'RSSGrowth': 'Megabytes',
+                 'Items': 'Count', 'Errors': 'Count'}
+
+
+def peak_rss():
+    """
+    Peak resident set size of the process in MB (None if unknown)
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+class Stage():
+    """
+    Counters of a running stage
+    """
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.errors = 0
+
+    def count(self, items=0, errors=0):
+        self.items += items
+        self.errors += errors
+
+
+class StageRecorder():
+    """
+    Record the stages of a run and print them as EMF log lines
+    """
+    def __init__(self, function, namespace=NAMESPACE, emit=True):
+        """
+        Arguments:
+        function -- name of the instrumented function (dimension of the metrics)
+        namespace -- CloudWatch namespace of the metrics
+        emit -- if False the stages are only recorded (not printed)
+        """
+        self.function = function
+        self.namespace = namespace
+        self.emit = emit
+        self.stages = []
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measure a stage: with recorder.stage('fetch') as stage: ... stage.count(items=6)
+        An exception raised in the stage is counted as an error and re-raised.
+        """
+        stage = Stage(name)
+        rss = peak_rss()
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            yield stage
+        except BaseException:
+            stage.count(errors=1)
+            status = 'failed'
+            raise
+        finally:
+            end_rss = peak_rss()
+            record = {'Stage': name, 'Status': status,
+                      'Duration': round((time.perf_counter()-start)*1000, 1),
+                      'PeakRSS': round(end_rss, 1) if end_rss is not None else None,
+                      'RSSGrowth': round(end_rss-rss, 1) if end_rss is not None else None,
+                      'Items': stage.items, 'Errors': stage.errors}
+            self.stages.append(record)
+            self.log(record)
+
+    def log(self, record):
+        """
+        Print a record as an EMF log line (metrics with a None value are left out)
+        """
+        if not self.emit:
+            return
+        metrics = [{'Name': name, 'Unit': unit} for name, unit in stage_metrics.items()
+                   if record.get(name) is not None]
+        dimensions = ['Function', 'Stage'] if 'Stage' in record else ['Function']
+        line = {'_aws': {'Timestamp': int(time.time()*1000),
+                         'CloudWatchMetrics': [{'Namespace': self.namespace, 'Dimensions': [dimensions],
+                                                'Metrics': metrics}]},
+                'Function': self.function}
+        line.update({key: value for key, value in record.items() if value is not None})
+        print(json.dumps(line))
+
+    def finish(self):
+        """
+        Print the totals of the run
+
+        Return:
+        summary -- dictionary: duration (ms), peak RSS, items and errors of the run and the stages
+        """
+        rss = peak_rss()
+        summary = {'Duration': round((time.perf_counter()-self.start)*1000, 1),
+                   'PeakRSS': round(rss, 1) if rss is not None else None,
+                   'Errors': sum(stage['Errors'] for stage in self.stages)}
+        self.log(summary)
+        summary['stages'] = self.stages
+        return summary
+
+
+@contextmanager
+def profiled(enabled, storage=None, key=None, top=25):
+    """
+    Profile the enclosed code with cProfile (if enabled): the top functions (cumulative time)
+    are printed and the raw profile (pstats format) is saved in the storage
+
+    Arguments:
+    enabled -- if False nothing is profiled
+    storage -- storage backend where the profile is saved (see storage.py), None to only print it
+    key -- key of the saved profile
+    top -- number of functions printed
+    """
+    if not enabled:
+        yield
+        return
+    import pstats
+    import cProfile
+    import tempfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(top)
+        print(out.getvalue())
+        if storage is not None:
+            fd, path = tempfile.mkstemp(suffix='.prof')
+            os.close(fd)
+            try:
+                profiler.dump_stats(path)
+                with open(path, 'rb') as f:
+                    storage.write(key, f.read())
+            finally:
+                os.remove(path)
+            print(json.dumps({'profile': key}))
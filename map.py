@@ -1,22 +1,42 @@
 # -*- coding: utf-8 -*-
 """
 create Finland map that contains camera and weather stations.
+
+The map is built from a local snapshot of the json files: a directory with camera-data,
+weather-data, camera-stations and weather-stations (.json or gzip compressed .json.gz, e.g. an
+'archive/<time>/' folder of the crawler). The station feeds missing from the snapshot (the
+archives do not contain them) are taken from a station cache file (see station_cache.py).
+
+Usage:
+python map.py json --download --output maps
+python map.py data/archive/2020-06-01-12-00-00 --station-cache data/station_cache.pkl
 """
 # Import libraries
 import os
 import sys
-import shutil
-import urllib.request
+import gzip
+import json
+import time
+import argparse
 import requests
-from bs4 import BeautifulSoup
-from data_processing import *
+from data_processing import TrafficCrawler
+from station_cache import StationCache, STATION_FEEDS
+from storage import LocalStorage
+from station_map import MAP_FILE
 
 
 jsons = ['camera-data', 'camera-stations', 'road-conditions',
          'weather-data', 'forecast-sections', 'weather-stations']
+# Json files used to build the map
+map_jsons = ['camera-data', 'weather-data']+STATION_FEEDS
+session = requests.Session()
+
 def make_soup(url):
-    html = urllib.request.urlopen(url).read()
-    return BeautifulSoup(html, "lxml")
+    # bs4 (and lxml) are only imported when the page is parsed
+    from bs4 import BeautifulSoup
+    with session.get(url, timeout=30) as r:
+        r.raise_for_status()
+        return BeautifulSoup(r.content, "lxml")
 
 def downloader(urlfile, ext, file_name, path):
     """
@@ -29,29 +49,27 @@ def downloader(urlfile, ext, file_name, path):
     path -- the path where we are going to save the file
     """
     try:
-        req = urllib.request.Request(url=urlfile)
-        httpresp = urllib.request.urlopen(req, timeout=10)
-        r = requests.get(urlfile, stream=True)
-        with open(os.path.join(path, file_name+'.'+ext), 'wb') as f:
-            r.raw.decode_content = True
-            shutil.copyfileobj(r.raw, f)
+        with session.get(urlfile, timeout=30) as r:
+            r.raise_for_status()
+            with open(os.path.join(path, file_name+'.'+ext), 'wb') as f:
+                f.write(r.content)
     except Exception as e:
-        exc_type, exc_obj, exc_tb = sys.exc_info()
-        print('url_file', urlfile)
-        print("Oups!!!! an exception: ", e, exc_type, exc_tb.tb_lineno)
+        print(json.dumps({'url_file': urlfile, 'error': '{}: {}'.format(type(e).__name__, e)}))
 
-def get_json_links(section_url):
+def get_json_links(section_url, path):
     """
-    Extract the json links
+    Extract the json links and download the json files
 
     Arguments:
     section_url -- the url of webpage to crawl
     'https://www.digitraffic.fi/en/road-traffic/'
+    path -- the directory where the json files are saved
 
     Return :
     links -- a list of the extracted links
     """
     links = []
+    os.makedirs(path, exist_ok=True)
     soup = make_soup(section_url)
     for link in soup.find_all('a'):
         li = link.get('href')
@@ -59,40 +77,86 @@ def get_json_links(section_url):
         if file_name in jsons:
             if file_name in ['road-conditions', 'forecast-sections', 'weather-stations']:
                 if li.split('/')[-3] == 'v1':
-                    downloader(li, 'json', file_name, '/content/json')
+                    downloader(li, 'json', file_name, path)
                     links.append(li)
                 else:
                     pass
             else:
-                downloader(li, 'json', file_name, '/content/json')
+                downloader(li, 'json', file_name, path)
                 links.append(li)
     return links
 
 def load_json(path, file_name):
     """
-    Load the downloaded json file
+    Load the downloaded json file (.json or gzip compressed .json.gz)
 
     Arugments:
     file_name -- the name of downloaded file
     path -- the path where the file is saved
 
     Return:
-    data -- loaded data from json file
+    data -- loaded data from json file, None if the file does not exist
     """
-    with open(os.path.join(path, file_name+'.json')) as json_file:
-        data = json.load(json_file)
-    return data
-
-get_json_links('https://www.digitraffic.fi/en/road-traffic/')
-
-# ***************** Load Json files ******************
-camera_data = load_json('/content/json', 'camera-data')
-cameraStations_data = load_json('/content/json', 'camera-stations')
-weatherStations_data = load_json('/content/json', 'weather-stations')
-weather_data = load_json('/content/json', 'weather-data')
-
-# ******** Parse the json files and extract useful informations*******
-# *********(Map , images & sensors databases) *********
-traffic_crawler = TrafficCrawler(camera_data, weather_data,
-                                 weatherStations_data, cameraStations_data)
-traffic_crawler.build_map()
+    file_path = os.path.join(path, file_name+'.json')
+    if os.path.exists(file_path):
+        with open(file_path, 'rb') as json_file:
+            return json.load(json_file)
+    if os.path.exists(file_path+'.gz'):
+        with gzip.open(file_path+'.gz', 'rb') as json_file:
+            return json.load(json_file)
+    return None
+
+def load_snapshot(path, station_cache=None):
+    """
+    Load the json files of a snapshot
+
+    Arguments:
+    path -- directory of the snapshot
+    station_cache -- path of a station cache file, used for the station feeds missing from the snapshot
+
+    Return:
+    payloads -- dictionary file name: loaded data (station feeds found in the snapshot only)
+    metadata -- parsed stations metadata from the station cache (None if not used)
+    """
+    payloads = {}
+    for file_name in map_jsons:
+        data = load_json(path, file_name)
+        if data is not None:
+            payloads[file_name] = data
+    for file_name in ['camera-data', 'weather-data']:
+        if file_name not in payloads:
+            raise FileNotFoundError('{}.json(.gz) not found in {}'.format(file_name, path))
+    missing = [feed for feed in STATION_FEEDS if feed not in payloads]
+    if not missing:
+        return payloads, None
+    if station_cache is None:
+        raise FileNotFoundError('{} not found in {} (use --station-cache)'.format(', '.join(missing), path))
+    metadata = StationCache(LocalStorage(os.path.dirname(station_cache) or '.'),
+                            key=os.path.basename(station_cache)).metadata()
+    return payloads, metadata
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('snapshot', nargs='?', default='json', help='directory of the json files')
+    parser.add_argument('--download', action='store_true', help='download the json files in the snapshot directory first')
+    parser.add_argument('--station-cache', help='station cache file used for the station feeds missing from the snapshot')
+    parser.add_argument('--output', default='.', help='directory where the map is saved')
+    args = parser.parse_args()
+
+    if args.download:
+        get_json_links('https://www.digitraffic.fi/en/road-traffic/', args.snapshot)
+    start = time.perf_counter()
+    payloads, metadata = load_snapshot(args.snapshot, args.station_cache)
+    # ******** Parse the json files and build the map *******
+    traffic_crawler = TrafficCrawler(payloads['camera-data'], payloads['weather-data'],
+                                     payloads.get('weather-stations'), payloads.get('camera-stations'),
+                                     metadata=metadata)
+    os.makedirs(args.output, exist_ok=True)
+    traffic_crawler.build_map(args.output)
+    map_path = os.path.join(args.output, MAP_FILE)
+    print(json.dumps({'map': map_path, 'seconds': round(time.perf_counter()-start, 2),
+                      'bytes': os.path.getsize(map_path)}))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
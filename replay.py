@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Replay (backfill) of archived snapshots: TrafficCrawler is run again over the json files archived
+by the crawler ('archive/<time>/' directories, see the event key archive of handler.scrape, or
+a segment archive, see snapshot_archive.py) to
+regenerate the labels (votes) and the names of the images with the current voting rules and
+category dictionaries. The snapshots are processed by chunks in a pool of processes and the
+regenerated images databases are written as a parquet dataset (see dataset.py).
+
+The 'archive/<time>/' directories do not contain the station feeds: their parsed metadata is taken
+from a station cache file (loaded once per worker), or parsed once per distinct feed when a
+snapshot contains them.
+
+Usage:
+python replay.py data/archive --station-cache data/station_cache.pkl --output replayed --workers 8
+python replay.py data/snapshots --output replayed --since 2020-05-01 --until 2020-05-31
+"""
+# Import libraries
+import os
+import sys
+import gzip
+import json
+import time
+import hashlib
+import argparse
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from data_processing import TrafficCrawler
+from utils import stations_metadata
+from storage import LocalStorage
+from station_cache import StationCache, STATION_FEEDS
+from dataset import ColumnarDataset
+from snapshot_archive import SnapshotArchive, is_archive
+
+CHUNK_SIZE = 50 # snapshots per task (and per written file of each partition)
+OUTPUT_PREFIX = 'replay'
+
+# State of a worker process: metadata of the station cache, metadata parsed from the
+# station feeds of the snapshots (feed, digest of the file): metadata and open segment archives
+fallback_metadata = None
+parsed_stations = {}
+archives = {}
+
+
+def snapshot_dirs(root, since=None, until=None):
+    """
+    List the snapshots of an archive: directories containing camera-data.json(.gz), sorted by name
+    (the archive directories are named after the crawl time, so by time)
+
+    Arguments:
+    root -- directory of the archive
+    since, until -- names range of the snapshots, bounds included (e.g. '2020-05-01', None for an open range)
+
+    Return:
+    paths -- list of the snapshot directories
+    """
+    paths = []
+    for directory, _, files in os.walk(root):
+        if 'camera-data.json' not in files and 'camera-data.json.gz' not in files:
+            continue
+        name = os.path.basename(directory)
+        if (since is None or name >= since) and (until is None or name[:len(until)] <= until):
+            paths.append(directory)
+    return sorted(paths, key=os.path.basename)
+
+def list_snapshots(root, since=None, until=None):
+    """
+    List the snapshots of a directory of 'archive/<time>/' folders (directories) or of a segment
+    archive ((root, time) tuples), see snapshot_dirs
+    """
+    if is_archive(root):
+        return [(root, time) for time in SnapshotArchive(root).select(since, until)]
+    return snapshot_dirs(root, since, until)
+
+def snapshot_name(snapshot):
+    return snapshot[1] if isinstance(snapshot, tuple) else os.path.basename(snapshot)
+
+def open_archive(root):
+    if root not in archives:
+        archives[root] = SnapshotArchive(root)
+    return archives[root]
+
+def read_snapshot(snapshot, file_name):
+    """
+    Raw json (bytes) of a feed of a snapshot (directory or (root, time) of a segment archive),
+    None if the snapshot does not contain the feed
+    """
+    if isinstance(snapshot, tuple):
+        return open_archive(snapshot[0]).read_feed(snapshot[1], file_name)
+    return read_feed(snapshot, file_name)
+
+def feed_digest(snapshot, file_name):
+    """
+    Digest of a feed of a snapshot (given by a segment archive without reading the feed)
+    """
+    if isinstance(snapshot, tuple):
+        return open_archive(snapshot[0]).feed_digest(snapshot[1], file_name)
+    body = read_feed(snapshot, file_name)
+    return hashlib.sha1(body).hexdigest() if body is not None else None
+
+def read_feed(path, file_name):
+    """
+    Read a json file of a snapshot (.json or gzip compressed .json.gz)
+
+    Return:
+    body -- raw json (bytes), None if the file does not exist
+    """
+    file_path = os.path.join(path, file_name+'.json')
+    if os.path.exists(file_path):
+        with open(file_path, 'rb') as f:
+            return f.read()
+    if os.path.exists(file_path+'.gz'):
+        with open(file_path+'.gz', 'rb') as f:
+            return gzip.decompress(f.read())
+    return None
+
+def snapshot_metadata(snapshot):
+    """
+    Get the stations metadata of a snapshot: parsed from its station feeds (once per distinct feed)
+    or taken from the station cache of the worker
+    """
+    metadata = dict(fallback_metadata or {})
+    for feed in STATION_FEEDS:
+        digest = feed_digest(snapshot, feed)
+        if digest is None:
+            continue
+        digest = (feed, digest)
+        if digest not in parsed_stations:
+            data = json.loads(read_snapshot(snapshot, feed))
+            parsed_stations[digest] = stations_metadata(
+                data_weather_stations=data if feed == 'weather-stations' else None,
+                data_camera_stations=data if feed == 'camera-stations' else None)
+        metadata.update(parsed_stations[digest])
+    missing = [name for name in ['weatherStations_map', 'colocated', 'cameraStations_coordinates']
+               if name not in metadata]
+    if missing:
+        raise ValueError('no stations metadata ({}) for {}: use a station cache'.format(', '.join(missing),
+                                                                                     snapshot_name(snapshot)))
+    return metadata
+
+def replay_snapshot(snapshot):
+    """
+    Regenerate the images database of a snapshot
+
+    Arguments:
+    snapshot -- directory of the snapshot or (root, time) of a segment archive
+
+    Return:
+    images_database -- dataframe (see TrafficCrawler.build_dataset) with the name of the snapshot
+    """
+    camera_data = read_snapshot(snapshot, 'camera-data')
+    weather_data = read_snapshot(snapshot, 'weather-data')
+    if camera_data is None or weather_data is None:
+        raise FileNotFoundError('camera-data or weather-data not found in {}'.format(snapshot_name(snapshot)))
+    # weather-data is parsed incrementally (only the sensors of the stations used by build_dataset)
+    traffic_crawler = TrafficCrawler(json.loads(camera_data), BytesIO(weather_data), None, None,
+                                     snapshot_metadata(snapshot), pushdown=True)
+    images_database = traffic_crawler.build_dataset()
+    images_database['snapshot'] = snapshot_name(snapshot)
+    return images_database
+
+def init_worker(metadata):
+    global fallback_metadata
+    fallback_metadata = metadata
+
+def replay_chunk(snapshots, output, prefix=OUTPUT_PREFIX):
+    """
+    Replay a chunk of snapshots and append their images to the dataset, an image found in several
+    snapshots of the chunk (same id_camera and measuredTime) is only kept once
+
+    Arguments:
+    snapshots -- snapshots (see list_snapshots)
+    output -- storage of the dataset
+    prefix -- prefix of the dataset
+
+    Return:
+    result -- dictionary: number of snapshots, of images (rows written), errors (snapshot: error)
+    """
+    databases = []
+    errors = {}
+    for snapshot in snapshots:
+        try:
+            databases.append(replay_snapshot(snapshot))
+        except Exception as e:
+            errors[snapshot_name(snapshot)] = '{}: {}'.format(type(e).__name__, e)
+    images = 0
+    if databases:
+        images_database = pd.concat(databases, ignore_index=True)
+        images_database = images_database.drop_duplicates(subset=['id_camera', 'measuredTime'])
+        ColumnarDataset(output, prefix).append('images', images_database)
+        images = len(images_database)
+    return {'snapshots': len(snapshots), 'images': images, 'errors': errors}
+
+def replay(root, output, station_cache=None, workers=None, chunk_size=CHUNK_SIZE, since=None, until=None,
+           prefix=OUTPUT_PREFIX):
+    """
+    Replay the snapshots of an archive in a pool of processes
+
+    Arguments:
+    root -- directory of the 'archive/<time>/' folders or of a segment archive
+    output -- storage of the regenerated dataset (LocalStorage: it is handed to the worker processes)
+    station_cache -- path of a station cache file (metadata of the snapshots without station feeds)
+    workers -- number of worker processes (default: number of cpus)
+    chunk_size -- number of snapshots per task
+    since, until -- names range of the snapshots (see snapshot_dirs)
+    prefix -- prefix of the dataset
+
+    Return:
+    summary -- dictionary: numbers of snapshots, failed snapshots and images, errors,
+    duration and throughput (snapshots per hour)
+    """
+    start = time.perf_counter()
+    metadata = None
+    if station_cache is not None:
+        metadata = StationCache(LocalStorage(os.path.dirname(station_cache) or '.'),
+                                key=os.path.basename(station_cache)).metadata()
+    snapshots = list_snapshots(root, since, until)
+    chunks = [snapshots[i:i+chunk_size] for i in range(0, len(snapshots), chunk_size)]
+    summary = {'snapshots': 0, 'failed': 0, 'images': 0, 'errors': {}}
+    # the station metadata is sent once per worker (initializer), not once per task
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(metadata,)) as executor:
+        for result in executor.map(replay_chunk, chunks, [output]*len(chunks), [prefix]*len(chunks)):
+            summary['snapshots'] += result['snapshots']
+            summary['failed'] += len(result['errors'])
+            summary['images'] += result['images']
+            summary['errors'].update(result['errors'])
+    duration = time.perf_counter()-start
+    summary.update({'duration': round(duration, 1),
+                    'snapshots_per_hour': round(summary['snapshots']*3600/max(duration, 1e-3))})
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('archive', help="directory of the 'archive/<time>/' folders or of a segment archive")
+    parser.add_argument('--output', default='replayed', help='directory of the regenerated dataset')
+    parser.add_argument('--prefix', default=OUTPUT_PREFIX, help='prefix of the dataset in the output directory')
+    parser.add_argument('--station-cache', help='station cache file used for the snapshots without station feeds')
+    parser.add_argument('--workers', type=int, help='number of worker processes (default: number of cpus)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='snapshots per task')
+    parser.add_argument('--since', help='first snapshot (name prefix, e.g. 2020-05-01)')
+    parser.add_argument('--until', help='last snapshot (name prefix, e.g. 2020-05-31)')
+    args = parser.parse_args()
+
+    summary = replay(args.archive, LocalStorage(args.output), args.station_cache, args.workers,
+                     args.chunk_size, args.since, args.until, args.prefix)
+    print(json.dumps(summary))
+    return 1 if summary['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
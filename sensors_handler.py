@@ -3,43 +3,146 @@
 Handler of the lambda function 'LambdaTrafficSensors'.
 """
 # Import libraries
-from io import StringIO
-import uuid
+from io import BytesIO
+import json
+import datetime
 import boto3
+import numpy as np
 import pandas as pd
 import botocore.config
+from dynamo_writer import DynamoWriter
+from dynamo_tables import sensor_items
+from storage import S3Storage
+from instrumentation import StageRecorder, profiled
 
 cfg = botocore.config.Config(retries={'max_attempts': 0})
 client = boto3.client('s3', config=cfg)
+# Sensors data generated by 'LambdaTraffic' (parquet file)
+SENSORS_KEY = 'sensors_data.parquet'
+# Last measuredTime written for each sensor (parquet file: weatherStationId, id_sensor, measuredTime)
+STATE_KEY = 'sensors_state.parquet'
+# Storage of the sensors data and state
+bucket_storage = S3Storage(client, 'reconai-traffic')
+# A reading is identified by its sensor and its measuredTime
+SENSOR_KEY = ['weatherStationId', 'id_sensor']
 
-def batch_write(table_name, items, add_key=False):
+def load_state(storage, key=STATE_KEY):
     """
-    write list of items dictionaries into a DynamoDB table
+    Load the last measuredTime written for each sensor
 
     Arguments:
-    table_name -- name of the DynamoDB table to be filled
-    items -- list of dictionaries (items)
-    add_key -- if a primary key is added to the items
-    """
-    dynamodb = boto3.resource('dynamodb')
-    db = dynamodb.Table(table_name)
-    with db.batch_writer() as batch:
-        for item in items:
-            if add_key:
-                item["elt_id"] = str(uuid.uuid4())
-            batch.put_item(Item=item)
+    storage -- storage where the state is saved (see storage.py)
+    key -- key of the state
+
+    Return:
+    state -- dataframe (weatherStationId, id_sensor, measuredTime), None if the state does not exist yet
+    """
+    body = storage.read(key)
+    if body is None:
+        return None
+    return pd.read_parquet(BytesIO(body))
+
+def save_state(storage, state, key=STATE_KEY):
+    """
+    Save the last measuredTime written for each sensor
+    """
+    buffer = BytesIO()
+    state.to_parquet(buffer, compression='snappy', index=False)
+    storage.write(key, buffer.getvalue())
+
+def new_readings(df, state):
+    """
+    Keep the readings whose measuredTime changed since the last written one
+
+    Arguments:
+    df -- dataframe of the sensors data
+    state -- last measuredTime written for each sensor (see load_state)
+
+    Return:
+    new -- dataframe of the new readings
+    """
+    df = df.drop_duplicates(subset=SENSOR_KEY+['measuredTime'])
+    if state is None or state.empty:
+        return df
+    seen = df[SENSOR_KEY].merge(state, on=SENSOR_KEY, how='left', indicator=True)
+    last = seen['measuredTime'].values
+    current = df['measuredTime'].values
+    unchanged = ((seen['_merge'] == 'both').values
+                 & ((last == current) | (pd.isna(last) & pd.isna(current))))
+    return df[~unchanged]
+
+def update_state(state, written):
+    """
+    Update the last measuredTime of the sensors with the written readings
+    """
+    written = written[SENSOR_KEY+['measuredTime']].sort_values('measuredTime', na_position='first')
+    written = written.drop_duplicates(subset=SENSOR_KEY, keep='last')
+    if state is None:
+        return written.reset_index(drop=True)
+    return pd.concat([state, written]).drop_duplicates(subset=SENSOR_KEY, keep='last').reset_index(drop=True)
+
+def write_sensors(event, recorder, storage=None, dynamodb=None):
+    """
+    Run the 'LambdaTrafficSensors' pipeline (see handler), each stage is measured by the recorder
+
+    Arguments:
+    event -- options of the run (see handler)
+    recorder -- StageRecorder of the run
+    storage -- storage of the sensors data and state (default: s3 bucket 'reconai-traffic')
+    dynamodb -- boto3 DynamoDB resource (created by the writer if None)
+    """
+    storage = storage or bucket_storage
+    with recorder.stage('load') as stage:
+        df = pd.read_parquet(BytesIO(storage.read(SENSORS_KEY)))
+        state = load_state(storage)
+        stage.count(items=len(df))
+    with recorder.stage('deduplicate') as stage:
+        new = new_readings(df, None if event.get('full_write') else state)
+        stage.count(items=len(new))
+    with recorder.stage('dynamodb_write') as stage:
+        writer = DynamoWriter('sensors_database', dynamodb=dynamodb)
+        items = sensor_items(new)
+        metrics = writer.write(items)
+        failed = {(item['sensor_key'], item['measuredTime']) for item in writer.failed_items}
+        stage.count(items=metrics['written'], errors=metrics['failed'])
+    skipped = len(df)-len(new)
+    print(json.dumps({'sensors_database': metrics,
+                      'readings': len(df), 'new': len(new), 'skipped': skipped,
+                      'skip_ratio': round(skipped/len(df), 3) if len(df) else 0.0}))
+    # failed readings are kept out of the state to be written again by the next run
+    written = new[np.array([(item['sensor_key'], item['measuredTime']) not in failed for item in items], dtype=bool)]
+    with recorder.stage('save_state'):
+        save_state(storage, update_state(state, written))
+    if event.get('dataset'):
+        with recorder.stage('dataset') as stage:
+            from dataset import ColumnarDataset
+            ColumnarDataset(storage).append('sensors', written)
+            stage.count(items=len(written))
+    storage.delete(SENSORS_KEY)
 
 def handler(event, context):
     """
     Handler of the lambda function 'LambdaTrafficSensors':
-    Loads the csv file of sensors data generated by 'LambdaTraffic'
-    lambda function and dumps it in 'sensors_database' DynamoDB table.
-    Once items are added, the csv file is deleted from "reconai-traffic" s3 bucket.
-    """
-    csvfile = client.get_object(Bucket='reconai-traffic', Key='sensors_data.csv')
-    csvcontent = csvfile['Body'].read().decode('utf-8')
-    df = pd.read_csv(StringIO(csvcontent))
-    df = df.astype(str)
-    sensors = df.to_dict('records')
-    batch_write('sensors_database', sensors, add_key=True)
-    client.delete_object(Bucket="reconai-traffic", Key='sensors_data.csv')
+    Loads the parquet file of sensors data generated by 'LambdaTraffic'
+    lambda function and dumps it in 'sensors_database' DynamoDB table
+    (numbers are written as DynamoDB Numbers, missing values are not written).
+    Only the readings whose measuredTime changed since the last run are written
+    (see 'sensors_state.parquet' in "reconai-traffic" s3 bucket).
+    Once items are added, the parquet file is deleted from "reconai-traffic" s3 bucket.
+    The stages are measured and printed as CloudWatch embedded metric format log lines.
+
+    Optional event keys:
+    full_write -- if True the state is ignored and every reading is written
+    dataset -- if True the written readings are also appended to the parquet dataset
+    'dataset/sensors/' of "reconai-traffic" s3 bucket (see dataset.py)
+    profile -- if True the run is profiled with cProfile and the profile is saved
+    in 'profiles/' of "reconai-traffic" s3 bucket
+    """
+    event = event or {}
+    recorder = StageRecorder('sensors_handler')
+    profile_key = 'profiles/sensors-{}.prof'.format(datetime.datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%S'))
+    with profiled(event.get('profile'), bucket_storage, profile_key):
+        try:
+            write_sensors(event, recorder)
+        finally:
+            recorder.finish()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Long-running crawler service: runs the 'LambdaTraffic' -> 'LambdaTrafficSensors' pipeline
+periodically in one process (in-process scheduler) instead of two lambda invocations per tick.
+The HTTP session, the S3 and DynamoDB connection pools and the parsed station feeds stay warm
+between ticks. The files are saved in a local directory or in a S3 (or S3 compatible) bucket.
+
+Usage:
+python service.py --storage local --root ./data --interval 300 --dynamodb-endpoint http://localhost:8000
+python service.py --storage s3 --bucket reconai-traffic --s3-endpoint http://localhost:9000
+"""
+# Import libraries
+import sys
+import json
+import time
+import sched
+import signal
+import argparse
+import threading
+import boto3
+import botocore.config
+import handler
+import sensors_handler
+from storage import LocalStorage, S3Storage
+from station_cache import StationCache
+from instrumentation import StageRecorder
+
+DEFAULT_INTERVAL = 300 # in seconds
+
+
+class CrawlerService():
+    """
+    Run the crawl and sensors pipelines every interval seconds with warm resources
+    """
+    def __init__(self, storage, dynamodb=None, interval=DEFAULT_INTERVAL, event=None, sensors_event=None):
+        """
+        Arguments:
+        storage -- storage of the crawler files (LocalStorage or S3Storage)
+        dynamodb -- boto3 DynamoDB resource (created if None)
+        interval -- time between the start of two ticks in seconds
+        event -- options of the crawl (see handler.scrape)
+        sensors_event -- options of the sensors writes (see sensors_handler.handler)
+        """
+        self.storage = storage
+        self.dynamodb = dynamodb or boto3.resource('dynamodb')
+        # station feeds kept in memory across the ticks (and persisted in the storage)
+        self.cache = StationCache(storage)
+        self.interval = interval
+        self.event = dict(event or {})
+        self.sensors_event = dict(sensors_event or {})
+        self.stopping = threading.Event()
+        self.scheduler = sched.scheduler(time.monotonic, self.stopping.wait)
+        self.ticks = 0
+        self.missed = 0
+
+    def tick(self):
+        """
+        Run the pipeline once, an error is logged and does not stop the service
+
+        Return:
+        summary -- summary of the crawl (see handler.scrape), None if the tick failed
+        """
+        self.ticks += 1
+        recorder = StageRecorder('service')
+        summary = None
+        try:
+            summary = handler.crawl(self.event, recorder, self.storage, self.cache, self.dynamodb)
+            sensors_handler.write_sensors(self.sensors_event, recorder, self.storage, self.dynamodb)
+        except Exception as e:
+            print(json.dumps({'tick': self.ticks, 'error': '{}: {}'.format(type(e).__name__, e)}))
+        finally:
+            recorder.finish()
+        return summary
+
+    def run(self, ticks=None):
+        """
+        Run a tick every interval seconds until stop is called (or SIGINT/SIGTERM is received),
+        ticks that are missed because a tick took longer than the interval are skipped
+
+        Arguments:
+        ticks -- number of ticks to run (None: run until stopped)
+        """
+        def scheduled(planned):
+            self.tick()
+            if self.stopping.is_set() or (ticks is not None and self.ticks >= ticks):
+                return
+            following = planned+self.interval
+            now = time.monotonic()
+            while following < now:
+                following += self.interval
+                self.missed += 1
+            self.scheduler.enterabs(following, 0, scheduled, (following,))
+
+        if threading.current_thread() is threading.main_thread():
+            for signum in [signal.SIGINT, signal.SIGTERM]:
+                signal.signal(signum, lambda signum, frame: self.stop())
+        start = time.monotonic()
+        self.scheduler.enterabs(start, 0, scheduled, (start,))
+        self.scheduler.run()
+        print(json.dumps({'ticks': self.ticks, 'missed': self.missed}))
+
+    def stop(self):
+        """
+        Stop the service once the running tick (if any) is finished
+        """
+        self.stopping.set()
+        for event in self.scheduler.queue:
+            try:
+                self.scheduler.cancel(event)
+            except ValueError:
+                pass
+
+
+def make_storage(args):
+    """
+    Create the storage backend from the command line arguments
+    """
+    if args.storage == 'local':
+        return LocalStorage(args.root)
+    cfg = botocore.config.Config(max_pool_connections=handler.MAX_WORKERS, retries={'mode': 'standard'})
+    client = boto3.client('s3', endpoint_url=args.s3_endpoint, region_name=args.region, config=cfg)
+    return S3Storage(client, args.bucket, handler.transfer_config)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--storage', choices=['local', 's3'], default='local')
+    parser.add_argument('--root', default='data', help='directory of the local storage')
+    parser.add_argument('--bucket', default='reconai-traffic', help='bucket of the s3 storage')
+    parser.add_argument('--s3-endpoint', help='url of a S3 compatible server')
+    parser.add_argument('--dynamodb-endpoint', help='url of a DynamoDB compatible server')
+    parser.add_argument('--region', default='eu-central-1')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help='seconds between two ticks')
+    parser.add_argument('--ticks', type=int, help='number of ticks (default: run until stopped)')
+    parser.add_argument('--event', type=json.loads, default={}, help='options of the crawl (json)')
+    parser.add_argument('--sensors-event', type=json.loads, default={}, help='options of the sensors writes (json)')
+    args = parser.parse_args()
+
+    dynamodb = boto3.resource('dynamodb', endpoint_url=args.dynamodb_endpoint, region_name=args.region,
+                              config=botocore.config.Config(max_pool_connections=handler.MAX_WORKERS))
+    service = CrawlerService(make_storage(args), dynamodb, args.interval, args.event, args.sensors_event)
+    service.run(args.ticks)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only archive of the raw json feeds downloaded at each crawl (snapshots), in a local directory:
+    segment-NNNNNN.bin -- compressed feeds appended one after the other (zstd if the zstandard
+                          package is installed, gzip otherwise), a new segment is started once
+                          a segment reaches SEGMENT_SIZE bytes
+    index.jsonl        -- one line per snapshot: time and location (segment, offset, length,
+                          codec, digest) of each feed
+A feed identical to an already archived one (the slowly changing station feeds) is not written
+again: the index points to the archived copy. Snapshots are read back by time with random access
+to the memory-mapped segments (no full file read).
+
+Usage:
+python snapshot_archive.py import data/archive --root data/snapshots
+python snapshot_archive.py list --root data/snapshots
+python snapshot_archive.py get 2020-05-01T12-00-00 --feed camera-data --root data/snapshots > camera-data.json
+"""
+# Import libraries
+import os
+import sys
+import gzip
+import json
+import mmap
+import bisect
+import hashlib
+import argparse
+import datetime
+from io import BytesIO
+try:
+    import zstandard
+except ImportError:
+    # optional: the feeds are gzip compressed
+    zstandard = None
+
+INDEX_FILE = 'index.jsonl'
+SEGMENT_SIZE = 256*1024*1024 # in bytes
+TIME_FORMAT = '%Y-%m-%dT%H-%M-%S' # same as the 'archive/<time>/' directories of the handler
+DEFAULT_CODEC = 'zstd' if zstandard is not None else 'gzip'
+
+
+def snapshot_time(timestamp):
+    """
+    Name of a snapshot: datetime formatted with TIME_FORMAT, strings are kept as they are
+    """
+    if isinstance(timestamp, datetime.datetime):
+        return timestamp.strftime(TIME_FORMAT)
+    return timestamp
+
+def compress(body, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    return gzip.compress(body, compresslevel=6)
+
+def decompress(blob, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError('the zstandard package is needed to read zstd compressed feeds')
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return gzip.decompress(blob)
+
+def feed_body(data):
+    """
+    Raw json of a feed: loaded data, raw json binary file object or bytes
+    """
+    if isinstance(data, BytesIO):
+        return data.getvalue()
+    if isinstance(data, bytes):
+        return data
+    return json.dumps(data).encode('utf-8')
+
+def is_archive(root):
+    """
+    Check if a directory is a snapshot archive
+    """
+    return os.path.exists(os.path.join(root, INDEX_FILE))
+
+
+class SnapshotArchive():
+    """
+    Append-only archive of snapshots with deduplicated feeds and random access by time
+    """
+    def __init__(self, root, codec=DEFAULT_CODEC, segment_size=SEGMENT_SIZE):
+        """
+        Arguments:
+        root -- directory of the archive (created if needed)
+        codec -- compression of the appended feeds: 'zstd' or 'gzip'
+        segment_size -- size (in bytes) from which a new segment is started
+        """
+        if codec == 'zstd' and zstandard is None:
+            raise ImportError('the zstandard package is needed for the zstd codec')
+        self.root = root
+        self.codec = codec
+        self.segment_size = segment_size
+        self.times = []
+        self.entries = []
+        # digest of an archived feed: its location
+        self.digests = {}
+        self.maps = {}
+        os.makedirs(root, exist_ok=True)
+        path = os.path.join(root, INDEX_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        self.add_entry(json.loads(line))
+
+    def add_entry(self, entry):
+        self.times.append(entry['time'])
+        self.entries.append(entry)
+        for location in entry['feeds'].values():
+            self.digests[location[4]] = location
+
+    def segment_path(self, segment):
+        return os.path.join(self.root, 'segment-{:06d}.bin'.format(segment))
+
+    def append(self, timestamp, payloads):
+        """
+        Append a snapshot, the feeds already archived are only referenced
+
+        Arguments:
+        timestamp -- time of the snapshot (datetime or string formatted with TIME_FORMAT), after
+        the last archived one
+        payloads -- dictionary file name: loaded data (or raw json binary file object / bytes)
+
+        Return:
+        written -- number of compressed bytes written
+        """
+        time = snapshot_time(timestamp)
+        if self.times and time <= self.times[-1]:
+            raise ValueError('snapshot {} is not after the last archived one {}'.format(time, self.times[-1]))
+        segment = max([location[0] for location in self.digests.values()], default=0)
+        if os.path.exists(self.segment_path(segment)) and os.path.getsize(self.segment_path(segment)) >= self.segment_size:
+            segment += 1
+        feeds = {}
+        written = 0
+        with open(self.segment_path(segment), 'ab') as f:
+            for file_name, data in payloads.items():
+                body = feed_body(data)
+                digest = hashlib.sha1(body).hexdigest()
+                if digest not in self.digests:
+                    blob = compress(body, self.codec)
+                    f.seek(0, os.SEEK_END)
+                    self.digests[digest] = [segment, f.tell(), len(blob), self.codec, digest]
+                    f.write(blob)
+                    written += len(blob)
+                feeds[file_name] = self.digests[digest]
+        # the index line is written last: feeds appended by an interrupted snapshot are never referenced
+        entry = {'time': time, 'feeds': feeds}
+        with open(os.path.join(self.root, INDEX_FILE), 'a') as f:
+            f.write(json.dumps(entry)+'\n')
+        self.times.append(time)
+        self.entries.append(entry)
+        return written
+
+    def select(self, since=None, until=None):
+        """
+        Times of the snapshots in a range, bounds included (prefixes of the times, e.g. '2020-05-01',
+        None for an open range)
+        """
+        return [time for time in self.times
+                if (since is None or time >= since) and (until is None or time[:len(until)] <= until)]
+
+    def locate(self, timestamp):
+        """
+        Index entry of the last snapshot at or before a time (KeyError if there is none)
+        """
+        position = bisect.bisect_right(self.times, snapshot_time(timestamp))
+        if position == 0:
+            raise KeyError('no snapshot at or before {}'.format(snapshot_time(timestamp)))
+        return self.entries[position-1]
+
+    def segment_map(self, segment, end):
+        """
+        Memory map of a segment, mapped again if it grew past the mapped size
+        """
+        segment_map = self.maps.get(segment)
+        if segment_map is None or len(segment_map) < end:
+            if segment_map is not None:
+                segment_map.close()
+            with open(self.segment_path(segment), 'rb') as f:
+                segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[segment] = segment_map
+        return segment_map
+
+    def feed_digest(self, timestamp, file_name):
+        """
+        Digest (sha1 of the raw json) of a feed of the last snapshot at or before a time, None if the
+        snapshot does not contain the feed (identical feeds have the same digest)
+        """
+        location = self.locate(timestamp)['feeds'].get(file_name)
+        return location[4] if location is not None else None
+
+    def read_feed(self, timestamp, file_name):
+        """
+        Raw json (bytes) of a feed of the last snapshot at or before a time, None if the snapshot
+        does not contain the feed
+        """
+        location = self.locate(timestamp)['feeds'].get(file_name)
+        if location is None:
+            return None
+        segment, offset, length, codec, _ = location
+        return decompress(self.segment_map(segment, offset+length)[offset:offset+length], codec)
+
+    def read(self, timestamp, feeds=None):
+        """
+        Load the feeds of the last snapshot at or before a time
+
+        Arguments:
+        timestamp -- time of the snapshot (datetime or string formatted with TIME_FORMAT)
+        feeds -- names of the feeds to load (default: every feed of the snapshot)
+
+        Return:
+        payloads -- dictionary file name: loaded data
+        """
+        entry = self.locate(timestamp)
+        return {file_name: json.loads(self.read_feed(entry['time'], file_name))
+                for file_name in (feeds or entry['feeds']) if file_name in entry['feeds']}
+
+    def close(self):
+        for segment_map in self.maps.values():
+            segment_map.close()
+        self.maps = {}
+
+
+def import_directories(archive, directory):
+    """
+    Append the 'archive/<time>/' directories of the handler (gzip compressed json files)
+    that are more recent than the last archived snapshot
+
+    Return:
+    imported -- number of imported snapshots
+    """
+    imported = 0
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isdir(path) or (archive.times and name <= archive.times[-1]):
+            continue
+        payloads = {}
+        for file_name in sorted(os.listdir(path)):
+            with open(os.path.join(path, file_name), 'rb') as f:
+                body = f.read()
+            if file_name.endswith('.json.gz'):
+                payloads[file_name[:-len('.json.gz')]] = gzip.decompress(body)
+            elif file_name.endswith('.json'):
+                payloads[file_name[:-len('.json')]] = body
+        if payloads:
+            archive.append(name, payloads)
+            imported += 1
+    return imported
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('command', choices=['import', 'list', 'get'])
+    parser.add_argument('argument', nargs='?', help="directory of the 'archive/<time>/' folders (import), time (get)")
+    parser.add_argument('--root', default='snapshots', help='directory of the snapshot archive')
+    parser.add_argument('--codec', choices=['zstd', 'gzip'], default=DEFAULT_CODEC)
+    parser.add_argument('--feed', default='camera-data', help='feed printed by get')
+    args = parser.parse_args()
+
+    archive = SnapshotArchive(args.root, args.codec)
+    if args.command == 'import':
+        print(json.dumps({'imported': import_directories(archive, args.argument), 'snapshots': len(archive.times)}))
+    elif args.command == 'list':
+        for entry in archive.entries:
+            print(entry['time'], ' '.join(sorted(entry['feeds'])))
+    else:
+        body = archive.read_feed(args.argument, args.feed)
+        if body is None:
+            print('no {} in the snapshot'.format(args.feed), file=sys.stderr)
+            return 1
+        sys.stdout.buffer.write(body)
+    archive.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of the parsed station metadata ('camera-stations' and 'weather-stations' feeds).
+These feeds change about once a day: they are only downloaded again when the cached
+version is older than the TTL, and even then with a conditional request (ETag / Last-Modified).
+The cache is kept in memory and persisted with a storage backend (see storage.py)
+so it survives between invocations. The raw json of the feeds can also be kept, for the
+archives of the snapshots (see bodies).
+"""
+# Import libraries
+import time
+import pickle
+from utils import stations_metadata
+
+STATION_FEEDS = ['camera-stations', 'weather-stations']
+DEFAULT_TTL = 24*3600 # in seconds
+CACHE_KEY = 'station_cache.pkl'
+
+# Parser of each feed: loaded json -> part of the stations metadata
+parsers = {'weather-stations': lambda data: stations_metadata(data_weather_stations=data),
+           'camera-stations': lambda data: stations_metadata(data_camera_stations=data)}
+
+
+class StationCache():
+    """
+    TTL cache of the parsed station feeds and of their derived data
+    (weather stations map, co-located weather stations, camera stations coordinates)
+    """
+    def __init__(self, storage, ttl=DEFAULT_TTL, key=CACHE_KEY):
+        """
+        Arguments:
+        storage -- storage backend where the cache is persisted (LocalStorage or S3Storage)
+        ttl -- time (in seconds) during which a cached feed is used without revalidation
+        key -- key of the cache in the storage
+        """
+        self.storage = storage
+        self.ttl = ttl
+        self.key = key
+        self.entries = None
+
+    def load(self):
+        """
+        Load the persisted cache (once)
+
+        Return:
+        entries -- dictionary feed: {url, etag, last_modified, checked, metadata, body}
+        """
+        if self.entries is None:
+            data = self.storage.read(self.key)
+            self.entries = pickle.loads(data) if data else {}
+        return self.entries
+
+    def refresh(self, feed, url, session, timeout, keep_body=False):
+        """
+        Download a feed (conditionally if it is already cached) and parse it, with keep_body the
+        raw json is also cached (the feed is downloaded unconditionally if it was cached without it)
+        """
+        entry = self.entries.get(feed)
+        headers = {}
+        if entry is not None and entry['url'] == url and (not keep_body or entry.get('body') is not None):
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        with session.get(url, headers=headers, timeout=timeout) as r:
+            if r.status_code == 304:
+                entry['checked'] = time.time()
+                return
+            r.raise_for_status()
+            self.entries[feed] = {'url': url, 'etag': r.headers.get('ETag'),
+                                  'last_modified': r.headers.get('Last-Modified'),
+                                  'checked': time.time(), 'metadata': parsers[feed](r.json()),
+                                  'body': r.content if keep_body else None}
+
+    def get(self, urls, session, timeout=30, ttl=None, bodies=False):
+        """
+        Get the stations metadata, the feeds are only downloaded if they are not cached
+        or their cached version is expired
+
+        Arguments:
+        urls -- dictionary feed name ('camera-stations', 'weather-stations'): url of the feed
+        session -- requests session used for the downloads
+        timeout -- timeout of the http requests in seconds
+        ttl -- overrides the TTL of the cache
+        bodies -- if True the raw json of the feeds is cached too (see bodies)
+
+        Return:
+        metadata -- parsed stations metadata (see utils.stations_metadata)
+        """
+        entries = self.load()
+        ttl = self.ttl if ttl is None else ttl
+        updated = False
+        for feed in STATION_FEEDS:
+            entry = entries.get(feed)
+            url = urls.get(feed, entry['url'] if entry else None)
+            if url is None:
+                raise ValueError('no url found for the {} feed'.format(feed))
+            if (entry is not None and entry['url'] == url and time.time()-entry['checked'] < ttl
+                    and (not bodies or entry.get('body') is not None)):
+                continue
+            try:
+                self.refresh(feed, url, session, timeout, keep_body=bodies)
+                updated = True
+            except Exception as e:
+                # keep using the stale version of the feed rather than failing the run
+                if entry is None:
+                    raise
+                print('stale {} used: {}: {}'.format(feed, type(e).__name__, e))
+        if updated:
+            self.storage.write(self.key, pickle.dumps(entries))
+        return self.metadata()
+
+    def metadata(self):
+        """
+        Get the stations metadata of the cache as it is (no download nor revalidation),
+        e.g. to process archived snapshots that do not contain the station feeds
+
+        Return:
+        metadata -- parsed stations metadata (see utils.stations_metadata)
+        """
+        entries = self.load()
+        metadata = {}
+        for feed in STATION_FEEDS:
+            if feed not in entries:
+                raise ValueError('{} is not cached in {}'.format(feed, self.key))
+            metadata.update(entries[feed]['metadata'])
+        return metadata
+
+    def bodies(self):
+        """
+        Get the raw json of the cached feeds, e.g. to archive them with the other feeds of a
+        snapshot without downloading them again (only the feeds cached by get with bodies=True)
+
+        Return:
+        bodies -- dictionary feed name: json (bytes)
+        """
+        entries = self.load()
+        return {feed: entries[feed]['body'] for feed in STATION_FEEDS
+                if feed in entries and entries[feed].get('body') is not None}
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Map-only code: render the Finland map of the camera and weather stations with folium.
+Kept out of data_processing.py so the lambda functions never import folium.
+
+The stations are emitted as two FastMarkerCluster layers: one row of data per station
+(coordinates and popup fields) and a single javascript callback building the markers and
+their popups in the browser, instead of one folium Marker/Popup/Icon object per station.
+"""
+# Import libraries
+import os
+import folium
+import folium.plugins
+
+Finland_COORDINATES = (63.2467777, 25.9209164)
+MAP_FILE = 'Finland_stations_map.html'
+
+# Javascript callbacks of the layers (function expressions): row = [latitude, longitude, popup fields...],
+# the popup html is only built when a marker is clicked
+CAMERA_CALLBACK = """
+function (row) {
+    var icon = L.AwesomeMarkers.icon({icon: 'camera', markerColor: 'red', prefix: 'glyphicon'});
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindTooltip('<b>Camera_Station</b>');
+    marker.bindPopup(function () {
+        return '<b>id_cameraStation: </b>' + row[2] + '<br></br><b>cameraPresets: </b>' + row[3] +
+               '<br></br><b>nearestWeatherStationId: </b>' + row[4] +
+               '<br></br><b>sensors nearby 200m: </b>' + row[5] + '<br></br>';
+    });
+    return marker;
+}"""
+
+WEATHER_CALLBACK = """
+function (row) {
+    var icon = L.AwesomeMarkers.icon({icon: 'cloud', markerColor: 'blue', prefix: 'glyphicon'});
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindTooltip('<b>Weather_Station</b>');
+    marker.bindPopup(function () {
+        return '<b>weatherStationId: </b>' + row[2] + '<br></br><b>stationSensors: </b>' + row[3] +
+               '<br></br><b>cameras nearby 200m: </b>' + row[4] + '<br></br>';
+    });
+    return marker;
+}"""
+
+
+def neighbours_dict(nearby_df, id_column, nearby_column):
+    """
+    Index the nearby stations lists by station id (constant time lookup per marker)
+    """
+    return dict(zip(nearby_df[id_column].tolist(), nearby_df[nearby_column].tolist()))
+
+def station_rows(stations_map, columns, neighbours):
+    """
+    Build the data rows of a layer: [latitude, longitude, fields of the popup..., nearby stations]
+    (stations without coordinates are left out)
+
+    Arguments:
+    stations_map -- stations dataframe (id in columns[0])
+    columns -- columns of the popup fields
+    neighbours -- dictionary station id: list of the nearby stations
+
+    Return:
+    rows -- list of lists
+    """
+    stations = stations_map.dropna(subset=['latitude', 'longitude'])
+    values = [stations[column].tolist() for column in columns]
+    return [[latitude, longitude]+[str(value) for value in fields]+[str(neighbours.get(fields[0], []))]
+            for latitude, longitude, *fields in zip(stations['latitude'].tolist(),
+                                                   stations['longitude'].tolist(), *values)]
+
+def build_station_map(cameraStations_map, weatherStations_map, sensors_nearby_camera, cameras_nearby_sensors):
+    """
+    Build the map of the camera and weather stations
+
+    Arguments:
+    cameraStations_map -- camera stations dataframe (see utils.camera_stations)
+    weatherStations_map -- weather stations dataframe (see utils.weather_stations_map)
+    sensors_nearby_camera -- dataframe of the weather stations nearby (200m) each camera station
+    cameras_nearby_sensors -- dataframe of the camera stations nearby (200m) each weather station
+
+    Return:
+    finland_map -- folium map
+    """
+    sensors_nearby = neighbours_dict(sensors_nearby_camera, 'id_cameraStation', 'sensors_nearby(radius_200m)')
+    cameras_nearby = neighbours_dict(cameras_nearby_sensors, 'id_weatherStation', 'cameras_nearby(radius_200m)')
+    # Create an empty map zoomed in Finland
+    finland_map = folium.Map(location=Finland_COORDINATES, zoom_start=9)
+    folium.plugins.FastMarkerCluster(
+        station_rows(cameraStations_map, ['id_cameraStation', 'cameraPresets', 'nearestWeatherStationId'],
+                     sensors_nearby),
+        callback=CAMERA_CALLBACK, name='Camera stations').add_to(finland_map)
+    folium.plugins.FastMarkerCluster(
+        station_rows(weatherStations_map, ['weatherStationId', 'stationSensors'], cameras_nearby),
+        callback=WEATHER_CALLBACK, name='Weather stations').add_to(finland_map)
+    folium.LayerControl().add_to(finland_map)
+    return finland_map
+
+def render_map(cameraStations_map, weatherStations_map, sensors_nearby_camera, cameras_nearby_sensors, path):
+    """
+    Build and save Suomi map and put pins in the locations of weather stations and camera stations
+
+    Arguments:
+    cameraStations_map, weatherStations_map, sensors_nearby_camera, cameras_nearby_sensors --
+    see build_station_map
+    path -- directory where 'Finland_stations_map.html' is saved
+
+    Return:
+    map_path -- path of the saved map
+    """
+    map_path = os.path.join(path, MAP_FILE)
+    build_station_map(cameraStations_map, weatherStations_map,
+                      sensors_nearby_camera, cameras_nearby_sensors).save(map_path)
+    return map_path
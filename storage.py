@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Storage backends (local filesystem or S3 bucket) used to persist crawler state between runs.
+Both backends expose the same methods: read, write, write_stream, exists, delete, delete_many, list
+and grow_pool.
+"""
+# Import libraries
+import os
+import shutil
+import boto3
+import botocore
+
+
+class LocalStorage():
+    """
+    Store objects as files in a local directory
+    """
+    def __init__(self, root):
+        """
+        Arguments:
+        root -- directory where the objects are saved
+        """
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def read(self, key):
+        """
+        Return the content (bytes) of an object, None if it does not exist
+        """
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, key, data):
+        """
+        Save an object (bytes or str)
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        # write then rename so a concurrent reader never sees a partial object
+        with open(path+'.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path+'.tmp', path)
+
+    def write_stream(self, key, fileobj):
+        """
+        Save an object from a binary file object, copied chunk by chunk
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path+'.tmp', 'wb') as f:
+            shutil.copyfileobj(fileobj, f)
+        os.replace(path+'.tmp', path)
+
+    def exists(self, key):
+        """
+        Check if an object exists
+        """
+        return os.path.isfile(self._path(key))
+
+    def delete(self, key):
+        """
+        Delete an object (if it exists)
+        """
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_many(self, keys):
+        """
+        Delete objects (if they exist)
+        """
+        for key in keys:
+            self.delete(key)
+
+    def list(self, prefix=''):
+        """
+        Return the sorted keys of the objects starting with prefix
+        """
+        keys = []
+        # only walk the deepest directory of the prefix
+        base = prefix.rsplit('/', 1)[0] if '/' in prefix else ''
+        for directory, _, files in os.walk(self._path(base) if base else self.root):
+            relative = os.path.relpath(directory, self.root)
+            parts = [] if relative == '.' else relative.split(os.sep)
+            keys.extend('/'.join(parts+[name]) for name in files if not name.endswith('.tmp'))
+        return sorted(key for key in keys if key.startswith(prefix))
+
+    def grow_pool(self, pool_size):
+        """
+        Nothing to do: the files are written without a connection pool
+        """
+
+
+class S3Storage():
+    """
+    Store objects in a S3 bucket
+    """
+    def __init__(self, client, bucket, transfer_config=None):
+        """
+        Arguments:
+        client -- boto3 s3 client (created with an endpoint_url for a S3 compatible server)
+        bucket -- s3 bucket name
+        transfer_config -- boto3 TransferConfig of the streamed uploads (write_stream)
+        """
+        self.client = client
+        self.bucket = bucket
+        self.transfer_config = transfer_config
+
+    def read(self, key):
+        """
+        Return the content (bytes) of an object, None if it does not exist
+        """
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+        except botocore.exceptions.ClientError as exc:
+            if exc.response['Error']['Code'] in ['404', 'NoSuchKey']:
+                return None
+            raise
+
+    def write(self, key, data):
+        """
+        Save an object (bytes or str)
+        """
+        self.client.put_object(Body=data, Bucket=self.bucket, Key=key)
+
+    def write_stream(self, key, fileobj):
+        """
+        Save an object from a binary file object, uploaded chunk by chunk instead of buffered
+        """
+        self.client.upload_fileobj(fileobj, self.bucket, key, Config=self.transfer_config)
+
+    def exists(self, key):
+        """
+        Check if an object exists
+        """
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except botocore.exceptions.ClientError as exc:
+            if exc.response['Error']['Code'] == '404':
+                return False
+            raise
+
+    def delete(self, key):
+        """
+        Delete an object (if it exists)
+        """
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def delete_many(self, keys):
+        """
+        Delete objects with one request per 1000 keys
+        """
+        keys = list(keys)
+        for i in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': key} for key in keys[i:i+1000]], 'Quiet': True})
+
+    def list(self, prefix=''):
+        """
+        Return the sorted keys of the objects starting with prefix
+        """
+        keys = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(obj['Key'] for obj in page.get('Contents', []))
+        return sorted(keys)
+
+    def grow_pool(self, pool_size):
+        """
+        Recreate the client (same endpoint, region and configuration, default credentials) if its
+        connection pool is smaller than pool_size, the number of concurrent transfers
+
+        Arguments:
+        pool_size -- minimum number of pooled connections
+        """
+        config = self.client.meta.config
+        if config.max_pool_connections < pool_size:
+            self.client = boto3.client('s3', endpoint_url=self.client.meta.endpoint_url,
+                                       region_name=self.client.meta.region_name,
+                                       config=config.merge(botocore.config.Config(max_pool_connections=pool_size)))
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures of the tests: the modules of the repository are imported from its root (and from
+benchmarks/) and the AWS services are replaced by moto (no credentials, no network).
+"""
+# Import libraries
+import os
+import sys
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+# previous implementations and synthetic payloads of the benchmarks (regression checks)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+REGION = 'eu-central-1'
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """
+    Fake credentials and a moto mock of the AWS services
+    """
+    from moto import mock_aws
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', REGION)
+    with mock_aws():
+        yield
+
+@pytest.fixture
+def dynamodb(aws):
+    """
+    boto3 DynamoDB resource of the moto mock
+    """
+    import boto3
+    return boto3.resource('dynamodb', region_name=REGION)
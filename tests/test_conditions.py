@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Regression test of utils.weather_road_conditions (pivot of the condition sensors) against the
+previous get_group loop of benchmarks/bench_conditions.py.
+"""
+# Import libraries
+import pytest
+from utils import sensors_values, weather_road_conditions
+from fixtures import weather_data
+from bench_conditions import loop_weather_road_conditions
+
+
+def edge_stations():
+    """
+    Weather stations missing sensors or descriptions
+    """
+    data_weather = weather_data(range(2000, 2008), seed=0, missing_ratio=0)
+    stations = data_weather['weatherStations']
+    # no condition sensor
+    stations[0]['sensorValues'] = [value for value in stations[0]['sensorValues']
+                                   if value['oldName'] == 'airtemperature1']
+    # condition sensors without description
+    for value in stations[1]['sensorValues']:
+        value['sensorValueDescriptionEn'] = None
+    # only the second sensor of each condition
+    stations[2]['sensorValues'] = [value for value in stations[2]['sensorValues']
+                                   if value['oldName'] in ['roadsurfaceconditions2', 'precipitation']]
+    # faulty first sensors
+    for value in stations[3]['sensorValues']:
+        if value['oldName'] in ['roadsurfaceconditions1', 'precipitationtype']:
+            value['sensorValueDescriptionEn'] = 'The sensor has a fault'
+    # same description on both sensors, 'Dry weather' renamed
+    for value in stations[4]['sensorValues']:
+        if value['oldName'] in ['precipitationtype', 'precipitation']:
+            value['sensorValueDescriptionEn'] = 'Dry weather'
+    # first sensor without description, second one defined
+    for value in stations[5]['sensorValues']:
+        if value['oldName'] == 'roadsurfaceconditions1':
+            value['sensorValueDescriptionEn'] = None
+        if value['oldName'] == 'roadsurfaceconditions2':
+            value['sensorValueDescriptionEn'] = 'Wet'
+    # no sensor at all
+    stations[6]['sensorValues'] = []
+    return data_weather
+
+@pytest.mark.parametrize('data_weather', [weather_data(range(1000, 1120), seed=seed, missing_ratio=ratio)
+                                          for seed, ratio in [(0, 0.15), (1, 0.15), (2, 0.5), (3, 0.8)]]
+                         +[edge_stations()])
+def test_pivot_matches_loop(data_weather):
+    weatherdf = sensors_values(data_weather)
+    expected = loop_weather_road_conditions(data_weather, weatherdf)
+    conditions = weather_road_conditions(data_weather, weatherdf)
+    assert conditions.equals(expected)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the key design and read helpers of the DynamoDB tables (dynamo_tables.py) against moto.
+"""
+# Import libraries
+import pandas as pd
+from dynamo_tables import (table_definition, create_tables, image_items, sensor_items, TableReader,
+                           UNDEFINED_TIME)
+from dynamo_writer import DynamoWriter
+
+
+def images_database():
+    return pd.DataFrame({
+        'id_camera': ['C0100001', 'C0100002', 'C0100101'],
+        'id_cameraStation': ['C01000', 'C01000', 'C01001'],
+        'image_name': ['a', 'b', 'c'],
+        'measuredTime': pd.Series([pd.Timestamp('2020-05-01 10:00', tz='UTC'), UNDEFINED_TIME,
+                                   pd.Timestamp('2020-05-02 23:30', tz='UTC')], dtype=object),
+        'vote_roadCondition': ['Wet', 'Dry', 'undefined'],
+        'vote_weatherCondition': ['Clear', 'Weak rain', 'Heavy rain']})
+
+def sensors_data(readings=30):
+    times = pd.date_range('2020-05-01', periods=readings, freq='H', tz='UTC')
+    df = pd.DataFrame({'weatherStationId': [1001]*readings, 'id_sensor': [1]*readings,
+                       'measuredTime': times, 'sensorValue': [float(i) for i in range(readings)]})
+    # second sensor of the station and a reading without time
+    other = pd.DataFrame({'weatherStationId': [1001, 1002], 'id_sensor': [2, 1],
+                          'measuredTime': [times[0], pd.NaT], 'sensorValue': [1.5, 2.5]})
+    return pd.concat([df, other], ignore_index=True)
+
+def write(dynamodb, table_name, items):
+    metrics = DynamoWriter(table_name, dynamodb=dynamodb).write(items)
+    assert metrics['written'] == len(items)
+
+
+def test_table_definition():
+    definition = table_definition('sensors_database')
+    assert definition['KeySchema'] == [{'AttributeName': 'sensor_key', 'KeyType': 'HASH'},
+                                       {'AttributeName': 'measuredTime', 'KeyType': 'RANGE'}]
+    assert {'AttributeName': 'weatherStationId', 'AttributeType': 'N'} in definition['AttributeDefinitions']
+    definition = table_definition('images_database')
+    assert sorted(index['IndexName'] for index in definition['GlobalSecondaryIndexes']) == [
+        'day-time', 'road-time', 'station-time', 'weather-time']
+
+def test_create_tables(dynamodb):
+    assert sorted(create_tables(dynamodb)) == ['images_database', 'sensors_database']
+    assert create_tables(dynamodb) == []
+    table = dynamodb.meta.client.describe_table(TableName='images_database')['Table']
+    assert [key['AttributeName'] for key in table['KeySchema']] == ['id_camera', 'measuredTime']
+    assert len(table['GlobalSecondaryIndexes']) == 4
+
+def test_image_items():
+    first, undefined, no_road = image_items(images_database())
+    assert first['measuredTime'] == '2020-05-01T10:00:00+00:00'
+    assert (first['day'], first['road_day'], first['weather_day']) == ('2020-05-01', '2#2020-05-01', '0#2020-05-01')
+    # an undefined time is not filled with the time of the previous image: no day, no index keys
+    assert undefined['measuredTime'] == UNDEFINED_TIME
+    assert not {'day', 'road_day', 'weather_day'} & set(undefined)
+    assert undefined['road_code'] == 0
+    # sparse indexes: no road condition code, no road_day
+    assert 'road_code' not in no_road and 'road_day' not in no_road
+    assert no_road['weather_day'] == '3#2020-05-02'
+
+def test_sensor_items():
+    items = sensor_items(sensors_data(2))
+    assert items[0]['sensor_key'] == '1001#1'
+    assert items[0]['measuredTime'] == '2020-05-01T00:00:00+00:00'
+    assert items[-1]['sensor_key'] == '1002#1'
+    assert items[-1]['measuredTime'] == UNDEFINED_TIME
+
+def test_range_queries_across_pages(dynamodb):
+    create_tables(dynamodb)
+    write(dynamodb, 'sensors_database', sensor_items(sensors_data()))
+    write(dynamodb, 'images_database', image_items(images_database()))
+    reader = TableReader(dynamodb, page_size=4)
+    readings = reader.sensor_readings(1001, 1)
+    assert [reading['sensorValue'] for reading in readings] == list(range(30))
+    readings = reader.sensor_readings(1001, 1, start='2020-05-01 05:00', end='2020-05-01T12:00:00+00:00',
+                                      descending=True)
+    assert [reading['sensorValue'] for reading in readings] == list(range(12, 4, -1))
+    # one page at a time
+    items, page = reader.query_page('sensors_database', ('sensor_key', '1001#1'), limit=4)
+    assert len(items) == 4 and page is not None
+    items, page = reader.query_page('sensors_database', ('sensor_key', '1001#1'), limit=4, page=page)
+    assert [item['sensorValue'] for item in items] == [4, 5, 6, 7]
+    # station index (both sensors of the station)
+    assert len(reader.station_readings(1001, end='2020-05-01T00:00')) == 2
+    assert [image['id_camera'] for image in reader.station_images('C01000')] == ['C0100001', 'C0100002']
+    assert [image['id_camera'] for image in reader.images('2020-05-01', '2020-05-03')] == ['C0100001', 'C0100101']
+    assert [image['id_camera'] for image in reader.images('2020-05-01', '2020-05-03', road_condition='Wet')] == ['C0100001']
+    assert reader.images('2020-05-01', '2020-05-03', road_condition='Wet', weather_condition='Heavy rain') == []
+
+def test_scan_fallback_without_index(dynamodb):
+    # table of a previous version: same keys, no secondary index
+    definition = table_definition('sensors_database')
+    del definition['GlobalSecondaryIndexes']
+    definition['AttributeDefinitions'] = [attribute for attribute in definition['AttributeDefinitions']
+                                          if attribute['AttributeName'] != 'weatherStationId']
+    dynamodb.create_table(**definition)
+    write(dynamodb, 'sensors_database', sensor_items(sensors_data()))
+    reader = TableReader(dynamodb, segments=3, page_size=5)
+    readings = reader.station_readings(1001, start='2020-05-01T20:00')
+    assert [reading['sensorValue'] for reading in readings] == list(range(20, 30))
+    assert len(reader.scan('sensors_database')) == 32
+
+def test_start_only_range_excludes_undefined_times(dynamodb):
+    create_tables(dynamodb)
+    write(dynamodb, 'sensors_database', sensor_items(sensors_data(2)))
+    write(dynamodb, 'images_database', image_items(images_database()))
+    reader = TableReader(dynamodb)
+    # 'undefined' sorts after every time, a range without end must not return it
+    assert reader.sensor_readings(1002, 1, start='2020-05-01') == []
+    assert reader.sensor_readings(1002, 1)[0]['measuredTime'] == UNDEFINED_TIME
+    assert reader.camera_images('C0100002', start='2020-05-01') == []
+    assert [image['id_camera'] for image in reader.station_images('C01000', start='2020-05-01')] == ['C0100001']
+    assert [reading['sensorValue'] for reading in reader.station_readings(1002, start='2020-05-01')] == []
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the retries, backoff and rate adaptation of the DynamoDB writer (dynamo_writer.py) with a
+stubbed batch_write_item.
+"""
+# Import libraries
+import time
+import queue
+from types import SimpleNamespace
+import botocore.exceptions
+import pytest
+import dynamo_writer
+from dynamo_writer import DynamoWriter, RateLimiter
+
+TABLE = 'images_database'
+
+
+class StubClient():
+    """
+    DynamoDB client answering batch_write_item from a list of responses: a number of unprocessed
+    requests (the last ones of the batch) or an error code
+    """
+    def __init__(self, responses, capacity=None):
+        self.responses = list(responses)
+        self.capacity = capacity
+        self.calls = []
+
+    def describe_table(self, TableName):
+        if self.capacity is None:
+            return {'Table': {'BillingModeSummary': {'BillingMode': 'PAY_PER_REQUEST'}}}
+        return {'Table': {'ProvisionedThroughput': {'WriteCapacityUnits': self.capacity}}}
+
+    def batch_write_item(self, RequestItems):
+        requests = RequestItems[TABLE]
+        self.calls.append([request['PutRequest']['Item'] for request in requests])
+        response = self.responses.pop(0) if self.responses else 0
+        if isinstance(response, str):
+            raise botocore.exceptions.ClientError({'Error': {'Code': response, 'Message': response}},
+                                                  'BatchWriteItem')
+        return {'UnprocessedItems': {TABLE: requests[len(requests)-response:]} if response else {}}
+
+def make_writer(client, **kwargs):
+    return DynamoWriter(TABLE, workers=1, dynamodb=SimpleNamespace(meta=SimpleNamespace(client=client)),
+                        **kwargs)
+
+def make_items(count):
+    return [{'id_camera': 'C{:07d}'.format(i)} for i in range(count)]
+
+class Clock():
+    """
+    Virtual clock of the writer: sleeping advances the time instead of waiting
+    """
+    def __init__(self):
+        self.now = time.monotonic()
+        self.delays = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.delays.append(delay)
+        # like a real sleep the time always advances (a rounding error of the rate limiter can
+        # ask for a delay too small to change now)
+        self.now += max(delay, 1e-6)
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    """
+    Replace the time module of the writer (the other threads keep the real one)
+    """
+    clock = Clock()
+    monkeypatch.setattr(dynamo_writer, 'time', clock)
+    return clock
+
+
+def test_unprocessed_items_retried(clock):
+    client = StubClient([4, 1])
+    items = make_items(10)
+    metrics = make_writer(client).write(items)
+    assert (metrics['written'], metrics['retries'], metrics['unprocessed'], metrics['throttled']) == (10, 2, 5, 0)
+    assert metrics['failed'] == 0
+    # only the unprocessed items are sent again
+    assert client.calls == [items, items[6:], items[9:]]
+    # two backoffs, then the write rate adapted to the throttling
+    assert clock.delays[0] <= dynamo_writer.BASE_DELAY
+    assert all(0 <= delay <= dynamo_writer.MAX_DELAY for delay in clock.delays)
+
+def test_throttled_request_retried_with_lower_rate():
+    client = StubClient(['ProvisionedThroughputExceededException'], capacity=100)
+    writer = make_writer(client)
+    items = make_items(10)
+    metrics = writer.write(items)
+    assert (metrics['written'], metrics['retries'], metrics['throttled'], metrics['errors']) == (10, 1, 1, 0)
+    assert client.calls == [items, items]
+    assert writer.failed_items == []
+    # decreased by the throttling, then increased by the successful request
+    assert writer.limiter.rate == pytest.approx(100*RateLimiter.decrease+1)
+
+def test_failed_items_after_max_retries():
+    client = StubClient([3]*10)
+    writer = make_writer(client, max_retries=3)
+    items = make_items(30)
+    metrics = writer.write(items)
+    # the last 3 items of each batch are never processed
+    assert (metrics['written'], metrics['retries'], metrics['unprocessed'], metrics['failed']) == (24, 6, 18, 6)
+    assert len(client.calls) == 8
+    assert sorted(item['id_camera'] for item in writer.failed_items) == [
+        item['id_camera'] for item in items[22:25]+items[27:]]
+
+def test_throttling_until_max_retries():
+    client = StubClient(['ThrottlingException']*10)
+    writer = make_writer(client, max_retries=2)
+    items = make_items(5)
+    metrics = writer.write(items)
+    assert (metrics['written'], metrics['retries'], metrics['throttled'], metrics['errors']) == (0, 2, 2, 1)
+    assert writer.failed_items == items
+    assert len(client.calls) == 3
+
+def test_error_not_retried():
+    client = StubClient(['ValidationException'])
+    writer = make_writer(client)
+    metrics = writer.write(make_items(5))
+    assert (metrics['retries'], metrics['errors'], metrics['failed']) == (0, 1, 5)
+    assert len(client.calls) == 1
+
+def test_write_from_queue():
+    client = StubClient([2])
+    writer = make_writer(client)
+    items_queue = queue.Queue()
+    for item in make_items(30)+[None]:
+        items_queue.put(item)
+    metrics = writer.write_from(items_queue)
+    assert (metrics['items'], metrics['written'], metrics['unprocessed'], metrics['failed']) == (30, 30, 2, 0)
+
+def test_rate_limiter_adaptation():
+    limiter = RateLimiter(100, max_rate=110)
+    limiter.throttled(0)
+    assert limiter.rate == pytest.approx(70)
+    # at most one decrease per cooldown
+    limiter.throttled(0)
+    assert limiter.rate == pytest.approx(70)
+    for _ in range(100):
+        limiter.succeeded(25)
+    assert limiter.rate == 110
+    # unlimited: the first throttling starts from the measured throughput, not below min_rate
+    limiter = RateLimiter()
+    limiter.throttled(20)
+    assert limiter.rate == RateLimiter.min_rate
+    assert RateLimiter(100, adapt=False).throttled(0) is None
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Regression test of the vectorized utils.image_names and utils.measured_time_names against the
+previous row-wise apply of benchmarks/bench_image_names.py (the names must be byte-identical).
+"""
+# Import libraries
+import pandas as pd
+import pytest
+from utils import image_names, measured_time_name, measured_time_names
+from fixtures import camera_data
+from bench_image_names import apply_image_names, presets_database
+
+TIMES = {
+    'utc': ['2020-05-01T10:00:00Z', None, '2020-05-01T23:59:59+00:00'],
+    'fractional seconds': ['2020-05-01T10:00:00.250Z', '2020-05-01T10:00:01Z', None],
+    'positive offset': ['2020-05-01T10:00:00+03:00', None, '2020-05-02T00:30:00+03:00'],
+    'negative offset': ['2020-05-01T10:00:00-05:00', '2020-05-01T22:15:30-05:00', None],
+    'mixed offsets': ['2020-05-01T10:00:00-05:00', '2020-05-01T10:00:00+02:00', None],
+    'naive': ['2020-05-01 10:00:00', None, '2020-05-01 10:00:00.000001'],
+    'undefined': [None, None, None]}
+
+
+def images_database(times):
+    measuredTime = pd.to_datetime(pd.Series(times, dtype=object))
+    return pd.DataFrame({'id_camera': ['C0100001', 'C0100002', 'C0100101'], 'measuredTime': measuredTime,
+                         'vote_roadCondition': ['Wet', 'undefined', 'Dry'],
+                         'vote_weatherCondition': ['Heavy rain', 'Clear', 'undefined']})
+
+@pytest.mark.parametrize('times', TIMES.values(), ids=list(TIMES))
+def test_vectorized_names_match_apply(times):
+    images = images_database(times)
+    assert image_names(images).tolist() == apply_image_names(images).tolist()
+    expected = [measured_time_name(time) for time in images['measuredTime'].fillna('undefined')]
+    assert measured_time_names(images['measuredTime']).tolist() == expected
+
+def test_negative_offset_kept():
+    names = measured_time_names(images_database(TIMES['negative offset'])['measuredTime'])
+    assert names.tolist() == ['2020-05-01_10-00-00-05-00', '2020-05-01_22-15-30-05-00', 'undefined']
+
+@pytest.mark.parametrize('seed', range(3))
+def test_synthetic_payloads(seed):
+    stations = ['C%05d' % num for num in range(200)]
+    images = presets_database(camera_data(stations, range(1000, 1100), seed=seed, undefined_ratio=0.2))
+    assert images['measuredTime'].isna().any()
+    assert image_names(images).tolist() == apply_image_names(images).tolist()
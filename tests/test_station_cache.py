@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the station feeds cache (station_cache.py) with a stubbed HTTP session: conditional
+revalidation and the raw json kept for the snapshot archives.
+"""
+# Import libraries
+import json
+import pickle
+from station_cache import StationCache, CACHE_KEY
+from storage import LocalStorage
+from fixtures import weather_stations, camera_stations
+
+URLS = {'camera-stations': 'https://example.com/camera-stations',
+        'weather-stations': 'https://example.com/weather-stations'}
+BODIES = {'camera-stations': json.dumps(camera_stations(['C01000'], [(25.0, 61.0)])).encode(),
+          'weather-stations': json.dumps(weather_stations([1001], [(25.1, 61.1)])).encode()}
+
+
+class Response():
+    def __init__(self, status_code, content=b''):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {'ETag': '"v1"'} if content else {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class StubSession():
+    """
+    HTTP session serving the station feeds, 304 for the revalidation of the same version
+    """
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        feed = url.rsplit('/', 1)[-1]
+        self.requests.append((feed, dict(headers or {})))
+        if (headers or {}).get('If-None-Match') == '"v1"':
+            return Response(304)
+        return Response(200, BODIES[feed])
+
+
+def test_feeds_downloaded_once(tmp_path):
+    session = StubSession()
+    cache = StationCache(LocalStorage(str(tmp_path)))
+    metadata = cache.get(URLS, session)
+    assert set(metadata) == {'weatherStations_map', 'colocated', 'cameraStations_coordinates'}
+    assert cache.get(URLS, session) == metadata
+    assert [feed for feed, _ in session.requests] == ['camera-stations', 'weather-stations']
+    # the raw json is only kept when it is asked for
+    assert cache.bodies() == {}
+    # expired: conditional requests
+    cache.get(URLS, session, ttl=0)
+    assert all(headers == {'If-None-Match': '"v1"'} for _, headers in session.requests[2:])
+
+def test_bodies_kept_for_the_archive(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    session = StubSession()
+    StationCache(storage).get(URLS, session)
+    # cached without the raw json: downloaded again, unconditionally
+    cache = StationCache(storage)
+    cache.get(URLS, session, bodies=True)
+    assert [headers for _, headers in session.requests[2:]] == [{}, {}]
+    assert cache.bodies() == BODIES
+    # persisted, then revalidated (304) without losing the raw json
+    cache = StationCache(storage)
+    cache.get(URLS, session, bodies=True)
+    assert len(session.requests) == 4
+    cache.get(URLS, session, ttl=0, bodies=True)
+    assert [headers for _, headers in session.requests[4:]] == [{'If-None-Match': '"v1"'}]*2
+    assert cache.bodies() == BODIES
+    assert pickle.loads(storage.read(CACHE_KEY))['weather-stations']['body'] == BODIES['weather-stations']
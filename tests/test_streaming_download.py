@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Test of the memory ceiling of the streamed image transfer (handler.save_file_to_s3): a large file
+served by a local HTTP server is uploaded to moto S3 chunk by chunk, the traced memory must not
+grow with the size of the file.
+"""
+# Import libraries
+import gc
+import threading
+import http.server
+import tracemalloc
+import pytest
+from conftest import REGION
+
+FILE_SIZE = 80*1024*1024 # in bytes
+BLOCK = b'\xff'*(1024*1024)
+
+
+def serve_image(size):
+    """
+    Start a local HTTP server of a size bytes image, written block by block (never held in memory)
+
+    Return:
+    server -- the HTTP server (stopped by shutdown)
+    url -- url of the image
+    """
+    class ImageHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            for offset in range(0, size, len(BLOCK)):
+                self.wfile.write(BLOCK[:size-offset])
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:{}/image.jpg'.format(server.server_port)
+
+@pytest.fixture
+def image_server():
+    """
+    url of a FILE_SIZE bytes image
+    """
+    server, url = serve_image(FILE_SIZE)
+    yield url
+    server.shutdown()
+    server.server_close()
+
+def test_streamed_transfer_memory_ceiling(aws, image_server):
+    import boto3
+    import handler
+    from storage import S3Storage
+    client = boto3.client('s3', region_name=REGION)
+    client.create_bucket(Bucket='reconai-traffic', CreateBucketConfiguration={'LocationConstraint': REGION})
+    storage = S3Storage(client, 'reconai-traffic', handler.transfer_config)
+    # moto keeps the request objects of the parts in reference cycles and assembles the whole
+    # object in memory at CompleteMultipartUpload (S3 does it server side): the garbage is collected
+    # after each part and the peak is read before the completion
+    peaks = []
+    client.meta.events.register('after-call.s3.UploadPart', lambda **kwargs: gc.collect())
+    client.meta.events.register('before-call.s3.CompleteMultipartUpload',
+                                lambda **kwargs: peaks.append(tracemalloc.get_traced_memory()[1]))
+    tracemalloc.start()
+    try:
+        result = handler.save_file_to_s3(storage, 'large', 'jpg', image_server)
+    finally:
+        tracemalloc.stop()
+    assert result['status'] == 'saved', result['error']
+    assert client.head_object(Bucket='reconai-traffic', Key='images/large.jpg')['ContentLength'] == FILE_SIZE
+    # a few parts in flight (the part, its checksum and the request copies of the stand-in)
+    assert len(peaks) == 1
+    assert peaks[0] < 10*handler.CHUNK_SIZE < FILE_SIZE
+
+def test_pools_grow_with_the_workers(aws, monkeypatch):
+    import boto3
+    import botocore.config
+    import handler
+    from storage import S3Storage
+    # fresh session: the shared one of the module keeps its pool for the other tests
+    monkeypatch.setattr(handler, 'session', handler.make_session(handler.MAX_WORKERS))
+    config = botocore.config.Config(max_pool_connections=handler.MAX_WORKERS, retries={'max_attempts': 0})
+    client = boto3.client('s3', region_name=REGION, config=config)
+    storage = S3Storage(client, 'reconai-traffic', handler.transfer_config)
+    handler.grow_pools(storage, handler.MAX_WORKERS)
+    assert storage.client is client
+    handler.grow_pools(storage, 2*handler.MAX_WORKERS)
+    assert handler.session.get_adapter('https://x')._pool_maxsize == 2*handler.MAX_WORKERS
+    assert storage.client.meta.config.max_pool_connections == 2*handler.MAX_WORKERS
+    assert storage.client.meta.config.retries == client.meta.config.retries
+    assert storage.client.meta.region_name == REGION
+    # the pools are not shrunk by a later run with fewer workers
+    handler.grow_pools(storage, 4)
+    assert handler.session.pool_size == 2*handler.MAX_WORKERS
+    assert storage.client.meta.config.max_pool_connections == 2*handler.MAX_WORKERS
+
+def test_stream_images_keeps_rows_for_dataset(dynamodb, tmp_path):
+    import pandas as pd
+    import handler
+    from storage import LocalStorage
+    from dynamo_tables import create_tables
+    create_tables(dynamodb)
+    server, url = serve_image(1000)
+    chunks = [pd.DataFrame({'id_camera': ['C010000{}'.format(i) for i in range(3)],
+                            'id_cameraStation': ['C01000']*3,
+                            'image_name': ['C010000{}_image'.format(i) for i in range(3)],
+                            'imageUrl': [url]*3,
+                            'measuredTime': [pd.Timestamp('2020-05-01 10:00', tz='UTC')]*3,
+                            'vote_roadCondition': ['Dry']*3, 'vote_weatherCondition': ['Clear']*3})]
+    try:
+        storage = LocalStorage(str(tmp_path))
+        saved_images, counts, _ = handler.stream_images({'max_workers': 2}, storage, chunks, {}, dynamodb)
+        assert saved_images is None
+        assert (counts['saved'], counts['failed']) == (3, 0)
+        saved_images, counts, _ = handler.stream_images({'max_workers': 2, 'dataset': True}, storage,
+                                                        chunks, {}, dynamodb)
+        assert saved_images['id_camera'].tolist() == ['C0100000', 'C0100001', 'C0100002']
+    finally:
+        server.shutdown()
+        server.server_close()
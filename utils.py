@@ -4,9 +4,15 @@ Contains helper functions.
 """
 
 # Import libraries
+import json
+from functools import lru_cache
 import numpy as np
 import pandas as pd
-from geopy import distance
+try:
+    import ijson
+except ImportError:
+    # optional: only needed to parse 'weather-data' from a file object
+    ijson = None
 
 # Dictionaries of categories for weather and road conditions
 weather_dic = {'Clear':0, 'Weak rain':1, 'Mediocre rain':2, 'Heavy rain':3,
@@ -25,21 +31,33 @@ weather_condition_weights = {'Mist/Fog':0.2, 'Heavy snow/sleet':0.18, 'Mediocre
 
 few_conditions = ['Wet sleet', 'Sleet', 'Ice crystals',
                   'Snow grains', 'Graupel', 'Freezing drizzle', 'Freezing rain']
-def radius_calc(origStation_point, destStation_points_list, id_destStation):
+# Normalization of the precipitation sensors descriptions to the weather categories
+weather_replace = {'Moderate': 'Mediocre', 'Light': 'Weak', 'Abundant': 'Heavy', 'Drizzle': 'Weak rain',
+                   'Hails': 'Heavy snow/sleet', 'Dry': 'Clear', 'Snowfall': 'snow/sleet'}
+# Mean earth radius (in meter) used by the haversine kernel
+EARTH_RADIUS = 6371008.8
+# Maximum relative gap between the haversine (sphere) and geodesic (ellipsoid) distances,
+# distances falling inside this band are confirmed with geopy
+HAVERSINE_TOLERANCE = 0.006
+
+def radius_calc(origStation_point, destStation_points_list, id_destStation, radius=200):
     """
     Calculate the radius and check if an origin(weather or camera station)
     station is inside a 200m radius of a given destination station
+    (reference implementation, one geodesic distance per destination station)
 
     Arguemnts:
     origStation_point -- tuple of the coordinates (latitude, longitude) of origin station
     destStation_points_list -- list of tuples of the coordinates
     (latitude, longitude) of all destination stations
     id_destStation -- list of the ids of all the destination stations
+    radius -- search radius in meter
 
     Return:
     near -- list of the ids of the destination stations that are located nearby the origin station
     """
-    radius = 200 # in meter
+    # geopy is only needed by the map code path: imported on first use
+    from geopy import distance
     near = []
     for num, point in enumerate(destStation_points_list):
         dis = distance.distance(origStation_point, point).m
@@ -49,7 +67,88 @@ def radius_calc(origStation_point, destStation_points_list, id_destStation):
             pass
     return near
 
-def nearby(origStations_map, destStations_map, id_destStation):
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Vectorized great-circle distance between points given in degrees
+
+    Arguments:
+    lat1, lon1 -- coordinates of the first point(s) (scalars or numpy arrays)
+    lat2, lon2 -- coordinates of the second point(s) (scalars or numpy arrays)
+
+    Return:
+    dist -- distance(s) in meter
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2-lat1)/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((lon2-lon1)/2)**2
+    return 2*EARTH_RADIUS*np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+class StationIndex():
+    """
+    Grid spatial index over station coordinates: stations are bucketed in cells
+    larger than the search radius so only the 3x3 neighbouring cells of a query
+    point have to be checked
+    """
+    def __init__(self, latitudes, longitudes, ids, radius=200):
+        """
+        Arguments:
+        latitudes -- latitudes of the indexed stations
+        longitudes -- longitudes of the indexed stations
+        ids -- ids of the indexed stations (same order as the coordinates)
+        radius -- search radius in meter
+        """
+        self.latitudes = np.asarray(latitudes, dtype='float64')
+        self.longitudes = np.asarray(longitudes, dtype='float64')
+        self.ids = list(ids)
+        self.radius = radius
+        # cells are 1.5 times the (tolerance extended) radius to absorb the
+        # latitude variation inside a cell
+        reach = 1.5*radius*(1+HAVERSINE_TOLERANCE)
+        valid = np.isfinite(self.latitudes) & np.isfinite(self.longitudes)
+        max_lat = np.abs(self.latitudes[valid]).max() if valid.any() else 0.0
+        self.cell_lat = np.degrees(reach/EARTH_RADIUS)
+        self.cell_lon = self.cell_lat/max(np.cos(np.radians(min(max_lat + self.cell_lat, 89.0))), 1e-6)
+        self.cells = {}
+        for num in np.flatnonzero(valid):
+            key = self._cell(self.latitudes[num], self.longitudes[num])
+            self.cells.setdefault(key, []).append(num)
+        self.cells = {key: np.array(nums) for key, nums in self.cells.items()}
+
+    def _cell(self, lat, lon):
+        return int(np.floor(lat/self.cell_lat)), int(np.floor(lon/self.cell_lon))
+
+    def query(self, lat, lon):
+        """
+        Find the indexed stations located inside the radius of a given point
+
+        Arguments:
+        lat, lon -- coordinates of the query point
+
+        Return:
+        near -- list of the ids of the indexed stations nearby the point (in index order)
+        """
+        if not (np.isfinite(lat) and np.isfinite(lon)):
+            return []
+        row, col = self._cell(lat, lon)
+        candidates = [self.cells[key] for key in ((row+i, col+j) for i in (-1, 0, 1) for j in (-1, 0, 1))
+                      if key in self.cells]
+        if not candidates:
+            return []
+        candidates = np.sort(np.concatenate(candidates))
+        dist = haversine(lat, lon, self.latitudes[candidates], self.longitudes[candidates])
+        near = []
+        for num, dis in zip(candidates, dist):
+            if dis > self.radius*(1+HAVERSINE_TOLERANCE):
+                continue
+            if dis >= self.radius*(1-HAVERSINE_TOLERANCE):
+                # ambiguous distance: fall back to the geodesic distance
+                from geopy import distance
+                dis = distance.distance((lat, lon), (self.latitudes[num], self.longitudes[num])).m
+                if dis > self.radius:
+                    continue
+            near.append(self.ids[num])
+        return near
+
+def nearby(origStations_map, destStations_map, id_destStation, radius=200):
     """
     Check for the nearby stations
 
@@ -57,19 +156,16 @@ def nearby(origStations_map, destStations_map, id_destStation):
     origStations_map -- origin stations dataframe (to build the map)
     destStations_map -- destination stations dataframe (to build the map)
     id_destStation -- list of the ids of all the destination stations
+    radius -- search radius in meter
 
     Return:
     nearby_200m -- list of list of the ids of all the destination stations
     located nearby each origin station
     """
-    destStation_points_list = list(zip(destStations_map['latitude'].tolist(),
-                                       destStations_map['longitude'].tolist()))
-    nearby_200m = []
-    for i in range(len(origStations_map)):
-        origStation_point = (origStations_map.iloc[i]['latitude'],
-                             origStations_map.iloc[i]['longitude'])
-        near = radius_calc(origStation_point, destStation_points_list, id_destStation)
-        nearby_200m.append(near)
+    index = StationIndex(destStations_map['latitude'].values,
+                         destStations_map['longitude'].values, id_destStation, radius)
+    nearby_200m = [index.query(lat, lon) for lat, lon in zip(origStations_map['latitude'].values,
+                                                             origStations_map['longitude'].values)]
     return nearby_200m
 
 def weather_intensity(x):
@@ -91,43 +187,253 @@ def weather_intensity(x):
             x = 'snow/sleet'
     return x
 
-def sensors_values(data_weather):
+@lru_cache(maxsize=None)
+def vote_road(road_condition):
     """
-    Extract informations from selected sensors
+    Vote between different road conditions provided by sensors of similar types
+    (memoized: the number of distinct combined conditions is small)
 
     Arguments:
-    data_weather -- loaded data from 'weather-data.json'
+    road_condition -- combined results of road conditions sensors ('cond1 / cond2 / ...')
+
+    Return:
+    vote -- voted road condition
+    """
+    road_condition = road_condition.split(' / ')
+    if len(road_condition) == 1:
+        return road_condition[0]
+    occur = [road_condition.count(cond) for cond in road_condition]
+    if len(list(set(occur))) == 1:
+        return max(road_condition, key=lambda cond: road_condition_weights[cond])
+    return road_condition[occur.index(max(occur))]
+
+@lru_cache(maxsize=None)
+def vote_weather(weather_condition):
+    """
+    Normalize (see weather_replace and weather_intensity) and vote between different
+    weather conditions provided by sensors of similar types (memoized)
+
+    Arguments:
+    weather_condition -- combined results of weather conditions sensors ('cond1 / cond2')
+
+    Return:
+    vote -- voted weather condition (NaN if it does not match any category)
+    """
+    weather_condition = weather_intensity(weather_replace.get(weather_condition, weather_condition))
+    weather_condition = weather_condition.split(' / ')
+    if len(weather_condition) == 1:
+        if weather_condition[0] in weather_condition_weights:
+            return weather_condition[0]
+        if weather_condition[0] == 'snow/sleet' or weather_condition[0] == 'Rain':
+            return 'Weak '+weather_condition[0].lower()
+        return np.nan
+    varia = [j in weather_condition_weights for j in weather_condition]
+    if sum(varia) == 1:
+        return weather_condition[varia.index(True)]
+    if sum(varia) > 1:
+        return max(weather_condition, key=lambda cond: weather_condition_weights[cond])
+    if weather_condition[1].title()+' '+weather_condition[0].lower() in weather_condition_weights:
+        return weather_condition[1].title()+' '+weather_condition[0].lower()
+    return np.nan
+
+def vote_conditions(conditions, vote):
+    """
+    Apply a vote function once per distinct condition and map the results on the column
+
+    Arguments:
+    conditions -- series (or list) of combined conditions (NaN if undefined)
+    vote -- vote function (vote_road or vote_weather)
+
+    Return:
+    votes -- series of the voted conditions (NaN if undefined)
+    """
+    conditions = pd.Series(conditions, dtype=object)
+    lookup = {condition: vote(condition) for condition in conditions.dropna().unique()
+              if type(condition) == str}
+    return conditions.map(lookup)
+
+def measured_time_name(measured_time):
+    """
+    Format a measuredTime for the image name ('2020-05-01 10:00:00+00:00' -> '2020-05-01_10-00-00')
+
+    Arguments:
+    measured_time -- timestamp (or 'undefined')
+
+    Return:
+    name -- formatted measuredTime
+    """
+    return str(measured_time).replace(' ', '_').split('+')[0].replace(':', '-')
+
+def measured_time_names(measuredTime):
+    """
+    Vectorized measured_time_name
+
+    Arguments:
+    measuredTime -- series of timestamps (NaT if undefined)
+
+    Return:
+    names -- series of formatted measuredTime ('undefined' for NaT)
+    """
+    if pd.api.types.is_datetime64_any_dtype(measuredTime):
+        defined = measuredTime.dropna()
+        whole_seconds = ((defined.dt.microsecond == 0) & (defined.dt.nanosecond == 0)).all()
+        if measuredTime.dt.tz is None:
+            positive_offset = True
+        else:
+            positive_offset = (defined.dt.tz_localize(None) >= defined.dt.tz_convert(None)).all()
+        # fast path: str(Timestamp) prints neither fractional seconds nor a negative offset
+        if whole_seconds and positive_offset:
+            local_times = measuredTime if measuredTime.dt.tz is None else measuredTime.dt.tz_localize(None)
+            names = pd.Series(np.datetime_as_string(local_times.values, unit='s'), index=measuredTime.index)
+            names = names.str.replace('T', '_', regex=False).str.replace(':', '-', regex=False)
+            return names.where(measuredTime.notna(), 'undefined')
+    names = measuredTime.fillna('undefined')
+    return names.map({time: measured_time_name(time) for time in names.unique()})
+
+def image_names(images_database):
+    """
+    Build the names of the images: 'camera id'_r'road_condition'_w'weather_condition'_'measuredTime'
+
+    Arguments:
+    images_database -- dataframe of the images: id_camera, vote_roadCondition,
+    vote_weatherCondition and measuredTime (timestamps, NaT if undefined)
+
+    Return:
+    names -- series of the images names
+    """
+    road_codes = images_database['vote_roadCondition'].map({k: str(v) for k, v in road_dic.items()})
+    weather_codes = images_database['vote_weatherCondition'].map({k: str(v) for k, v in weather_dic.items()})
+    return (images_database['id_camera'].astype(str)+'_r'+road_codes.fillna('nan')+'_w'+
+            weather_codes.fillna('nan')+'_'+measured_time_names(images_database['measuredTime']))
+
+def typed_images(images_database):
+    """
+    Type the images database: measuredTime as UTC datetimes (NaT if undefined), codes of the
+    voted conditions as integers (road_code, weather_code, <NA> if undefined, see road_dic
+    and weather_dic)
+
+    Arguments:
+    images_database -- dataframe of the images (see TrafficCrawler.build_dataset)
+
+    Return:
+    images -- typed copy of the dataframe
+    """
+    images = images_database.copy()
+    # 'undefined' is coerced to NaT (replace('undefined', None) would pad on older pandas)
+    images['measuredTime'] = pd.to_datetime(images['measuredTime'], errors='coerce', utc=True)
+    images['road_code'] = images['vote_roadCondition'].map(road_dic).astype('Int64')
+    images['weather_code'] = images['vote_weatherCondition'].map(weather_dic).astype('Int64')
+    return images
+
+def iter_sensor_values(data_weather, station_ids=None):
+    """
+    Generator of the sensors values of the weather stations
+
+    Arguments:
+    data_weather -- loaded data from 'weather-data.json', or a binary file object of
+    'weather-data.json' (parsed incrementally if ijson is installed)
+    station_ids -- if given only the sensors of these weather stations are generated
+
+    Return:
+    sensor -- dictionary of a sensor value (id, roadStationId, oldName, sensorValue...)
+    """
+    if hasattr(data_weather, 'read'):
+        if ijson is None:
+            data_weather = json.load(data_weather)
+        else:
+            sensors = ijson.items(data_weather, 'weatherStations.item.sensorValues.item', use_float=True)
+            for sensor in sensors:
+                if station_ids is None or sensor.get('roadStationId') in station_ids:
+                    yield sensor
+            return
+    for station in data_weather['weatherStations']:
+        for sensor in station['sensorValues']:
+            if station_ids is None or sensor.get('roadStationId') in station_ids:
+                yield sensor
+
+def sensors_chunk(columns):
+    """
+    Convert lists of sensors values to a typed dataframe: categorical names/units/descriptions,
+    numeric ids and values, datetime measuredTime
+    """
+    chunk = pd.DataFrame({name: pd.Series(values) for name, values in columns.items()})
+    for name in ['oldName', 'sensorUnit', 'sensorValueDescriptionEn']:
+        chunk[name] = pd.Categorical(columns[name])
+    chunk['measuredTime'] = pd.to_datetime(chunk['measuredTime'])
+    return chunk
+
+def concat_sensors_chunks(chunks):
+    """
+    Concatenate typed sensors chunks, keeping the categorical columns categorical
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+    weatherdf = pd.concat(chunks, ignore_index=True)
+    for name in ['oldName', 'sensorUnit', 'sensorValueDescriptionEn']:
+        weatherdf[name] = pd.api.types.union_categoricals([chunk[name] for chunk in chunks])
+    return weatherdf
+
+def sensors_values(data_weather, station_ids=None, chunk_size=100000):
+    """
+    Extract informations from selected sensors, the columns are built incrementally
+    (chunk by chunk) with compact types
+
+    Arguments:
+    data_weather -- loaded data from 'weather-data.json' (or binary file object, see iter_sensor_values)
+    station_ids -- if given only the sensors of these weather stations are kept
+    chunk_size -- number of sensors values converted at once
 
     Return:
     weatherdf -- dataframe that contains specific sensors informations
     """
-    weather = data_weather['weatherStations']
-    sensors_values = [dico['sensorValues'] for dico in weather]
-    sensors_values = [d[i] for d in sensors_values for i in range(len(d))]
-    sensors_info = [list(map(dico.get, ['id', 'roadStationId', 'oldName',
-                                        'sensorValue', 'sensorUnit',
-                                        'sensorValueDescriptionEn',
-                                        'measuredTime'])) for dico in sensors_values]
+    fields = ['id', 'roadStationId', 'oldName', 'sensorValue', 'sensorUnit',
+              'sensorValueDescriptionEn', 'measuredTime']
     list_columns = ['id_sensor', 'roadStationId', 'oldName', 'sensorValue',
                     'sensorUnit', 'sensorValueDescriptionEn', 'measuredTime']
-    weatherdf = pd.DataFrame(sensors_info, columns=list_columns)
-    weatherdf['measuredTime'] = pd.to_datetime(weatherdf['measuredTime'])
+    chunks = []
+    columns = {name: [] for name in list_columns}
+    for sensor in iter_sensor_values(data_weather, station_ids):
+        for name, field in zip(list_columns, fields):
+            columns[name].append(sensor.get(field))
+        if len(columns['id_sensor']) == chunk_size:
+            chunks.append(sensors_chunk(columns))
+            columns = {name: [] for name in list_columns}
+    if columns['id_sensor'] or not chunks:
+        chunks.append(sensors_chunk(columns))
+    weatherdf = concat_sensors_chunks(chunks)
     weatherdf.sort_values(by='measuredTime', inplace=True)
     return weatherdf
 
-def weather_stations(data_weather_stations, data_weather, weatherdf):
+def weather_stations_ids(data_camera, colocated):
+    """
+    Get the ids of the weather stations whose sensors are used to label the images:
+    the nearest weather stations of the camera stations and their co-located stations
+
+    Arguments:
+    data_camera -- loaded data from 'data-camera.json'
+    colocated -- (id1, id2) pairs of co-located weather stations (see colocated_weather_stations)
+
+    Return:
+    station_ids -- set of weather stations ids
+    """
+    station_ids = set(station['nearestWeatherStationId'] for station in data_camera['cameraStations']
+                      if station.get('nearestWeatherStationId') is not None)
+    id1, id2 = colocated
+    partners = dict(zip(id1, id2))
+    partners.update(zip(id2, id1))
+    station_ids.update([partners[station_id] for station_id in list(station_ids) if station_id in partners])
+    return station_ids
+
+def weather_stations_map(data_weather_stations):
     """
-    Get the informations that are related to the weather stations and their sensors
+    Get the informations that are related to the weather stations
 
     Arguments:
     data_weather_stations -- loaded data from 'weather-stations.json'
-    data_weather -- loaded data from 'weather-data.json'
-    weatherdf -- dataframe that contains specific sensors informations
 
     Return:
     weatherStations_map -- weather stations dataframe :
     id, location and stations sensors (to build the map)
-    sensors_data -- dataframe that contains all sensors with their respective coordinates
     """
     coordinates_weatherStation = list(zip(*[sub_dict['geometry']['coordinates'] for sub_dict in data_weather_stations['features']]))
     ids_weatherStation = [sub_dict['id'] for sub_dict in data_weather_stations['features']]
@@ -137,20 +443,93 @@ def weather_stations(data_weather_stations, data_weather, weatherdf):
                                  'latitude': list(coordinates_weatherStation[1]),
                                  "stationSensors":sensors_weatherStation}
     weatherStations_map = pd.DataFrame(coord_weatherStation_dict)
+    return weatherStations_map
+
+def sensors_coordinates(weatherdf, weatherStations_map):
+    """
+    Associate the sensors to the coordinates of their weather station
+
+    Arguments:
+    weatherdf -- dataframe that contains specific sensors informations
+    weatherStations_map -- weather stations dataframe (see weather_stations_map)
+
+    Return:
+    sensors_data -- dataframe that contains all sensors with their respective coordinates
+    """
     sensors_data = weatherdf.merge(weatherStations_map[['weatherStationId',
                                                         'longitude', 'latitude']],
                                    left_on='roadStationId',
                                    right_on='weatherStationId')
     sensors_data.drop(columns='roadStationId', inplace=True)
-    return weatherStations_map, sensors_data
+    return sensors_data
 
-def camera_stations(data_camera, data_camera_stations):
+def colocated_weather_stations(weatherStations_map):
+    """
+    Find the pairs of weather stations sharing the same location
+
+    Arguments:
+    weatherStations_map -- weather stations dataframe (see weather_stations_map)
+
+    Return:
+    id1 -- list of the ids of the first station of each pair
+    id2 -- list of the ids of the second station of each pair
+    """
+    weather_group = weatherStations_map.groupby(by=['latitude', 'longitude'])
+    id1 = []
+    id2 = []
+    for ar in weather_group.indices.values():
+        ar = ar.tolist()
+        if len(ar) == 2:
+            id1.append(weatherStations_map.iloc[ar[0]]['weatherStationId'])
+            id2.append(weatherStations_map.iloc[ar[1]]['weatherStationId'])
+    return id1, id2
+
+def camera_stations_coordinates(data_camera_stations):
+    """
+    Get the locations of the camera stations
+
+    Arguments:
+    data_camera_stations -- loaded data from 'camera-stations.json'
+
+    Return:
+    coord_camera_stationdf -- dataframe of the camera stations ids and coordinates
+    """
+    coordinates_camera_station = list(zip(*[sub_dict['geometry']['coordinates'] for sub_dict in data_camera_stations['features']]))
+    ids_camera_station = [sub_dict['properties']['id'] for sub_dict in data_camera_stations['features']]
+    coord_camera_station_dict = {"id_cameraStation": ids_camera_station,
+                                 'longitude': list(coordinates_camera_station[0]),
+                                 'latitude': list(coordinates_camera_station[1])}
+    coord_camera_stationdf = pd.DataFrame(coord_camera_station_dict)
+    return coord_camera_stationdf
+
+def stations_metadata(data_weather_stations=None, data_camera_stations=None):
+    """
+    Parse the slowly changing station feeds
+
+    Arguments:
+    data_weather_stations -- loaded data from 'weather-stations.json' (skipped if None)
+    data_camera_stations -- loaded data from 'camera-stations.json' (skipped if None)
+
+    Return:
+    metadata -- dictionary: weatherStations_map and colocated (id1, id2) pairs from the
+    weather stations, cameraStations_coordinates from the camera stations
+    """
+    metadata = {}
+    if data_weather_stations is not None:
+        metadata['weatherStations_map'] = weather_stations_map(data_weather_stations)
+        metadata['colocated'] = colocated_weather_stations(metadata['weatherStations_map'])
+    if data_camera_stations is not None:
+        metadata['cameraStations_coordinates'] = camera_stations_coordinates(data_camera_stations)
+    return metadata
+
+def camera_stations(data_camera, coord_camera_stationdf):
     """
     Get the informations that are related to the camera stations
 
     Arguments:
     data_camera -- loaded data from 'data-camera.json'
-    data_camera_stations -- loaded data from 'camera-stations.json'
+    coord_camera_stationdf -- dataframe of the camera stations coordinates
+    (see camera_stations_coordinates)
 
     Return:
     cameraStations_map -- camera stations dataframe :camera_id, location
@@ -161,13 +540,6 @@ def camera_stations(data_camera, data_camera_stations):
     cameraStations = pd.DataFrame(data_camera['cameraStations'])
     cameraStations['cameraPresets'] = cameraStations['cameraPresets'].apply(lambda x: [dico['id'] for dico in x])
     cameraStations.rename(columns={'id':'id_cameraStation'}, inplace=True)
-
-    coordinates_camera_station = list(zip(*[sub_dict['geometry']['coordinates'] for sub_dict in data_camera_stations['features']]))
-    ids_camera_station = [sub_dict['properties']['id'] for sub_dict in data_camera_stations['features']]
-    coord_camera_station_dict = {"id_cameraStation": ids_camera_station,
-                                 'longitude': list(coordinates_camera_station[0]),
-                                 'latitude': list(coordinates_camera_station[1])}
-    coord_camera_stationdf = pd.DataFrame(coord_camera_station_dict)
     cameraStations_map = cameraStations.merge(coord_camera_stationdf,
                                               on='id_cameraStation', how='inner')
     return cameraStations, cameraStations_map
@@ -186,68 +558,44 @@ def weather_road_conditions(data_weather, weatherdf):
     to every weather station
     """
 
-    def find_condi(df, sensor1, sensor2):
+    def find_condi(condi1, condi2):
         """
         Combine the results of two similar type of sensors related to
-        the road and weather conditions
+        the road and weather conditions (for all the weather stations at once)
 
         Arguments:
-        df -- dataframe (conditiondf) contains values of the two road condition sensors
-        for each weather station
-        sensor1 -- first sensor
-        sensor2 -- second sensor
+        condi1 -- series of the values of the first sensor for each weather station
+        (NaN if the sensor is missing, faulty or without value)
+        condi2 -- series of the values of the second sensor for each weather station
 
         Return:
-        road_cond -- str of combined sensors values
+        road_cond -- series of combined sensors values
         """
-        if sensor1 in sensors and sensor2 in sensors:
-            condi1 = (df[df['oldName'] == sensor1]['sensorValueDescriptionEn']).tolist()[0]
-            condi2 = (df[df['oldName'] == sensor2]['sensorValueDescriptionEn']).tolist()[0]
-            if condi1 not in ['The sensor has a fault', None] and condi2 not in ['The sensor has a fault', None]:
-                if condi1 == condi2:
-                    road_cond = condi1
-                else:
-                    road_cond = condi1+' / '+condi2
-
-            elif condi1 not in ['The sensor has a fault', None]:
-                road_cond = condi1
-            elif condi2 not in ['The sensor has a fault', None]:
-                road_cond = condi2
-            else:
-                road_cond = np.nan
-        elif sensor1 in sensors:
-            condi1 = (df[df['oldName'] == sensor1]['sensorValueDescriptionEn']).tolist()[0]
-            if condi1 not in ['The sensor has a fault', None]:
-                road_cond = condi1
-            else:
-                road_cond = np.nan
-        elif sensor2 in sensors:
-            condi2 = (df[df['oldName'] == sensor2]['sensorValueDescriptionEn']).tolist()[0]
-            if condi2 not in ['The sensor has a fault', None]:
-                road_cond = condi2
-            else:
-                road_cond = np.nan
-        else:
-            road_cond = np.nan
-
+        road_cond = condi1.where(condi1.notna(), condi2)
+        differ = condi1.notna() & condi2.notna() & (condi1 != condi2)
+        road_cond[differ] = condi1[differ]+' / '+condi2[differ]
         return road_cond
 
-    weatherdf_mod = weatherdf.copy()
-    weatherdf_mod['sensorValueDescriptionEn'] = weatherdf_mod['sensorValueDescriptionEn'].replace('Dry weather', 'Dry')
-    used_sensors = list(set(weatherdf_mod[pd.notnull(weatherdf_mod['sensorValueDescriptionEn'])]['oldName'].unique().tolist())-set(['warning1', 'warning2', 'warning3']))
-    roadStationIdlist = weatherdf_mod['roadStationId'].unique().tolist()
-    idgrp = weatherdf_mod.groupby('roadStationId')
-    road_condition = []
-    weather_condition = []
-    for st in roadStationIdlist:
-        stgrp = idgrp.get_group(st)
-        stgrpnew = stgrp[stgrp['oldName'].isin(used_sensors)]
-        sensors = stgrpnew['oldName'].tolist()
-        road_condition.append(find_condi(stgrpnew, 'roadsurfaceconditions1',
-                                         'roadsurfaceconditions2'))
-        weather_condition.append(find_condi(stgrpnew, 'precipitationtype', 'precipitation'))
+    condition_sensors = ['roadsurfaceconditions1', 'roadsurfaceconditions2',
+                         'precipitationtype', 'precipitation']
+    description = weatherdf['sensorValueDescriptionEn'].astype(object).replace('Dry weather', 'Dry')
+    used_sensors = set(weatherdf['oldName'][description.notna()].unique().tolist())-set(['warning1', 'warning2', 'warning3'])
+    roadStationIdlist = weatherdf['roadStationId'].unique().tolist()
+    sensorsdf = pd.DataFrame({'roadStationId': weatherdf['roadStationId'],
+                              'oldName': weatherdf['oldName'],
+                              'sensorValueDescriptionEn': description})
+    sensorsdf = sensorsdf[sensorsdf['oldName'].isin(used_sensors & set(condition_sensors))]
+    sensorsdf = sensorsdf.assign(oldName=sensorsdf['oldName'].astype(object))
+    # the first value of each sensor of a station is used, faulty values count as missing
+    sensorsdf = sensorsdf.drop_duplicates(subset=['roadStationId', 'oldName'], keep='first')
+    sensorsdf = sensorsdf[sensorsdf['sensorValueDescriptionEn'].notna() &
+                          (sensorsdf['sensorValueDescriptionEn'] != 'The sensor has a fault')]
+    values = sensorsdf.pivot(index='roadStationId', columns='oldName', values='sensorValueDescriptionEn')
+    values = values.reindex(index=roadStationIdlist, columns=condition_sensors).astype(object)
+    road_condition = find_condi(values['roadsurfaceconditions1'], values['roadsurfaceconditions2'])
+    weather_condition = find_condi(values['precipitationtype'], values['precipitation'])
     conditiondf = pd.DataFrame(list(zip(roadStationIdlist,
-                                        road_condition, weather_condition)),
+                                        road_condition.tolist(), weather_condition.tolist())),
                                columns=['roadStationId', 'road_condition', 'weather_condition'])
     conditiondf.rename(columns={'roadStationId':'nearestWeatherStationId'}, inplace=True)
     conditiondf['nearestWeatherStationId'] = conditiondf['nearestWeatherStationId'].astype('float64')